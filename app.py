@@ -1,33 +1,855 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, g,
+                   current_app, make_response, has_app_context, has_request_context, stream_with_context)
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from functools import wraps, lru_cache
+from contextlib import contextmanager
+from collections import namedtuple, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import sqlite3
 import os
+import io
+import csv
+import itertools
+import heapq
+import hashlib
+import queue
+import threading
+import time
+import atexit
+import re
+import base64
+import math
 from datetime import datetime, timedelta
 import json
+import pathlib
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
+bp = Blueprint('main', __name__, cli_group=None)
 
 # Database setup
-DATABASE = 'greenspark.db'
+DATABASE = os.environ.get('DATABASE', 'greenspark.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16 * 1024))
 
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
+# Requests read through read-only connections; every write in a worker goes
+# through its one writer connection. Write transactions queue for it and the
+# writer commits up to DB_WRITER_BATCH_SIZE of them at once, failing any that
+# wait longer than DB_WRITER_TIMEOUT seconds for their turn
+DB_WRITER_BATCH_SIZE = int(os.environ.get('DB_WRITER_BATCH_SIZE', 64))
+DB_WRITER_TIMEOUT = float(os.environ.get('DB_WRITER_TIMEOUT', 10))
+
+# Activity logging: 'sync' writes in the request's transaction, 'write-behind'
+# queues events for ActivityWriter to flush in batches
+ACTIVITY_LOG_MODE = os.environ.get('ACTIVITY_LOG_MODE', 'sync')
+ACTIVITY_QUEUE_SIZE = int(os.environ.get('ACTIVITY_QUEUE_SIZE', 10000))
+ACTIVITY_BATCH_SIZE = int(os.environ.get('ACTIVITY_BATCH_SIZE', 500))
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 1.0))
+ACTIVITY_JOURNAL = os.environ.get('ACTIVITY_JOURNAL', 'activity-journal.jsonl')
+
+# Per-user dashboard summaries kept in memory by each worker; hits are
+# checked against cache_versions, so a write in any worker invalidates them
+DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', 10000))
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', 300))
+
+# Dashboard recent activity: each worker keeps ring buffers of the newest
+# RECENT_ACTIVITY_SIZE activities and badges for RECENT_ACTIVITY_CACHE_SIZE users,
+# checked against the user's feed version in cache_versions on every read
+RECENT_ACTIVITY_SIZE = int(os.environ.get('RECENT_ACTIVITY_SIZE', 5))
+RECENT_ACTIVITY_CACHE_SIZE = int(os.environ.get('RECENT_ACTIVITY_CACHE_SIZE', 10000))
+RECENT_ACTIVITY_CACHE_TTL = float(os.environ.get('RECENT_ACTIVITY_CACHE_TTL', 3600))
+
+# Rendered pages served to anonymous visitors, bounded by count and bytes
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 2000))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 60))
+
+# Rendered campaign cards, keyed by campaign id and version and shared by
+# every page that lists them. Compiled templates are kept in
+# JINJA_CACHE_DIR (the system temp directory when unset) across restarts
+CARD_CACHE_SIZE = int(os.environ.get('CARD_CACHE_SIZE', 20000))
+CARD_CACHE_MAX_BYTES = int(os.environ.get('CARD_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+CARD_CACHE_TTL = float(os.environ.get('CARD_CACHE_TTL', 3600))
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR', '')
+
+# Bulk imports commit every IMPORT_CHUNK_SIZE rows and report at most
+# IMPORT_MAX_ERRORS bad rows in detail
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 1000))
+
+# "Near me" search: default and largest radius in kilometres
+NEAR_RADIUS_KM = float(os.environ.get('NEAR_RADIUS_KM', 10))
+NEAR_MAX_RADIUS_KM = float(os.environ.get('NEAR_MAX_RADIUS_KM', 500))
+
+# Exports read this many rows per fetchmany() while streaming
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', 1000))
+
+# Recommendations: each volunteer keeps their best RECOMMENDATIONS_PER_USER
+# campaigns, scored from the RECOMMENDATION_POOL_SIZE most popular upcoming
+# campaigns per category and per place, RECOMMENDATION_BATCH_SIZE users at a time
+RECOMMENDATIONS_PER_USER = int(os.environ.get('RECOMMENDATIONS_PER_USER', 10))
+RECOMMENDATION_POOL_SIZE = int(os.environ.get('RECOMMENDATION_POOL_SIZE', 20))
+RECOMMENDATION_BATCH_SIZE = int(os.environ.get('RECOMMENDATION_BATCH_SIZE', 200))
+
+# Campaign lifecycle: campaigns turn 'ongoing' on their date and 'completed'
+# the day after. Each worker re-checks every CAMPAIGN_LIFECYCLE_INTERVAL
+# seconds; 0 turns the thread off (run `flask advance-campaigns` from cron)
+CAMPAIGN_LIFECYCLE_INTERVAL = float(os.environ.get('CAMPAIGN_LIFECYCLE_INTERVAL', 300))
+CAMPAIGN_LIFECYCLE_CHUNK_SIZE = int(os.environ.get('CAMPAIGN_LIFECYCLE_CHUNK_SIZE', 500))
+
+# Live campaign events over Server-Sent Events: one publisher thread per
+# worker tails the event log every SSE_POLL_INTERVAL seconds and fans out to
+# every open stream. Idle streams get a heartbeat every SSE_HEARTBEAT seconds;
+# a stream that falls SSE_QUEUE_SIZE events behind is closed so its client
+# resumes from Last-Event-ID. The log keeps CAMPAIGN_EVENT_RETENTION_HOURS.
+# Every open stream holds a connection for as long as the page is open, so
+# serve with a worker class that can keep many idle ones (gevent, or gthread
+# with threads to spare); only signed-in volunteers open them
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 1.0))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', 100))
+SSE_MAX_SUBSCRIBERS = int(os.environ.get('SSE_MAX_SUBSCRIBERS', 1000))
+SSE_REPLAY_LIMIT = int(os.environ.get('SSE_REPLAY_LIMIT', 500))
+CAMPAIGN_EVENT_RETENTION_HOURS = float(os.environ.get('CAMPAIGN_EVENT_RETENTION_HOURS', 24))
+
+# Activity feed and retention: the feed pages ACTIVITY_PAGE_SIZE rows at a
+# time. `flask archive-activities` moves rows older than ACTIVITY_RETENTION_DAYS
+# into activities_archive, ACTIVITY_ARCHIVE_CHUNK_SIZE rows per transaction.
+# Set ACTIVITY_ARCHIVE_DATABASE to keep the archive in its own file instead
+ACTIVITY_PAGE_SIZE = int(os.environ.get('ACTIVITY_PAGE_SIZE', 50))
+ACTIVITY_RETENTION_DAYS = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 365))
+ACTIVITY_ARCHIVE_CHUNK_SIZE = int(os.environ.get('ACTIVITY_ARCHIVE_CHUNK_SIZE', 5000))
+ACTIVITY_ARCHIVE_DATABASE = os.environ.get('ACTIVITY_ARCHIVE_DATABASE', '')
+
+# Statements slower than this are logged; SQL_DEBUG_HEADERS adds X-DB-Queries
+# and X-DB-Time to every response (always on in debug mode)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SQL_DEBUG_HEADERS = os.environ.get('SQL_DEBUG_HEADERS', '').lower() in ('1', 'true', 'yes')
+
+# Password hashing: any Werkzeug method string, e.g. 'scrypt:32768:8:1' or
+# 'pbkdf2:sha256:600000'. At most PASSWORD_HASH_WORKERS hashes run at once
+# and PASSWORD_HASH_BACKLOG more may wait up to PASSWORD_HASH_WAIT seconds;
+# stored hashes made with another method are upgraded on the next login
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_BACKLOG = int(os.environ.get('PASSWORD_HASH_BACKLOG', 32))
+PASSWORD_HASH_WAIT = float(os.environ.get('PASSWORD_HASH_WAIT', 5))
+
+def sqlite_has_fts5():
+    """Check whether this SQLite build can create FTS5 tables"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+# Search uses the campaigns_fts index when FTS5 is available, LIKE otherwise
+FTS_ENABLED = sqlite_has_fts5()
+
+def sqlite_has_rtree():
+    """Check whether this SQLite build can create R*Tree tables with auxiliary columns"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE probe USING rtree(id, min_x, max_x, +payload)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+# Nearby search uses the campaigns_geo R*Tree when available, a latitude index otherwise
+RTREE_ENABLED = sqlite_has_rtree()
+
+def sqlite_has_math():
+    """Check whether this SQLite build has the built-in math functions"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('SELECT asin(sqrt(pow(sin(radians(1)), 2) + cos(1)))')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+# Distances are computed in SQL when the math functions are compiled in, by
+# the (slower) Python distance_km() otherwise
+MATH_ENABLED = sqlite_has_math()
+
+EARTH_RADIUS_KM = 6371.0088
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points, in kilometres"""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def read_only_uri(path):
+    """URI that opens path with a read-only connection"""
+    return pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+
+def connect_db(readonly=False):
+    """Open a new database connection with tuned pragmas"""
+    database = current_app.config['DATABASE']
+    conn = sqlite3.connect(read_only_uri(database) if readonly else database, uri=readonly,
+                           timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           factory=InstrumentedConnection)
     conn.row_factory = sqlite3.Row
+    if not readonly:
+        # New databases hand freed pages back through PRAGMA incremental_vacuum;
+        # older ones switch over on their next full VACUUM
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL lets readers proceed while a writer holds the lock
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
     # Enable foreign key constraints
     conn.execute('PRAGMA foreign_keys = ON')
+    conn.create_function('distance_km', 4, distance_km, deterministic=True)
+    if ACTIVITY_ARCHIVE_DATABASE:
+        attach_activity_archive(conn, readonly)
     return conn
 
-def init_db():
-    """Initialize database with tables"""
+def attach_activity_archive(conn, readonly=False):
+    """Attach ACTIVITY_ARCHIVE_DATABASE as "archive", creating its table on first use"""
+    if readonly:
+        if not os.path.exists(ACTIVITY_ARCHIVE_DATABASE):
+            # A read-write connection creates the archive file and table
+            connect_db().close()
+        conn.execute('ATTACH DATABASE ? AS archive', (read_only_uri(ACTIVITY_ARCHIVE_DATABASE),))
+        return
+    conn.execute('ATTACH DATABASE ? AS archive', (ACTIVITY_ARCHIVE_DATABASE,))
+    conn.execute('PRAGMA archive.auto_vacuum = INCREMENTAL')
+    conn.execute('PRAGMA archive.journal_mode = WAL')
+    create_activity_archive_table(conn.cursor(), 'archive')
+    conn.commit()
+
+def activity_archive_table():
+    """Qualified name of the table archived activities live in"""
+    return 'archive.activities_archive' if ACTIVITY_ARCHIVE_DATABASE else 'main.activities_archive'
+
+def get_db():
+    """Get the database connection for the current context
+
+    Inside write_transaction() that is the writer's connection. Otherwise
+    requests share a pooled read-only connection, and CLI commands and
+    background threads a pooled read-write one.
+    """
+    if 'write_db' in g:
+        return g.write_db
+    if 'db' not in g:
+        g.db_pool = 'db_read_pool' if has_request_context() else 'db_pool'
+        try:
+            g.db = current_app.extensions[g.db_pool].get_nowait()
+        except queue.Empty:
+            g.db = connect_db(readonly=g.db_pool == 'db_read_pool')
+    return g.db
+
+def release_db(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    # Never hand a half-finished transaction to the next request
+    if conn.in_transaction:
+        conn.rollback()
+        g.pop('after_commit', None)
+    else:
+        run_after_commit()
+    try:
+        current_app.extensions[g.pop('db_pool')].put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def write_transaction():
+    """Run a block as one write transaction on the worker's writer connection
+
+    The block waits for its turn, then runs inside the writer's IMMEDIATE
+    transaction, so reads inside it can't be invalidated by another writer.
+    It returns once the batch it joined has committed. An exception rolls
+    back just this block.
+    """
+    if 'write_db' in g:
+        # Already writing: nest as a savepoint of the same transaction
+        with savepoint(g.write_db) as cursor:
+            yield cursor
+        return
+    
+    writer = current_app.extensions['db_writer']
+    ticket = writer.acquire()
+    g.write_db = writer.conn
+    try:
+        with savepoint(g.write_db) as cursor:
+            yield cursor
+            bump_cache_versions(cursor)
+    except BaseException:
+        g.pop('after_commit', None)
+        g.pop('cache_tags', None)
+        g.pop('cache_versions_written', None)
+        raise
+    finally:
+        del g.write_db
+        writer.release(ticket)
+    if ticket.error is not None:
+        g.pop('after_commit', None)
+        raise ticket.error
+    run_after_commit()
+
+@contextmanager
+def savepoint(conn):
+    """Run a block in a savepoint of conn's open transaction, rolling back only the block on error"""
+    name = f'write_{g.get("savepoints", 0)}'
+    g.savepoints = g.get('savepoints', 0) + 1
+    queued = len(g.get('after_commit', ()))
+    conn.execute(f'SAVEPOINT {name}')
+    try:
+        yield conn.cursor()
+    except BaseException:
+        # The block's after_commit callbacks go with its writes
+        if 'after_commit' in g:
+            del g.after_commit[queued:]
+        # An error that already ended the transaction leaves nothing to undo
+        if conn.in_transaction:
+            conn.execute(f'ROLLBACK TO {name}')
+            conn.execute(f'RELEASE {name}')
+        raise
+    else:
+        conn.execute(f'RELEASE {name}')
+    finally:
+        g.savepoints -= 1
+
+@contextmanager
+def read_snapshot():
+    """Run a block's reads against one snapshot of the database, so they agree with each other
+
+    Inside a write transaction the block simply shares it.
+    """
     conn = get_db()
-    cursor = conn.cursor()
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+class WriteTicket:
+    """One write transaction's place in the writer's queue"""
+    
+    def __init__(self):
+        self.queued = time.perf_counter()
+        self.granted = threading.Event()
+        self.finished = threading.Event()
+        self.committed = threading.Event()
+        self.cancelled = False
+        self.error = None
+        self.lock = threading.Lock()
+
+class BackgroundService:
+    """A per-app helper that runs threads of its own, started lazily in each process
+
+    Each app keeps its instances in app.extensions. Subclasses set up
+    their threads in _start(), which runs at most once per process.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._pid = None
+    
+    def ensure_started(self):
+        """Start the service in this process if it isn't running yet"""
+        # Threads don't survive fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._start()
+            self._pid = os.getpid()
+    
+    def running(self):
+        """Whether the service was started in this process"""
+        return self._pid == os.getpid()
+    
+    def _start(self):
+        raise NotImplementedError
+
+class DatabaseWriter(BackgroundService):
+    """The worker's single writer: serializes write transactions and group-commits them
+
+    Threads that want to write queue a ticket. The writer thread opens one
+    IMMEDIATE transaction and lends its connection to each queued ticket in
+    turn, up to batch_size, while the lender runs its block in its own
+    thread. It then commits the whole batch once and releases every ticket.
+    Queueing here, rather than in SQLite's busy handler, keeps writes in
+    arrival order.
+    """
+    
+    def __init__(self, app, batch_size, timeout):
+        super().__init__(app)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.conn = None
+        self.commits = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.batch_sizes = Histogram('greenspark_db_write_batch_size', 'Write transactions per commit.',
+                                     (), (1, 2, 4, 8, 16, 32, 64, 128))
+        self.wait_time = Histogram('greenspark_db_write_wait_seconds', 'Time write transactions queue for the writer.',
+                                   (), (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+        self._queue = None
+        self._thread = None
+        self._stop = None
+    
+    def _start(self):
+        with self.app.app_context():
+            self.conn = connect_db()
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def acquire(self):
+        """Queue for the writer connection and wait until it is this thread's turn"""
+        self.ensure_started()
+        ticket = WriteTicket()
+        self._queue.put(ticket)
+        if not ticket.granted.wait(self.timeout):
+            with ticket.lock:
+                ticket.cancelled = not ticket.granted.is_set()
+            if ticket.cancelled:
+                self.timeouts += 1
+                raise sqlite3.OperationalError(f'waited more than {self.timeout:g}s for the database writer')
+        if ticket.error is not None:
+            raise ticket.error
+        with self._lock:
+            self.wait_time.observe((), time.perf_counter() - ticket.queued)
+        return ticket
+    
+    def release(self, ticket):
+        """Hand the connection back and wait for the batch to commit"""
+        ticket.finished.set()
+        ticket.committed.wait()
+    
+    def depth(self):
+        """Number of write transactions waiting for their turn"""
+        return self._queue.qsize() if self._queue else 0
+    
+    def stats(self):
+        return {'queue_depth': self.depth(), 'commits': self.commits, 'failures': self.failures,
+                'timeouts': self.timeouts}
+    
+    def render(self):
+        """Prometheus lines for the queue, commits and batch sizes"""
+        stats = self.stats()
+        lines = ['# TYPE greenspark_db_write_queue_depth gauge',
+                 f'greenspark_db_write_queue_depth {stats["queue_depth"]}',
+                 '# TYPE greenspark_db_write_commits_total counter',
+                 f'greenspark_db_write_commits_total {stats["commits"]}',
+                 '# TYPE greenspark_db_write_failures_total counter',
+                 f'greenspark_db_write_failures_total {stats["failures"]}',
+                 '# TYPE greenspark_db_write_timeouts_total counter',
+                 f'greenspark_db_write_timeouts_total {stats["timeouts"]}']
+        with self._lock:
+            return lines + self.batch_sizes.render() + self.wait_time.render()
+    
+    def stop(self):
+        """Finish the queued writes, stop the thread and close the connection"""
+        if not self.running():
+            return
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join()
+        self.conn.close()
+        self._pid = None
+    
+    def _take(self):
+        # The next ticket still waiting, or None once the queue is empty
+        while True:
+            try:
+                ticket = self._queue.get_nowait()
+            except queue.Empty:
+                return None
+            if ticket is not None and self._grant(ticket):
+                return ticket
+    
+    def _grant(self, ticket):
+        with ticket.lock:
+            if ticket.cancelled:
+                return False
+            ticket.granted.set()
+            return True
+    
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                ticket = self._queue.get()
+                if ticket is None:
+                    if self._stop.is_set() and self._queue.empty():
+                        return
+                    continue
+                if ticket.cancelled:
+                    continue
+                try:
+                    self.conn.execute('BEGIN IMMEDIATE')
+                except sqlite3.Error as e:
+                    ticket.error = e
+                    self.failures += 1
+                    self._grant(ticket)
+                    ticket.committed.set()
+                    continue
+                if not self._grant(ticket):
+                    ticket = self._take()
+                batch = []
+                while ticket is not None:
+                    batch.append(ticket)
+                    ticket.finished.wait()
+                    ticket = self._take() if len(batch) < self.batch_size else None
+                self._commit(batch)
+    
+    def _commit(self, batch):
+        error = None
+        try:
+            if not self.conn.in_transaction:
+                raise sqlite3.OperationalError('the write transaction was rolled back')
+            self.conn.commit()
+        except sqlite3.Error as e:
+            error = e
+            self.failures += 1
+            if self.conn.in_transaction:
+                self.conn.rollback()
+        else:
+            if batch:
+                with self._lock:
+                    self.commits += 1
+                    self.batch_sizes.observe((), len(batch))
+        for ticket in batch:
+            ticket.error = error
+            ticket.committed.set()
+
+def after_commit(callback):
+    """Run callback once the current transaction commits; it is dropped on rollback"""
+    g.setdefault('after_commit', []).append(callback)
+
+def run_after_commit():
+    for callback in g.pop('after_commit', []):
+        callback()
+
+def cache_tag_name(tag):
+    """'campaign:5' for a ('campaign', 5) tag; plain string tags are their own name"""
+    return tag if isinstance(tag, str) else ':'.join(map(str, tag))
+
+def invalidate_cache_tags(tags):
+    """Bump the tags' versions when the current write transaction commits, for every worker
+
+    Returns a dict that maps each tag's name to its new version once the
+    bump is written, for after_commit callbacks that update entries in place.
+    """
+    g.setdefault('cache_tags', set()).update(cache_tag_name(tag) for tag in tags)
+    return g.setdefault('cache_versions_written', {})
+
+def bump_cache_versions(cursor):
+    # Written at the end of the transaction, once, for every tag it invalidated
+    names = g.pop('cache_tags', None)
+    written = g.pop('cache_versions_written', {})
+    if names:
+        written.update(cursor.execute('''
+            INSERT INTO cache_versions (tag, version)
+            SELECT value, 1 FROM json_each(?) WHERE true
+            ON CONFLICT (tag) DO UPDATE SET version = version + 1
+            RETURNING tag, version
+        ''', (json.dumps(sorted(names)),)).fetchall())
+
+def cache_versions(tags):
+    """Current versions of the tags, in order; 0 for ones never bumped"""
+    names = [cache_tag_name(tag) for tag in tags]
+    if not names:
+        return ()
+    versions = dict(get_db().execute('''
+        SELECT tag, version FROM cache_versions WHERE tag IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(names),)).fetchall())
+    return tuple(versions.get(name, 0) for name in names)
+
+# A cached value with the tags it depends on and their versions when it was read
+Versioned = namedtuple('Versioned', 'value tags versions')
+
+def versions_current(entry):
+    """Whether no worker has invalidated a Versioned entry's tags since it was read"""
+    return cache_versions(entry.tags) == entry.versions
+
+def close_db_pool(app=None):
+    """Close every idle pooled connection and stop the writer"""
+    app = app or current_app
+    for name in ('db_pool', 'db_read_pool'):
+        while True:
+            try:
+                app.extensions[name].get_nowait().close()
+            except queue.Empty:
+                break
+    app.extensions['db_writer'].stop()
+
+def normalize_sql(sql):
+    """Collapse literals, IN lists and whitespace so repeated statements log alike"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    # Chunked lookups bind however many ids the chunk has
+    sql = re.sub(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', 'IN (...)', sql, flags=re.IGNORECASE)
+    return ' '.join(sql.split())
+
+def record_statement(sql, binds, elapsed):
+    """Count a statement against the current request and log it if slow"""
+    if has_app_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        # Migrations and scripts also run statements outside any app
+        if has_app_context():
+            current_app.extensions['metrics'].count_slow_query()
+        route = request.url_rule.rule if has_request_context() and request.url_rule else '-'
+        print(f"Slow query ({elapsed * 1000:.1f} ms, {binds} binds, {route}): {normalize_sql(sql)}")
+
+def record_fetch(rows, elapsed):
+    if has_app_context():
+        g.db_rows = g.get('db_rows', 0) + rows
+        g.db_time = g.get('db_time', 0.0) + elapsed
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement and counts the rows it returns"""
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_statement(sql, len(parameters), time.perf_counter() - started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_statement(sql, sum(len(parameters) for parameters in seq_of_parameters),
+                             time.perf_counter() - started)
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        record_fetch(row is not None, time.perf_counter() - started)
+        return row
+    
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+    
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        record_fetch(1, time.perf_counter() - started)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements all run through InstrumentedCursor"""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    # Connection.execute() would otherwise use a plain cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple"""
+    
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
     
-    # Enable foreign keys
-    cursor.execute('PRAGMA foreign_keys = ON')
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
     
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            label_text = ''.join(f'{name}="{value}",' for name, value in zip(self.labels, labels))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text}le="+Inf"}} {count}')
+            # Unlabelled series print bare names rather than empty braces
+            series = f'{{{label_text[:-1]}}}' if label_text else ''
+            lines.append(f'{self.name}_sum{series} {total:.6f}')
+            lines.append(f'{self.name}_count{series} {count}')
+        return lines
+
+class Metrics:
+    """An app's request and database metrics in this process, rendered for /metrics"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.slow_queries = 0
+        self.requests = {}
+        self.rows = {}
+        self.latency = Histogram('greenspark_request_duration_seconds', 'Request latency by route.',
+                                 ('route', 'method'),
+                                 (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+        self.db_time = Histogram('greenspark_request_db_seconds', 'Time spent in SQLite per request.',
+                                 ('route', 'method'),
+                                 (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+        self.queries = Histogram('greenspark_request_queries', 'SQL statements per request.',
+                                 ('route', 'method'), (0, 1, 2, 5, 10, 20, 50, 100, 500))
+    
+    def observe_request(self, route, method, status, duration, queries, db_time, rows):
+        labels = (route, method)
+        with self._lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.rows[labels] = self.rows.get(labels, 0) + rows
+            self.latency.observe(labels, duration)
+            self.db_time.observe(labels, db_time)
+            self.queries.observe(labels, queries)
+    
+    def count_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+    
+    def render(self):
+        with self._lock:
+            lines = ['# HELP greenspark_requests_total Requests served by route and status.',
+                     '# TYPE greenspark_requests_total counter']
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'greenspark_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+            lines += ['# HELP greenspark_db_rows_fetched_total Rows read from SQLite by route.',
+                      '# TYPE greenspark_db_rows_fetched_total counter']
+            for (route, method), count in sorted(self.rows.items()):
+                lines.append(f'greenspark_db_rows_fetched_total{{route="{route}",method="{method}"}} {count}')
+            lines += self.latency.render() + self.db_time.render() + self.queries.render()
+            lines += ['# HELP greenspark_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                      '# TYPE greenspark_slow_queries_total counter',
+                      f'greenspark_slow_queries_total {self.slow_queries}']
+        
+        lines += current_app.extensions['db_writer'].render()
+        writer = current_app.extensions['activity_writer'].stats()
+        lines += ['# TYPE greenspark_activity_queue_depth gauge',
+                  f'greenspark_activity_queue_depth {writer["queue_depth"]}',
+                  '# TYPE greenspark_activity_events_flushed_total counter',
+                  f'greenspark_activity_events_flushed_total {writer["flushed"]}',
+                  '# TYPE greenspark_activity_events_spilled_total counter',
+                  f'greenspark_activity_events_spilled_total {writer["spilled"]}']
+        hasher = current_app.extensions['password_hasher'].stats()
+        lines += ['# TYPE greenspark_password_hash_pending gauge',
+                  f'greenspark_password_hash_pending {hasher["pending"]}',
+                  '# TYPE greenspark_password_hash_total counter']
+        lines += [f'greenspark_password_hash_total{{operation="{name}"}} {hasher[name]}'
+                  for name in ('hashed', 'verified', 'rehashed', 'rejected')]
+        lifecycle = current_app.extensions['campaign_scheduler'].stats()
+        lines += ['# TYPE greenspark_campaign_lifecycle_runs_total counter',
+                  f'greenspark_campaign_lifecycle_runs_total {lifecycle["runs"]}',
+                  '# TYPE greenspark_campaign_lifecycle_failures_total counter',
+                  f'greenspark_campaign_lifecycle_failures_total {lifecycle["failures"]}',
+                  '# TYPE greenspark_campaign_transitions_total counter',
+                  f'greenspark_campaign_transitions_total{{status="ongoing"}} {lifecycle["started"]}',
+                  f'greenspark_campaign_transitions_total{{status="completed"}} {lifecycle["completed"]}',
+                  '# TYPE greenspark_completions_finalized_total counter',
+                  f'greenspark_completions_finalized_total {lifecycle["finalized"]}']
+        broker = current_app.extensions['event_broker'].stats()
+        lines += ['# TYPE greenspark_sse_subscribers gauge',
+                  f'greenspark_sse_subscribers {broker["subscribers"]}',
+                  '# TYPE greenspark_sse_events_published_total counter',
+                  f'greenspark_sse_events_published_total {broker["published"]}',
+                  '# TYPE greenspark_sse_subscribers_dropped_total counter',
+                  f'greenspark_sse_subscribers_dropped_total {broker["dropped"]}']
+        caches = {'dashboard': current_app.extensions['dashboard_cache'].stats(),
+                  'page': current_app.extensions['page_cache'].stats(),
+                  'recent_activity': current_app.extensions['recent_activity_cache'].stats(),
+                  'card': current_app.extensions['card_cache'].stats()}
+        for family, kind, key in (('cache_entries', 'gauge', 'size'), ('cache_bytes', 'gauge', 'bytes'),
+                                  ('cache_hits_total', 'counter', 'hits'),
+                                  ('cache_misses_total', 'counter', 'misses')):
+            lines.append(f'# TYPE greenspark_{family} {kind}')
+            lines += [f'greenspark_{family}{{cache="{name}"}} {stats[key]}' for name, stats in caches.items()]
+        return '\n'.join(lines) + '\n'
+
+# Schema migrations, applied in order; PRAGMA user_version records how many
+# have run. Append new steps at the end and never edit one that has shipped.
+MIGRATIONS = []
+
+def migration(f):
+    """Register f as the next schema migration"""
+    MIGRATIONS.append(f)
+    return f
+
+def schema_version(conn):
+    """Number of migrations already applied to conn's database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def init_db():
+    """Bring the database schema up to date, returning the migrations applied"""
+    conn = get_db()
+    if schema_version(conn) >= len(MIGRATIONS):
+        return []
+    applied = []
+    with write_transaction() as cursor:
+        # Re-read under the write lock in case another process got here first
+        version = schema_version(cursor.connection)
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            print(f"Applying migration {number}: {step.__name__}")
+            step(cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            applied.append(step.__name__)
+    return applied
+
+def has_column(cursor, table, column):
+    """Check whether table already has column"""
+    return any(row[1] == column for row in cursor.execute(f'PRAGMA table_info({table})'))
+
+def add_missing_columns(cursor, table, columns):
+    """Add each (name, definition) column that table doesn't have yet"""
+    for name, definition in columns:
+        if not has_column(cursor, table, name):
+            print(f"Migrating {table} table: adding {name}")
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+@migration
+def create_base_tables(cursor):
+    """Core tables, plus the columns older databases were created without"""
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -53,21 +875,13 @@ def init_db():
             contact TEXT,
             address TEXT,
             verified BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            owner_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (owner_id) REFERENCES users(id)
         )
     ''')
-    
-    # Migrate existing ngos table if needed
-    try:
-        cursor.execute('SELECT email FROM ngos LIMIT 1')
-    except sqlite3.OperationalError:
-        try:
-            cursor.execute('ALTER TABLE ngos ADD COLUMN email TEXT')
-            cursor.execute('ALTER TABLE ngos ADD COLUMN password TEXT')
-            cursor.execute('ALTER TABLE ngos ADD COLUMN address TEXT')
-        except:
-            pass
-
+    add_missing_columns(cursor, 'ngos', [('email', 'TEXT'), ('password', 'TEXT'), ('address', 'TEXT'),
+                                         ('owner_id', 'INTEGER REFERENCES users(id)')])
     
     # Campaigns table
     cursor.execute('''
@@ -105,14 +919,7 @@ def init_db():
             UNIQUE(campaign_id, user_id)
         )
     ''')
-    
-    # Check for missing columns in campaign_volunteers (for migration)
-    try:
-        cursor.execute('SELECT status FROM campaign_volunteers LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating campaign_volunteers table: adding status")
-        cursor.execute("ALTER TABLE campaign_volunteers ADD COLUMN status TEXT DEFAULT 'joined'")
-
+    add_missing_columns(cursor, 'campaign_volunteers', [('status', "TEXT DEFAULT 'joined'")])
     
     # User badges
     cursor.execute('''
@@ -128,6 +935,8 @@ def init_db():
             FOREIGN KEY (campaign_id) REFERENCES campaigns(id)
         )
     ''')
+    add_missing_columns(cursor, 'user_badges', [('badge_description', 'TEXT'),
+                                                ('campaign_id', 'INTEGER REFERENCES campaigns(id)')])
     
     # Activity log
     cursor.execute('''
@@ -159,113 +968,2077 @@ def init_db():
             UNIQUE(campaign_id, user_id)
         )
     ''')
+
+@migration
+def add_secondary_indexes(cursor):
+    """Unique badges and the indexes behind the app's lookups and sort orders"""
+    # One row per badge per user; drop duplicates left by older code first
+    cursor.execute('''
+        DELETE FROM user_badges WHERE id NOT IN (
+            SELECT MIN(id) FROM user_badges GROUP BY user_id, badge_name
+        )
+    ''')
+    for statement in [
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_user_badges_user_badge ON user_badges (user_id, badge_name)',
+        'CREATE INDEX IF NOT EXISTS idx_campaigns_listing ON campaigns (featured DESC, date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_campaigns_category_listing ON campaigns (category, featured DESC, date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_campaigns_ngo ON campaigns (ngo_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_campaign_volunteers_user ON campaign_volunteers (user_id, campaign_id)',
+        'CREATE INDEX IF NOT EXISTS idx_campaign_completions_user ON campaign_completions (user_id, completed_at)',
+        'CREATE INDEX IF NOT EXISTS idx_activities_user_created ON activities (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_ngos_owner ON ngos (owner_id)',
+    ]:
+        cursor.execute(statement)
+
+@migration
+def create_leaderboard(cursor):
+    """Materialized leaderboard, one row per (board, user)
+
+    Boards are 'all', 'week:YYYY-Www' and 'month:YYYY-MM'.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leaderboard_entries (
+            board TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            location TEXT,
+            points INTEGER NOT NULL DEFAULT 0,
+            campaigns_completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (board, user_id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_rank
+        ON leaderboard_entries (board, points DESC, campaigns_completed DESC, user_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_location_rank
+        ON leaderboard_entries (board, location, points DESC, campaigns_completed DESC, user_id)
+    ''')
+    print("Building leaderboard_entries")
+    rebuild_leaderboard(cursor)
+
+@migration
+def create_campaign_search(cursor):
+    """Full-text index over campaigns, kept in sync by triggers"""
+    if not FTS_ENABLED:
+        print("FTS5 unavailable, campaign search falls back to LIKE")
+        return
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS campaigns_fts USING fts5(
+            title, short_description, description, location,
+            content='campaigns', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_fts_ai AFTER INSERT ON campaigns BEGIN
+            INSERT INTO campaigns_fts (rowid, title, short_description, description, location)
+            VALUES (new.id, new.title, new.short_description, new.description, new.location);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_fts_ad AFTER DELETE ON campaigns BEGIN
+            INSERT INTO campaigns_fts (campaigns_fts, rowid, title, short_description, description, location)
+            VALUES ('delete', old.id, old.title, old.short_description, old.description, old.location);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_fts_au
+        AFTER UPDATE OF title, short_description, description, location ON campaigns BEGIN
+            INSERT INTO campaigns_fts (campaigns_fts, rowid, title, short_description, description, location)
+            VALUES ('delete', old.id, old.title, old.short_description, old.description, old.location);
+            INSERT INTO campaigns_fts (rowid, title, short_description, description, location)
+            VALUES (new.id, new.title, new.short_description, new.description, new.location);
+        END
+    ''')
+    print("Building campaigns_fts index")
+    cursor.execute("INSERT INTO campaigns_fts (campaigns_fts) VALUES ('rebuild')")
+
+@migration
+def insert_sample_campaigns(cursor):
+    """Sample campaigns so a fresh install has something to show"""
+    cursor.execute('SELECT COUNT(*) FROM campaigns')
+    if cursor.fetchone()[0]:
+        return
+    # Insert sample campaigns (same as before)
+    sample_campaigns = [
+        ('Coastal Cleanup Drive', 
+         'Join us for a massive beach cleanup initiative to protect marine life and keep our coastlines clean. We will be collecting plastic waste, bottles, and other debris from the beach.',
+         'Join us for a massive beach cleanup initiative to protect marine life',
+         'cleanup', 'Mumbai Beach', '2025-12-20', '09:00', 100, 45, 'upcoming', 1, None, None, '["Bring gloves", "Wear comfortable shoes", "Bring water bottle"]'),
+        ('Urban Reforestation', 
+         'Help us plant 500 trees to create a greener urban environment. This initiative aims to increase green cover in the city and improve air quality.',
+         'Help us plant 500 trees to create a greener urban environment',
+         'tree-planting', 'City Park', '2025-12-25', '08:00', 80, 30, 'upcoming', 0, None, None, '["No experience needed", "Tools provided", "Wear old clothes"]'),
+        ('Waste Segregation Workshop', 
+         'Learn and teach proper waste management practices to the community. This workshop will cover recycling, composting, and reducing waste.',
+         'Learn and teach proper waste management practices to the community',
+         'awareness', 'Community Center', '2026-01-05', '10:00', 50, 20, 'upcoming', 0, None, None, '["Bring notebook", "Open to all ages"]'),
+    ]
     
-    # Insert sample data if tables are empty
-    try:
-        cursor.execute('SELECT COUNT(*) FROM campaigns')
-        campaign_count = cursor.fetchone()[0]
-        if campaign_count == 0:
-            # Insert sample campaigns (same as before)
-            sample_campaigns = [
-                ('Coastal Cleanup Drive', 
-                 'Join us for a massive beach cleanup initiative to protect marine life and keep our coastlines clean. We will be collecting plastic waste, bottles, and other debris from the beach.',
-                 'Join us for a massive beach cleanup initiative to protect marine life',
-                 'cleanup', 'Mumbai Beach', '2025-12-20', '09:00', 100, 45, 'upcoming', 1, None, None, '["Bring gloves", "Wear comfortable shoes", "Bring water bottle"]'),
-                ('Urban Reforestation', 
-                 'Help us plant 500 trees to create a greener urban environment. This initiative aims to increase green cover in the city and improve air quality.',
-                 'Help us plant 500 trees to create a greener urban environment',
-                 'tree-planting', 'City Park', '2025-12-25', '08:00', 80, 30, 'upcoming', 0, None, None, '["No experience needed", "Tools provided", "Wear old clothes"]'),
-                ('Waste Segregation Workshop', 
-                 'Learn and teach proper waste management practices to the community. This workshop will cover recycling, composting, and reducing waste.',
-                 'Learn and teach proper waste management practices to the community',
-                 'awareness', 'Community Center', '2026-01-05', '10:00', 50, 20, 'upcoming', 0, None, None, '["Bring notebook", "Open to all ages"]'),
-            ]
-            
-            for campaign in sample_campaigns:
-                cursor.execute('''
-                    INSERT INTO campaigns (title, description, short_description, category, location, date, time, 
-                                         volunteers_needed, volunteers_joined, status, featured, image, ngo_id, requirements)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', campaign)
-    except Exception as e:
-        print(f"Error initializing sample data: {e}")
-    
-    conn.commit()
-    conn.close()
+    for campaign in sample_campaigns:
+        cursor.execute('''
+            INSERT INTO campaigns (title, description, short_description, category, location, date, time, 
+                                 volunteers_needed, volunteers_joined, status, featured, image, ngo_id, requirements)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', campaign)
+
+@migration
+def add_volunteer_roster_index(cursor):
+    """Index that reads a campaign's volunteers in join order, for rosters and exports"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_campaign_volunteers_campaign_joined
+        ON campaign_volunteers (campaign_id, joined_at)
+    ''')
+
+@migration
+def add_coordinates(cursor):
+    """Optional latitude/longitude on campaigns and users, with a spatial index for nearby search"""
+    for table in ('campaigns', 'users'):
+        add_missing_columns(cursor, table, [('latitude', 'REAL'), ('longitude', 'REAL')])
+    if not RTREE_ENABLED:
+        print("R*Tree unavailable, nearby search falls back to a latitude index")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaigns_coordinates ON campaigns (latitude, longitude)')
+        return
+    # One zero-size box per located campaign; the exact point rides along for distances
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS campaigns_geo USING rtree(
+            id, min_lat, max_lat, min_lng, max_lng, +latitude, +longitude
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_geo_ai
+        AFTER INSERT ON campaigns WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+            INSERT INTO campaigns_geo VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude,
+                                              new.latitude, new.longitude);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_geo_ad AFTER DELETE ON campaigns BEGIN
+            DELETE FROM campaigns_geo WHERE id = old.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_geo_au AFTER UPDATE OF latitude, longitude ON campaigns BEGIN
+            DELETE FROM campaigns_geo WHERE id = old.id;
+            INSERT INTO campaigns_geo
+            SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude, new.latitude, new.longitude
+            WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO campaigns_geo
+        SELECT id, latitude, latitude, longitude, longitude, latitude, longitude FROM campaigns
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+
+@migration
+def create_recommendations(cursor):
+    """Candidate pool and per-user top-K table behind the recommended campaigns"""
+    # Popular upcoming campaigns, ranked within their category, place and overall
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_pool (
+            campaign_id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            ngo_id INTEGER,
+            place TEXT NOT NULL,
+            popularity REAL NOT NULL,
+            category_rank INTEGER NOT NULL,
+            place_rank INTEGER NOT NULL,
+            overall_rank INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_pool_category ON recommendation_pool (category, category_rank)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_pool_place ON recommendation_pool (place, place_rank)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_pool_overall ON recommendation_pool (overall_rank)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaign_recommendations (
+            user_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            campaign_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, rank)
+        ) WITHOUT ROWID
+    ''')
+
+@migration
+def add_campaign_status_indexes(cursor):
+    """Status indexes for the lifecycle scheduler, and listings that skip completed campaigns"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaigns_status_date ON campaigns (status, date)')
+    # Listings only show campaigns that haven't finished, so index just those
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_campaigns_active_listing ON campaigns (featured DESC, date, id)
+        WHERE status != 'completed'
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_campaigns_active_category_listing
+        ON campaigns (category, featured DESC, date, id) WHERE status != 'completed'
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_campaigns_listing')
+    cursor.execute('DROP INDEX IF EXISTS idx_campaigns_category_listing')
+
+@migration
+def create_campaign_events(cursor):
+    """Append-only log of volunteer and status changes behind the live event streams"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaign_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id INTEGER NOT NULL,
+            ngo_id INTEGER,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaign_events_campaign ON campaign_events (campaign_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaign_events_ngo ON campaign_events (ngo_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaign_events_created ON campaign_events (created_at)')
+
+ACTIVITY_COLUMNS = 'id, user_id, campaign_id, activity_type, description, points_earned, created_at'
+
+def create_activity_archive_table(cursor, schema='main'):
+    """Create the archive table, a copy of activities that keeps the original ids"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.activities_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            campaign_id INTEGER,
+            activity_type TEXT NOT NULL,
+            description TEXT,
+            points_earned INTEGER DEFAULT 0,
+            created_at TIMESTAMP
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS {schema}.idx_activities_archive_user_created
+        ON activities_archive (user_id, created_at)
+    ''')
+
+@migration
+def create_activity_archive(cursor):
+    """Archive table for old activities, and a created_at index to find them"""
+    create_activity_archive_table(cursor)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_activities_created ON activities (created_at)')
 
-# Initialize database on startup
-init_db()
+@migration
+def add_feed_covering_indexes(cursor):
+    """Covering indexes so a user's newest activities and badges are read straight off the index
+
+    id comes right after the timestamp so ties are broken in index order too.
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_activities_user_feed
+        ON activities (user_id, created_at, id, activity_type, description, points_earned, campaign_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_badges_user_earned
+        ON user_badges (user_id, earned_at, id, badge_name, badge_icon, badge_description, campaign_id)
+    ''')
+    # The feed index starts with the same columns
+    cursor.execute('DROP INDEX IF EXISTS idx_activities_user_created')
+
+@migration
+def add_campaign_versions(cursor):
+    """Version number bumped by every update to a campaign, so rendered cards can be cached by (id, version)"""
+    add_missing_columns(cursor, 'campaigns', [('version', 'INTEGER NOT NULL DEFAULT 0')])
+    # Writes that set version themselves are left alone
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS campaigns_version_au
+        AFTER UPDATE ON campaigns WHEN new.version = old.version BEGIN
+            UPDATE campaigns SET version = old.version + 1 WHERE id = old.id;
+        END
+    ''')
+
+@migration
+def create_cache_versions(cursor):
+    """Version counters for cache tags, bumped by every write that invalidates them
+
+    Each worker checks its cached entries against these, so a write made in
+    one worker invalidates the others' copies too.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            tag TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
 
 # Helper functions
+BadgeRule = namedtuple('BadgeRule', 'name metric threshold icon description')
+
+# Every badge a user can earn; each metric is a column of award_badges()' query
+BADGE_RULES = (
+    BadgeRule('First Steps', 'campaigns_completed', 1, 'seedling', 'Completed your first campaign!'),
+    BadgeRule('Eco Warrior', 'campaigns_completed', 5, 'shield-alt', 'Completed 5 campaigns!'),
+    BadgeRule('Green Champion', 'campaigns_completed', 10, 'trophy', 'Completed 10 campaigns!'),
+    BadgeRule('Environmental Hero', 'campaigns_completed', 25, 'medal', 'Completed 25 campaigns!'),
+    BadgeRule('Point Collector', 'eco_points', 100, 'coins', 'Earned 100 eco points!'),
+    BadgeRule('Point Master', 'eco_points', 500, 'star', 'Earned 500 eco points!'),
+    BadgeRule('Point Legend', 'eco_points', 1000, 'crown', 'Earned 1000 eco points!'),
+)
+
 def award_badge(user_id, badge_name, badge_icon, badge_description=None, campaign_id=None):
-    """Award a badge to a user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if user already has this badge
-    existing = cursor.execute('''
-        SELECT id FROM user_badges 
-        WHERE user_id = ? AND badge_name = ?
-    ''', (user_id, badge_name)).fetchone()
+    """Award a badge to a user; the caller commits"""
+    cursor = get_db().cursor()
+    badge = cursor.execute('''
+        INSERT OR IGNORE INTO user_badges (user_id, badge_name, badge_icon, badge_description, campaign_id)
+        VALUES (?, ?, ?, ?, ?)
+        RETURNING *
+    ''', (user_id, badge_name, badge_icon, badge_description, campaign_id)).fetchone()
+    if badge:
+        remember_recent_activity(cursor, badges=[badge])
+
+def award_badges(cursor, user_ids, chunk_size=500):
+    """Evaluate BADGE_RULES for a set of users and insert the badges they now qualify for"""
+    user_ids = list(user_ids)
+    new_badges = []
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        # All metrics plus the badges already held, for every user, in one query
+        rows = cursor.execute(f'''
+            SELECT u.id, u.eco_points,
+                   (SELECT COUNT(*) FROM campaign_completions cc WHERE cc.user_id = u.id) AS campaigns_completed,
+                   (SELECT json_group_array(ub.badge_name) FROM user_badges ub WHERE ub.user_id = u.id) AS held
+            FROM users u
+            WHERE u.id IN ({','.join('?' * len(chunk))})
+        ''', chunk).fetchall()
+        
+        for row in rows:
+            held = set(json.loads(row['held']))
+            for rule in BADGE_RULES:
+                if rule.name not in held and (row[rule.metric] or 0) >= rule.threshold:
+                    new_badges.append((row['id'], rule.name, rule.icon, rule.description))
     
-    if not existing:
+    awarded = []
+    for start in range(0, len(new_badges), chunk_size):
+        chunk = new_badges[start:start + chunk_size]
+        awarded += cursor.execute(f'''
+            INSERT OR IGNORE INTO user_badges (user_id, badge_name, badge_icon, badge_description)
+            VALUES {', '.join(['(?, ?, ?, ?)'] * len(chunk))}
+            RETURNING *
+        ''', [value for badge in chunk for value in badge]).fetchall()
+    if new_badges:
+        remember_recent_activity(cursor, badges=awarded)
+        invalidate_dashboards({badge[0] for badge in new_badges})
+        invalidate_pages('leaderboard')
+    return new_badges
+
+LEADERBOARD_WINDOWS = ('all', 'week', 'month')
+
+def leaderboard_periods(now=None):
+    """Map each leaderboard window to its current board key and start time"""
+    now = now or datetime.utcnow()
+    year, week, _ = now.isocalendar()
+    week_start = now - timedelta(days=now.weekday())
+    return {
+        'all': ('all', None),
+        'week': (f'week:{year}-W{week:02d}', week_start.strftime('%Y-%m-%d 00:00:00')),
+        'month': (f'month:{now:%Y-%m}', now.strftime('%Y-%m-01 00:00:00')),
+    }
+
+def update_leaderboard(cursor, user_id, points=0, completed=0):
+    """Add points and completions to the user's entry on every current board"""
+    update_leaderboards(cursor, [(user_id, points, completed)])
+
+def update_leaderboards(cursor, changes):
+    """Apply (user_id, points, completed) deltas to every current board"""
+    boards = [board for board, _ in leaderboard_periods().values()]
+    cursor.executemany('''
+        INSERT INTO leaderboard_entries (board, user_id, location, points, campaigns_completed)
+        SELECT ?, id, lower(trim(location)), ?, ? FROM users WHERE id = ?
+        ON CONFLICT (board, user_id) DO UPDATE SET
+            points = points + excluded.points,
+            campaigns_completed = campaigns_completed + excluded.campaigns_completed
+    ''', [(board, points, completed, user_id) for user_id, points, completed in changes for board in boards])
+    invalidate_pages('leaderboard')
+
+def rebuild_leaderboard(cursor):
+    """Recompute the current boards from scratch, dropping past periods"""
+    invalidate_pages('leaderboard')
+    cursor.execute('DELETE FROM leaderboard_entries')
+    cursor.execute('''
+        INSERT INTO leaderboard_entries (board, user_id, location, points, campaigns_completed)
+        SELECT 'all', u.id, lower(trim(u.location)), u.eco_points,
+               (SELECT COUNT(*) FROM campaign_completions cc WHERE cc.user_id = u.id)
+        FROM users u
+    ''')
+    for window in ('week', 'month'):
+        board, start = leaderboard_periods()[window]
         cursor.execute('''
-            INSERT INTO user_badges (user_id, badge_name, badge_icon, badge_description, campaign_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, badge_name, badge_icon, badge_description, campaign_id))
-        conn.commit()
-    conn.close()
+            INSERT INTO leaderboard_entries (board, user_id, location, points, campaigns_completed)
+            SELECT ?, u.id, lower(trim(u.location)), COALESCE(a.points, 0), COALESCE(cc.completed, 0)
+            FROM users u
+            LEFT JOIN (
+                SELECT user_id, SUM(points_earned) AS points FROM activities
+                WHERE created_at >= ? GROUP BY user_id
+            ) a ON a.user_id = u.id
+            LEFT JOIN (
+                SELECT user_id, COUNT(*) AS completed FROM campaign_completions
+                WHERE completed_at >= ? GROUP BY user_id
+            ) cc ON cc.user_id = u.id
+            WHERE a.user_id IS NOT NULL OR cc.user_id IS NOT NULL
+        ''', (board, start, start))
+
+def rebuild_recommendation_pool(cursor, today=None):
+    """Refill the candidate pool from upcoming campaigns that still have free spots"""
+    today = today or datetime.utcnow().strftime('%Y-%m-%d')
+    cursor.execute('DELETE FROM recommendation_pool')
+    cursor.execute('''
+        INSERT INTO recommendation_pool (campaign_id, category, ngo_id, place, popularity,
+                                         category_rank, place_rank, overall_rank)
+        SELECT * FROM (
+            SELECT id, category, ngo_id, place, popularity,
+                   ROW_NUMBER() OVER (PARTITION BY category ORDER BY popularity DESC, date, id) AS category_rank,
+                   ROW_NUMBER() OVER (PARTITION BY place ORDER BY popularity DESC, date, id) AS place_rank,
+                   ROW_NUMBER() OVER (ORDER BY popularity DESC, date, id) AS overall_rank
+            FROM (
+                SELECT id, category, ngo_id, lower(trim(location)) AS place, date,
+                       COALESCE(volunteers_joined, 0) * 1.0
+                       / MAX(1, MAX(COALESCE(volunteers_joined, 0)) OVER ()) AS popularity
+                FROM campaigns
+                WHERE status = 'upcoming' AND date >= ? AND COALESCE(volunteers_joined, 0) < volunteers_needed
+            )
+        )
+        WHERE category_rank <= ? OR place_rank <= ? OR overall_rank <= ?
+    ''', (today, RECOMMENDATION_POOL_SIZE, RECOMMENDATION_POOL_SIZE, RECOMMENDATION_POOL_SIZE))
+
+def refresh_recommendations(cursor, user_ids, chunk_size=RECOMMENDATION_BATCH_SIZE):
+    """Rescore the pool for a set of users and replace their stored top-K
+
+    Each chunk of users is scored in one statement: affinity for a
+    category or NGO is its share of the user's joins (completions count
+    double), and a campaign scores 3 x category + 2 x NGO affinity, plus
+    1 in the user's own place, plus its popularity.
+    """
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'DELETE FROM campaign_recommendations WHERE user_id IN ({placeholders})', chunk)
+        cursor.execute(f'''
+            INSERT INTO campaign_recommendations (user_id, rank, campaign_id, score)
+            WITH chunk AS (
+                SELECT id AS user_id, lower(trim(location)) AS place FROM users WHERE id IN ({placeholders})
+            ),
+            history AS (
+                SELECT cv.user_id, c.category, c.ngo_id,
+                       CASE WHEN cc.id IS NULL THEN 1 ELSE 2 END AS weight
+                FROM chunk
+                JOIN campaign_volunteers cv ON cv.user_id = chunk.user_id
+                JOIN campaigns c ON c.id = cv.campaign_id
+                LEFT JOIN campaign_completions cc ON cc.campaign_id = cv.campaign_id AND cc.user_id = cv.user_id
+            ),
+            totals AS (
+                SELECT user_id, SUM(weight) * 1.0 AS total FROM history GROUP BY user_id
+            ),
+            category_affinity AS (
+                SELECT h.user_id, h.category, SUM(h.weight) / t.total AS share
+                FROM history h JOIN totals t ON t.user_id = h.user_id
+                GROUP BY h.user_id, h.category
+            ),
+            ngo_affinity AS (
+                SELECT h.user_id, h.ngo_id, SUM(h.weight) / t.total AS share
+                FROM history h JOIN totals t ON t.user_id = h.user_id
+                WHERE h.ngo_id IS NOT NULL
+                GROUP BY h.user_id, h.ngo_id
+            ),
+            candidates AS (
+                SELECT ca.user_id, p.campaign_id FROM category_affinity ca
+                JOIN recommendation_pool p ON p.category = ca.category AND p.category_rank <= ?
+                UNION
+                SELECT chunk.user_id, p.campaign_id FROM chunk
+                JOIN recommendation_pool p ON p.place = chunk.place AND p.place_rank <= ?
+                UNION
+                SELECT chunk.user_id, p.campaign_id FROM chunk
+                JOIN recommendation_pool p ON p.overall_rank <= ?
+            ),
+            scored AS (
+                SELECT cand.user_id, cand.campaign_id,
+                       3 * COALESCE(ca.share, 0) + 2 * COALESCE(na.share, 0)
+                       + (p.place = chunk.place) + p.popularity AS score
+                FROM candidates cand
+                JOIN chunk ON chunk.user_id = cand.user_id
+                JOIN recommendation_pool p ON p.campaign_id = cand.campaign_id
+                LEFT JOIN category_affinity ca ON ca.user_id = cand.user_id AND ca.category = p.category
+                LEFT JOIN ngo_affinity na ON na.user_id = cand.user_id AND na.ngo_id = p.ngo_id
+                WHERE NOT EXISTS (SELECT 1 FROM campaign_volunteers cv
+                                  WHERE cv.user_id = cand.user_id AND cv.campaign_id = cand.campaign_id)
+            )
+            SELECT user_id, rank, campaign_id, score FROM (
+                SELECT user_id, campaign_id, score,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY score DESC, campaign_id) AS rank
+                FROM scored
+            ) WHERE rank <= ?
+        ''', chunk + [RECOMMENDATION_POOL_SIZE] * 3 + [RECOMMENDATIONS_PER_USER])
+        invalidate_dashboards(chunk)
+
+def rebuild_recommendations(cursor):
+    """Refill the pool and rescore every user; returns how many users were scored"""
+    rebuild_recommendation_pool(cursor)
+    user_ids = [row[0] for row in cursor.execute('SELECT id FROM users ORDER BY id')]
+    refresh_recommendations(cursor, user_ids)
+    return len(user_ids)
+
+def recommended_campaigns(cursor, user_id, limit=RECOMMENDATIONS_PER_USER, exclude=None):
+    """A user's stored recommendations that are still open to them, best first"""
+    return cursor.execute('''
+        SELECT c.*, r.score FROM campaign_recommendations r
+        JOIN campaigns c ON c.id = r.campaign_id
+        WHERE r.user_id = ? AND c.id IS NOT ? AND c.status = 'upcoming'
+          AND c.volunteers_joined < c.volunteers_needed
+          AND NOT EXISTS (SELECT 1 FROM campaign_volunteers cv WHERE cv.user_id = r.user_id AND cv.campaign_id = c.id)
+        ORDER BY r.rank
+        LIMIT ?
+    ''', (user_id, exclude, limit)).fetchall()
+
+ActivityEvent = namedtuple('ActivityEvent', 'user_id activity_type description points_earned campaign_id created_at',
+                           defaults=(0, None, None))
 
 def log_activity(user_id, activity_type, description, points_earned=0, campaign_id=None):
-    """Log an activity for a user"""
+    """Log an activity for a user and return their new eco points total; the caller commits
+
+    In write-behind mode the event is queued instead and None is returned.
+    """
+    if ACTIVITY_LOG_MODE == 'write-behind':
+        record_activities([ActivityEvent(user_id, activity_type, description, points_earned, campaign_id,
+                                         datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))])
+        return None
+    
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('''
+    activity = cursor.execute('''
         INSERT INTO activities (user_id, campaign_id, activity_type, description, points_earned)
         VALUES (?, ?, ?, ?, ?)
-    ''', (user_id, campaign_id, activity_type, description, points_earned))
+        RETURNING *
+    ''', (user_id, campaign_id, activity_type, description, points_earned)).fetchone()
+    invalidate_dashboards([user_id])
+    remember_recent_activity(cursor, activities=[activity])
     
     # Update user's eco points
     if points_earned > 0:
-        cursor.execute('''
-            UPDATE users SET eco_points = eco_points + ? WHERE id = ?
-        ''', (points_earned, user_id))
+        eco_points = cursor.execute('''
+            UPDATE users SET eco_points = eco_points + ? WHERE id = ? RETURNING eco_points
+        ''', (points_earned, user_id)).fetchone()[0]
+        update_leaderboard(cursor, user_id, points=points_earned)
+        return eco_points
+
+def record_activities(events):
+    """Log many ActivityEvents now, or queue them in write-behind mode; the caller commits
+
+    Queued events are handed to the writer only once the caller's transaction
+    commits, so a rolled-back action logs nothing either way.
+    """
+    if ACTIVITY_LOG_MODE == 'write-behind':
+        writer = current_app.extensions['activity_writer']
+        def submit():
+            for event in events:
+                writer.submit(event)
+        after_commit(submit)
+    else:
+        log_activities(events)
+
+def log_activities(events, chunk_size=1000):
+    """Write ActivityEvents with batched inserts and one points update per user; the caller commits"""
+    cursor = get_db().cursor()
+    activities = []
+    for start in range(0, len(events), chunk_size):
+        chunk = events[start:start + chunk_size]
+        activities += cursor.execute(f'''
+            INSERT INTO activities (user_id, activity_type, description, points_earned, campaign_id, created_at)
+            VALUES {', '.join(['(?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))'] * len(chunk))}
+            RETURNING *
+        ''', [value for event in chunk for value in event]).fetchall()
+    remember_recent_activity(cursor, activities=activities)
     
-    conn.commit()
-    conn.close()
+    # Coalesce points so each user's row is updated once
+    points = {}
+    for event in events:
+        if event.points_earned > 0:
+            points[event.user_id] = points.get(event.user_id, 0) + event.points_earned
+    cursor.executemany('''
+        UPDATE users SET eco_points = eco_points + ? WHERE id = ?
+    ''', [(earned, user_id) for user_id, earned in points.items()])
+    update_leaderboards(cursor, [(user_id, earned, 0) for user_id, earned in points.items()])
+    invalidate_dashboards(points)
+
+class ActivityWriter(BackgroundService):
+    """Write-behind buffer that flushes activity events in batched transactions
+
+    Events wait in a bounded in-process queue. A background thread writes
+    them once a batch fills up or the flush interval passes. Anything that
+    can't be written (full queue, failed flush, exit without a database) is
+    appended to a JSONL journal, which is replayed when the writer next
+    starts.
+    """
+    
+    def __init__(self, app, maxsize, batch_size, interval, journal):
+        super().__init__(app)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.journal = journal
+        self.flushed = 0
+        self.spilled = 0
+        self._queue = None
+        self._thread = None
+        self._stop = None
+    
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def submit(self, event):
+        """Queue an event without blocking the request"""
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._spill([event])
+    
+    def depth(self):
+        """Number of events waiting to be flushed"""
+        return self._queue.qsize() if self._queue else 0
+    
+    def stats(self):
+        return {'queue_depth': self.depth(), 'flushed': self.flushed, 'spilled': self.spilled}
+    
+    def flush(self):
+        """Write everything queued so far and wait for in-flight batches"""
+        if not self.running():
+            return
+        while True:
+            batch = self._take()
+            if not batch:
+                break
+            self._write(batch, queued=True)
+        self._queue.join()
+    
+    def stop(self):
+        """Stop the background thread and flush what is left"""
+        if not self.running():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.interval * 2 + 5)
+        self.flush()
+    
+    def _take(self, first=None, deadline=None):
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                if timeout is None or timeout <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        self._replay()
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            # Wait for a full batch or the end of the interval, whichever comes first
+            self._write(self._take(first, time.monotonic() + self.interval), queued=True)
+    
+    def _write(self, batch, queued=False):
+        try:
+            with self.app.app_context():
+                with write_transaction() as cursor:
+                    log_activities(batch)
+                    award_badges(cursor, {event.user_id for event in batch})
+            self.flushed += len(batch)
+        except Exception as e:
+            print(f"Activity flush failed, spilling {len(batch)} events to {self.journal}: {e}")
+            self._spill(batch)
+        finally:
+            if queued:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _spill(self, events):
+        with self._lock:
+            with open(self.journal, 'a') as f:
+                for event in events:
+                    f.write(json.dumps(event) + '\n')
+            self.spilled += len(events)
+    
+    def _replay(self):
+        # Claim the journal first so concurrent workers don't replay it twice
+        claimed = f'{self.journal}.{os.getpid()}.replay'
+        try:
+            with self._lock:
+                os.replace(self.journal, claimed)
+        except FileNotFoundError:
+            return
+        with open(claimed) as f:
+            events = [ActivityEvent(*json.loads(line)) for line in f if line.strip()]
+        print(f"Replaying {len(events)} journaled activity events")
+        for start in range(0, len(events), self.batch_size):
+            self._write(events[start:start + self.batch_size])
+        os.remove(claimed)
+
+def user_activities(cursor, user_id, before=None, limit=ACTIVITY_PAGE_SIZE):
+    """One page of a user's activities, newest first, running on into the archive
+
+    before is the (created_at, id) of the last row already shown. Returns the
+    rows and whether there are more.
+    """
+    rows = []
+    # Archived rows are all older than the live ones, so read the archive last
+    for table in ('activities', activity_archive_table()):
+        seek, params = '', [user_id]
+        if before:
+            seek = 'AND (a.created_at < ? OR (a.created_at = ? AND a.id < ?))'
+            params += [before[0], before[0], before[1]]
+        rows += cursor.execute(f'''
+            SELECT a.*, c.title AS campaign_title
+            FROM {table} a
+            LEFT JOIN campaigns c ON a.campaign_id = c.id
+            WHERE a.user_id = ? {seek}
+            ORDER BY a.created_at DESC, a.id DESC
+            LIMIT ?
+        ''', params + [limit + 1 - len(rows)]).fetchall()
+        if len(rows) > limit:
+            break
+    return rows[:limit], len(rows) > limit
+
+def archive_activities(cutoff, chunk_size=ACTIVITY_ARCHIVE_CHUNK_SIZE):
+    """Move activities created before cutoff into the archive, one chunk per transaction
+
+    Each chunk is copied before it is deleted and copies of rows already
+    archived are ignored, so a run interrupted between the two (an attached
+    archive commits separately) is finished by running it again. Returns the
+    number of rows moved and of pages given back to the filesystem.
+    """
+    conn = get_db()
+    oldest = 'SELECT id FROM activities WHERE created_at < ? ORDER BY created_at, id LIMIT ?'
+    incremental = conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    moved = freed = 0
+    while True:
+        with write_transaction() as cursor:
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {activity_archive_table()} ({ACTIVITY_COLUMNS})
+                SELECT {ACTIVITY_COLUMNS} FROM activities WHERE id IN ({oldest})
+            ''', (cutoff, chunk_size))
+            deleted = cursor.execute(f'DELETE FROM activities WHERE id IN ({oldest})', (cutoff, chunk_size)).rowcount
+            if incremental:
+                # Truncate the pages this chunk freed; fetchall() steps it to the end
+                freed += cursor.execute('PRAGMA freelist_count').fetchone()[0]
+                cursor.execute('PRAGMA incremental_vacuum').fetchall()
+                freed -= cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        moved += deleted
+        if deleted < chunk_size:
+            break
+    return moved, freed
+
+def advance_campaigns(cursor, today=None, chunk_size=CAMPAIGN_LIFECYCLE_CHUNK_SIZE):
+    """Move campaigns along upcoming -> ongoing -> completed by date; the caller commits
+
+    Returns (started, completed, finalized): the campaigns that went
+    ongoing, the ones that completed, and how many pending completions
+    of those were finalized.
+    """
+    today = today or datetime.utcnow().strftime('%Y-%m-%d')
+    completed = [row[0] for row in cursor.execute('''
+        UPDATE campaigns SET status = 'completed'
+        WHERE status IN ('upcoming', 'ongoing') AND date < ?
+        RETURNING id
+    ''', (today,))]
+    started = [row[0] for row in cursor.execute('''
+        UPDATE campaigns SET status = 'ongoing'
+        WHERE status = 'upcoming' AND date <= ?
+        RETURNING id
+    ''', (today,))]
+    
+    finalized = 0
+    for start in range(0, len(completed), chunk_size):
+        finalized += finalize_completions(cursor, completed[start:start + chunk_size])
+    
+    changed = started + completed
+    if changed:
+        publish_campaign_events(cursor, [(campaign_id, 'status', None) for campaign_id in changed])
+        for campaign_id in changed:
+            invalidate_dashboards(campaign_id=campaign_id)
+        invalidate_pages('campaigns', *[('campaign', campaign_id) for campaign_id in changed])
+    return started, completed, finalized
+
+def finalize_completions(cursor, campaign_ids):
+    """Confirm every completion still pending NGO verification for these finished campaigns
+
+    Volunteers get the same bonus as an NGO verification. verified_by
+    stays NULL so finalized rows can be told apart from verified ones.
+    """
+    placeholders = ','.join('?' * len(campaign_ids))
+    pending = cursor.execute(f'''
+        UPDATE campaign_completions SET verified_by_ngo = 1
+        WHERE campaign_id IN ({placeholders}) AND verified_by_ngo = 0
+        RETURNING campaign_id, user_id
+    ''', campaign_ids).fetchall()
+    if not pending:
+        return 0
+    
+    cursor.executemany('''
+        UPDATE campaign_volunteers SET status = 'verified'
+        WHERE campaign_id = ? AND user_id = ?
+    ''', [(row['campaign_id'], row['user_id']) for row in pending])
+    publish_campaign_events(cursor, [(row['campaign_id'], 'verified', row['user_id']) for row in pending])
+    titles = dict(cursor.execute(f'SELECT id, title FROM campaigns WHERE id IN ({placeholders})', campaign_ids).fetchall())
+    record_activities([ActivityEvent(row['user_id'], 'campaign_verified',
+                                     f'Campaign completion confirmed: {titles[row["campaign_id"]]}',
+                                     10, row['campaign_id'])
+                       for row in pending])
+    award_badges(cursor, {row['user_id'] for row in pending})
+    return len(pending)
+
+class CampaignScheduler(BackgroundService):
+    """Background thread that runs advance_campaigns() every interval seconds
+
+    Each run also prunes the live event log.
+
+    Every worker process runs its own; the UPDATEs only match campaigns
+    that still need to move, so overlapping runs are harmless.
+    """
+    
+    def __init__(self, app, interval):
+        super().__init__(app)
+        self.interval = interval
+        self.runs = 0
+        self.started = 0
+        self.completed = 0
+        self.finalized = 0
+        self.failures = 0
+        self._thread = None
+        self._stop = None
+    
+    def ensure_started(self):
+        """Start the thread in this process if it isn't running yet and an interval is set"""
+        if self.interval > 0:
+            super().ensure_started()
+    
+    def _start(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='campaign-scheduler', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self):
+        """Stop the background thread"""
+        if not self.running():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+    
+    def stats(self):
+        return {'runs': self.runs, 'started': self.started, 'completed': self.completed,
+                'finalized': self.finalized, 'failures': self.failures}
+    
+    def run_once(self):
+        """Advance campaigns now in a transaction of their own"""
+        with self.app.app_context():
+            with write_transaction() as cursor:
+                started, completed, finalized = advance_campaigns(cursor)
+                prune_campaign_events(cursor)
+        self.runs += 1
+        self.started += len(started)
+        self.completed += len(completed)
+        self.finalized += finalized
+        return started, completed, finalized
+    
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.failures += 1
+                print(f"Campaign lifecycle run failed: {e}")
+            if self._stop.wait(self.interval):
+                break
+
+# Campaign fields every live event carries, so a client only needs the latest one
+CAMPAIGN_EVENT_JSON = '''json_object(
+    'campaign_id', c.id, 'volunteers_joined', c.volunteers_joined,
+    'volunteers_needed', c.volunteers_needed, 'status', c.status)'''
+
+def publish_campaign_events(cursor, events):
+    """Append (campaign_id, event, user_id) entries to the live event log; the caller commits
+
+    Each event carries the campaign's counts and status as of this write,
+    plus the volunteer's name when user_id is given. Subscribers see it
+    once the transaction commits.
+    """
+    cursor.executemany(f'''
+        INSERT INTO campaign_events (campaign_id, ngo_id, event, data)
+        SELECT c.id, c.ngo_id, ?, json_set({CAMPAIGN_EVENT_JSON}, '$.name', (SELECT u.name FROM users u WHERE u.id = ?))
+        FROM campaigns c WHERE c.id = ?
+    ''', [(event, user_id, campaign_id) for campaign_id, event, user_id in events])
+    after_commit(current_app.extensions['event_broker'].wake)
+
+def prune_campaign_events(cursor):
+    """Drop live events older than CAMPAIGN_EVENT_RETENTION_HOURS"""
+    cutoff = (datetime.utcnow() - timedelta(hours=CAMPAIGN_EVENT_RETENTION_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+    return cursor.execute('DELETE FROM campaign_events WHERE created_at < ?', (cutoff,)).rowcount
+
+def latest_campaign_event_id(cursor):
+    return cursor.execute('SELECT COALESCE(MAX(id), 0) FROM campaign_events').fetchone()[0]
+
+class Subscription:
+    """One open event stream: the topic it follows and its bounded queue"""
+    
+    def __init__(self, topic, size):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=size)
+        self.closed = False
+
+class EventBroker(BackgroundService):
+    """Single publisher that tails campaign_events and fans new rows out to subscribers
+
+    One thread per worker process reads the log, however many streams
+    are open, and wakes early when a write in this process commits.
+    Topics are ('campaign', id) and ('ngo', id). A subscriber whose queue
+    is full is dropped rather than blocking everyone else; its client
+    reconnects and replays what it missed from Last-Event-ID.
+    """
+    
+    def __init__(self, app, poll_interval, queue_size, max_subscribers, batch_size=1000):
+        super().__init__(app)
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.batch_size = batch_size
+        self.published = 0
+        self.dropped = 0
+        self._topics = {}
+        self._count = 0
+        self._last_id = None
+        self._wake = None
+        self._thread = None
+    
+    def _start(self):
+        self._topics = {}
+        self._count = 0
+        self._last_id = None
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+        self._thread.start()
+    
+    def subscribe(self, topic, cursor):
+        """Register a stream for topic, or return None if this worker has SSE_MAX_SUBSCRIBERS already"""
+        self.ensure_started()
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            if self._last_id is None:
+                # Tail from here on; the new stream replays anything older itself
+                self._last_id = latest_campaign_event_id(cursor)
+            subscription = Subscription(topic, self.queue_size)
+            self._topics.setdefault(topic, set()).add(subscription)
+            self._count += 1
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._remove(subscription)
+    
+    def _remove(self, subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers and subscription in subscribers:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+            self._count -= 1
+            # Nobody is listening, so stop reading the log until someone is
+            if not self._count:
+                self._last_id = None
+        subscription.closed = True
+    
+    def wake(self):
+        """Poll now instead of at the next interval"""
+        if self.running():
+            self._wake.set()
+    
+    def stats(self):
+        return {'subscribers': self._count, 'published': self.published, 'dropped': self.dropped}
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Campaign event poll failed: {e}")
+    
+    def _poll(self):
+        last_id = self._last_id
+        if last_id is None:
+            return
+        with self.app.app_context():
+            rows = get_db().execute('''
+                SELECT id, campaign_id, ngo_id, event, data FROM campaign_events
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, self.batch_size)).fetchall()
+        with self._lock:
+            # Everyone left (and maybe came back) while we were reading
+            if self._last_id != last_id:
+                return
+            for row in rows:
+                event = (row['id'], row['event'], row['data'])
+                for topic in (('campaign', row['campaign_id']), ('ngo', row['ngo_id'])):
+                    for subscription in list(self._topics.get(topic, ())):
+                        try:
+                            subscription.queue.put_nowait(event)
+                        except queue.Full:
+                            self.dropped += 1
+                            self._remove(subscription)
+                self.published += 1
+            if rows and self._last_id is not None:
+                self._last_id = rows[-1]['id']
+        if len(rows) == self.batch_size:
+            self._wake.set()
+
+def format_sse(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
+
+def event_stream(broker, subscription, backlog, after):
+    """Yield the backlog, then live events newer than it, as SSE text"""
+    try:
+        yield f'retry: {int(SSE_POLL_INTERVAL * 3000)}\n\n'
+        for event_id, event, data in backlog:
+            yield format_sse(event_id, event, data)
+        while not (subscription.closed and subscription.queue.empty()):
+            try:
+                event_id, event, data = subscription.queue.get(timeout=SSE_HEARTBEAT)
+            except queue.Empty:
+                # Comments keep proxies from timing out and reveal closed connections
+                yield ': heartbeat\n\n'
+                continue
+            # Already sent as part of the backlog
+            if event_id <= after:
+                continue
+            after = event_id
+            yield format_sse(event_id, event, data)
+    finally:
+        broker.unsubscribe(subscription)
+
+def stream_campaign_events(topic):
+    """SSE response for a ('campaign', id) or ('ngo', id) topic, resuming after Last-Event-ID
+
+    A new stream, or one too far behind to replay, starts with a
+    'volunteers' snapshot of each campaign's current counts.
+    """
+    kind, value = topic
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id is not None and not last_event_id.isdigit():
+        return jsonify({'error': 'Last-Event-ID must be an event id'}), 400
+    
+    broker = current_app.extensions['event_broker']
+    cursor = get_db().cursor()
+    subscription = broker.subscribe(topic, cursor)
+    if subscription is None:
+        return jsonify({'error': 'Too many live streams, try again shortly'}), 503, {'Retry-After': '5'}
+    
+    backlog = None
+    after = int(last_event_id or 0)
+    if last_event_id:
+        column = 'campaign_id' if kind == 'campaign' else 'ngo_id'
+        rows = cursor.execute(f'''
+            SELECT id, event, data FROM campaign_events
+            WHERE {column} = ? AND id > ? ORDER BY id LIMIT ?
+        ''', (value, after, SSE_REPLAY_LIMIT + 1)).fetchall()
+        if len(rows) <= SSE_REPLAY_LIMIT:
+            backlog = [tuple(row) for row in rows]
+            after = max([after] + [row['id'] for row in rows])
+    if backlog is None:
+        # One statement, so the counts and the event id come from the same snapshot
+        where = 'c.id = ?' if kind == 'campaign' else "c.ngo_id = ? AND c.status != 'completed'"
+        rows = cursor.execute(f'''
+            SELECT (SELECT COALESCE(MAX(id), 0) FROM campaign_events) AS event_id, {CAMPAIGN_EVENT_JSON} AS data
+            FROM campaigns c WHERE {where}
+        ''', (value,)).fetchall()
+        if kind == 'campaign' and not rows:
+            broker.unsubscribe(subscription)
+            return jsonify({'error': 'Campaign not found'}), 404
+        after = rows[0]['event_id'] if rows else latest_campaign_event_id(cursor)
+        backlog = [(row['event_id'], 'volunteers', row['data']) for row in rows]
+    
+    response = current_app.response_class(event_stream(broker, subscription, backlog, after),
+                                          mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx-style proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Password hashing
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool and its backlog are full"""
+
+class PasswordHasher(BackgroundService):
+    """Bounded thread pool for password hashing
+
+    hashlib's scrypt and PBKDF2 release the GIL, so the pool's threads hash
+    in parallel with requests that are still serving other routes. At most
+    `workers` hashes run at once and `backlog` more may queue; a caller that
+    can't get a slot within `wait` seconds gets PasswordHasherBusy, so a
+    signup spike sheds load instead of tying up every request thread.
+    """
+    
+    def __init__(self, app, workers, backlog, wait):
+        super().__init__(app)
+        self.workers = workers
+        self.wait = wait
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._executor = None
+        self._pending = 0
+    
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+    
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for its result"""
+        self.ensure_started()
+        if not self._slots.acquire(timeout=self.wait):
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+    
+    def stats(self):
+        return {'pending': self._pending, 'hashed': self.hashed, 'verified': self.verified,
+                'rehashed': self.rehashed, 'rejected': self.rejected}
+
+@lru_cache(maxsize=None)
+def password_hash_prefix(method):
+    """The 'method:params' prefix Werkzeug writes for method, with defaults filled in"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def verify_and_upgrade(stored, password, method):
+    """Check password against stored; also return a new hash if stored used another method"""
+    if not check_password_hash(stored, password):
+        return False, None
+    if stored.split('$', 1)[0] != password_hash_prefix(method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+def hash_password(password):
+    """Hash a new password with the configured method on the hashing pool"""
+    password_hasher = current_app.extensions['password_hasher']
+    hashed = password_hasher.run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+    password_hasher.hashed += 1
+    return hashed
+
+def check_password(table, account, password):
+    """Verify a sign-in against a users or ngos row, upgrading its hash if the method changed"""
+    password_hasher = current_app.extensions['password_hasher']
+    ok, upgraded = password_hasher.run(verify_and_upgrade, account['password'], password,
+                                       current_app.config['PASSWORD_HASH_METHOD'])
+    password_hasher.verified += 1
+    if upgraded:
+        with write_transaction() as cursor:
+            # Only replace the hash we checked, in case the password changed meanwhile
+            cursor.execute(f'UPDATE {table} SET password = ? WHERE id = ? AND password = ?',
+                           (upgraded, account['id'], account['password']))
+        password_hasher.rehashed += 1
+    return ok
+
+class TaggedCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds
+
+    Each entry carries tags such as ('campaign', id) for the rows it shows,
+    so one change can drop exactly the entries that display it. With
+    maxbytes set, entries are also evicted to keep the sizes passed to
+    put() under that total.
+    """
+    
+    def __init__(self, maxsize, ttl, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tagged = {}
+        self._lock = threading.Lock()
+        # Recent invalidations by key or tag, so a value computed before one
+        # of them isn't cached after it; _floor covers ones aged out of _recent
+        self._seq = 0
+        self._recent = OrderedDict()
+        self._floor = 0
+    
+    def token(self):
+        """Take before reading the database; pass to put() as since"""
+        return self._seq
+    
+    def get(self, key, valid=None):
+        """The live entry for key, or None; valid(value), if given, must also pass
+
+        valid runs outside the lock, and an entry that fails it is dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            if valid is None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        fresh = valid(entry[1])
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                fresh = False
+            elif fresh:
+                self._entries.move_to_end(key)
+            else:
+                self._drop(key)
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[1] if fresh else None
+    
+    def peek(self, key):
+        """Like get(), but without counting a hit or miss or refreshing the entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+    
+    def put(self, key, value, tags=(), since=None, size=0):
+        with self._lock:
+            if since is not None and (self._floor > since or any(
+                    self._recent.get(name, 0) > since for name in (key, *tags))):
+                return
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags), size)
+            self.nbytes += size
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize or (self.maxbytes and self.nbytes > self.maxbytes):
+                self._drop(next(iter(self._entries)))
+    
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._mark(key)
+                self._drop(key)
+    
+    def invalidate_tag(self, tag):
+        with self._lock:
+            self._mark(tag)
+            for key in self._tagged.get(tag, set()).copy():
+                self._drop(key)
+    
+    def clear(self):
+        with self._lock:
+            self._seq += 1
+            self._floor = self._seq
+            self._recent.clear()
+            self._entries.clear()
+            self._tagged.clear()
+            self.nbytes = 0
+    
+    def stats(self):
+        return {'size': len(self._entries), 'bytes': self.nbytes, 'hits': self.hits, 'misses': self.misses}
+    
+    def _mark(self, name):
+        self._seq += 1
+        self._recent.pop(name, None)
+        self._recent[name] = self._seq
+        while len(self._recent) > self.maxsize:
+            self._floor = self._recent.popitem(last=False)[1]
+    
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.nbytes -= entry[3]
+        for tag in entry[2]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+def invalidate_dashboards(user_ids=(), campaign_id=None, ngo_id=None):
+    """Invalidate the dashboard summaries a write touches in every worker; this one drops them once it commits"""
+    user_ids = list(user_ids)
+    tags = [('campaign', campaign_id)] if campaign_id is not None else []
+    if ngo_id is not None:
+        tags.append(('ngo', ngo_id))
+    invalidate_cache_tags([('user', user_id) for user_id in user_ids] + tags)
+    cache = current_app.extensions['dashboard_cache']
+    def invalidate():
+        cache.invalidate(user_ids)
+        for tag in tags:
+            cache.invalidate_tag(tag)
+    after_commit(invalidate)
+
+ACTIVITY_TITLES = {
+    'campaign_joined': 'Joined Campaign',
+    'campaign_completed': 'Completed Campaign',
+    'campaign_verified': 'Completion Verified',
+}
+
+def activity_feed_entry(row, campaign_title=None):
+    """Dashboard feed entry for an activities row"""
+    return {
+        'key': ('activity', row['id']),
+        'title': ACTIVITY_TITLES.get(row['activity_type'], row['activity_type'].replace('_', ' ').title()),
+        'description': row['description'],
+        'campaign_id': row['campaign_id'],
+        'campaign_title': campaign_title,
+        'points': row['points_earned'] or 0,
+        'icon': 'leaf',
+        'created_at': row['created_at'],
+    }
+
+def badge_feed_entry(row, campaign_title=None):
+    """Dashboard feed entry for a user_badges row"""
+    return {
+        'key': ('badge', row['id']),
+        'title': f"Earned Badge: {row['badge_name']}",
+        'description': row['badge_description'] or f"You earned the {row['badge_name']} badge",
+        'campaign_id': row['campaign_id'],
+        'campaign_title': campaign_title,
+        'points': 0,
+        'icon': row['badge_icon'] or 'medal',
+        'created_at': row['earned_at'],
+    }
+
+def feed_order(entry):
+    # Newest last; keys break ties between rows logged in the same second
+    return entry['created_at'], entry['key']
+
+class ActivityRing:
+    """Ring buffer of a user's newest feed entries, newest first
+
+    version is the user's feed version in cache_versions that the entries
+    are current as of.
+    """
+    
+    def __init__(self, entries, size, version):
+        self._entries = deque(entries, maxlen=size)
+        self._lock = threading.Lock()
+        self.version = version
+    
+    def advance(self, entries, version):
+        """Add the entries of the write that moved the feed to version; False if the ring missed one before it"""
+        with self._lock:
+            if self.version != version - 1:
+                return False
+            for entry in entries:
+                self._add(entry)
+            self.version = version
+            return True
+    
+    def _add(self, entry):
+        if any(seen['key'] == entry['key'] for seen in self._entries):
+            return
+        if not self._entries or entry['created_at'] >= self._entries[0]['created_at']:
+            self._entries.appendleft(entry)
+            return
+        # Rows logged with an older timestamp (write-behind) slot in behind newer ones
+        entries = sorted([*self._entries, entry], key=feed_order, reverse=True)
+        self._entries = deque(entries[:self._entries.maxlen], maxlen=self._entries.maxlen)
+    
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+def recent_activity(user_id, limit=RECENT_ACTIVITY_SIZE):
+    """A user's newest activities and badges, newest first
+
+    Served from the user's ring buffer while its version matches the
+    user's feed version in cache_versions; a miss reads both lists newest
+    first off their covering indexes and merges them, so nothing is sorted.
+    """
+    cache = current_app.extensions['recent_activity_cache']
+    ring = cache.get(user_id, valid=lambda ring: cache_versions([('feed', user_id)]) == (ring.version,))
+    if ring is not None:
+        return ring.entries()[:limit]
+    
+    since = cache.token()
+    with read_snapshot() as cursor:
+        activities = cursor.execute('''
+            SELECT a.id, a.activity_type, a.description, a.points_earned, a.campaign_id, a.created_at,
+                   c.title AS campaign_title
+            FROM activities a
+            LEFT JOIN campaigns c ON c.id = a.campaign_id
+            WHERE a.user_id = ?
+            ORDER BY a.created_at DESC, a.id DESC
+            LIMIT ?
+        ''', (user_id, RECENT_ACTIVITY_SIZE)).fetchall()
+        badges = cursor.execute('''
+            SELECT ub.id, ub.badge_name, ub.badge_icon, ub.badge_description, ub.campaign_id, ub.earned_at,
+                   c.title AS campaign_title
+            FROM user_badges ub
+            LEFT JOIN campaigns c ON c.id = ub.campaign_id
+            WHERE ub.user_id = ?
+            ORDER BY ub.earned_at DESC, ub.id DESC
+            LIMIT ?
+        ''', (user_id, RECENT_ACTIVITY_SIZE)).fetchall()
+        version, = cache_versions([('feed', user_id)])
+    entries = heapq.merge((activity_feed_entry(row, row['campaign_title']) for row in activities),
+                          (badge_feed_entry(row, row['campaign_title']) for row in badges),
+                          key=feed_order, reverse=True)
+    ring = ActivityRing(itertools.islice(entries, RECENT_ACTIVITY_SIZE), RECENT_ACTIVITY_SIZE, version)
+    cache.put(user_id, ring, since=since)
+    return ring.entries()[:limit]
+
+def remember_recent_activity(cursor, activities=(), badges=()):
+    """Add newly inserted activities and badges to their users' feeds; the caller commits
+
+    Each user's feed version is bumped with the write, which invalidates
+    the ring buffers other workers hold. Once it commits, this worker
+    appends the entries to its own ring if that ring was current up to the
+    write, and drops it otherwise.
+    """
+    if not activities and not badges:
+        return
+    campaign_ids = {row['campaign_id'] for row in [*activities, *badges] if row['campaign_id']}
+    titles = {}
+    if campaign_ids:
+        titles = dict(cursor.execute(f'''
+            SELECT id, title FROM campaigns WHERE id IN ({','.join('?' * len(campaign_ids))})
+        ''', list(campaign_ids)).fetchall())
+    entries = {}
+    for row in activities:
+        entries.setdefault(row['user_id'], []).append(activity_feed_entry(row, titles.get(row['campaign_id'])))
+    for row in badges:
+        entries.setdefault(row['user_id'], []).append(badge_feed_entry(row, titles.get(row['campaign_id'])))
+    written = invalidate_cache_tags([('feed', user_id) for user_id in entries])
+    cache = current_app.extensions['recent_activity_cache']
+    
+    def remember():
+        for user_id, added in entries.items():
+            ring = cache.peek(user_id)
+            version = written.get(cache_tag_name(('feed', user_id)))
+            if ring is None or version is None or not ring.advance(added, version):
+                # Also keeps a read already in flight from caching a feed without these entries
+                cache.invalidate([user_id])
+    after_commit(remember)
+
+def time_ago(timestamp, now=None):
+    """'5 minutes ago' style age of a 'YYYY-MM-DD HH:MM:SS' UTC timestamp"""
+    seconds = ((now or datetime.utcnow()) - datetime.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S')).total_seconds()
+    for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= size:
+            count = int(seconds // size)
+            return f"{count} {unit}{'s' if count > 1 else ''} ago"
+    return 'just now'
+
+# Campaign fields the dashboard cards show; descriptions are cut to what
+# the template displays so cached entries stay small
+DASHBOARD_CAMPAIGN_JSON = '''json_object(
+    'id', id, 'version', version, 'title', title, 'description', substr(description, 1, 101), 'image', image,
+    'date', date, 'location', location,
+    'volunteers_joined', volunteers_joined, 'volunteers_needed', volunteers_needed)'''
+
+def dashboard_summary(user_id):
+    """Stats, badges, upcoming and recommended campaigns and owned NGO for a user's dashboard
+
+    Computed in one query and served from the app's dashboard cache until
+    a join, completion, verification, badge or new campaign invalidates it.
+    Hits are checked against cache_versions, so a write in another worker
+    invalidates them too.
+    """
+    cache = current_app.extensions['dashboard_cache']
+    entry = cache.get(user_id, valid=versions_current)
+    if entry is not None:
+        return entry.value
+    
+    since = cache.token()
+    with read_snapshot() as cursor:
+        row = cursor.execute(f'''
+            SELECT u.eco_points, stats.campaigns_joined,
+                   MIN(100, stats.campaigns_joined * 20 + u.eco_points / 10) AS impact_score,
+                   (SELECT json_group_array(json_object('name', ub.badge_name, 'icon', COALESCE(ub.badge_icon, 'medal')))
+                    FROM user_badges ub WHERE ub.user_id = u.id) AS badges,
+                   (SELECT json_group_array({DASHBOARD_CAMPAIGN_JSON}) FROM (
+                        SELECT c.* FROM campaign_volunteers cv JOIN campaigns c ON c.id = cv.campaign_id
+                        WHERE cv.user_id = u.id AND c.status != 'completed'
+                        ORDER BY c.date ASC LIMIT 5
+                   ) upcoming) AS my_campaigns,
+                   (SELECT json_group_array(json_set({DASHBOARD_CAMPAIGN_JSON}, '$.rank', rank)) FROM (
+                        SELECT c.*, r.rank FROM campaign_recommendations r JOIN campaigns c ON c.id = r.campaign_id
+                        WHERE r.user_id = u.id AND c.status = 'upcoming' AND c.volunteers_joined < c.volunteers_needed
+                          AND NOT EXISTS (SELECT 1 FROM campaign_volunteers cv
+                                          WHERE cv.user_id = r.user_id AND cv.campaign_id = c.id)
+                        ORDER BY r.rank LIMIT 5
+                   ) recommended) AS recommended_campaigns,
+                   (SELECT json_object('id', n.id, 'name', n.name, 'description', n.description)
+                    FROM ngos n WHERE n.owner_id = u.id LIMIT 1) AS owned_ngo,
+                   (SELECT json_group_array({DASHBOARD_CAMPAIGN_JSON})
+                    FROM campaigns c WHERE c.ngo_id = (SELECT n.id FROM ngos n WHERE n.owner_id = u.id LIMIT 1)
+                   ) AS owned_campaigns
+            FROM users u,
+                 (SELECT COUNT(*) AS campaigns_joined FROM campaign_volunteers WHERE user_id = ?) stats
+            WHERE u.id = ?
+        ''', (user_id, user_id)).fetchone()
+        if row is None:
+            return None
+        badges = json.loads(row['badges'])
+        owned_ngo = json.loads(row['owned_ngo']) if row['owned_ngo'] else None
+        # json_group_array doesn't promise the subquery's order, so sort here
+        my_campaigns = sorted(json.loads(row['my_campaigns']), key=lambda c: c['date'])
+        owned_campaigns = sorted(json.loads(row['owned_campaigns']), key=lambda c: c['date'], reverse=True)
+        recommended_campaigns = sorted(json.loads(row['recommended_campaigns']), key=lambda c: c['rank'])
+        tags = [('campaign', c['id']) for c in my_campaigns + owned_campaigns + recommended_campaigns]
+        if owned_ngo:
+            tags.append(('ngo', owned_ngo['id']))
+        # Read in the row's snapshot, so a write committed since can't go unnoticed
+        versions = cache_versions([('user', user_id)] + tags)
+    
+    summary = {
+        'stats': {
+            'campaigns_joined': row['campaigns_joined'],
+            'eco_points': row['eco_points'],
+            'badges_count': len(badges),
+            'impact_score': row['impact_score'],
+        },
+        'badges': badges,
+        'my_campaigns': my_campaigns,
+        'owned_ngo': owned_ngo,
+        'owned_campaigns': owned_campaigns,
+        'recommended_campaigns': recommended_campaigns,
+    }
+    cache.put(user_id, Versioned(summary, [('user', user_id)] + tags, versions), tags, since)
+    return summary
+
+CachedPage = namedtuple('CachedPage', 'body mimetype etag last_modified')
+
+def invalidate_pages(*tags):
+    """Invalidate cached anonymous pages with any of these tags in every worker; this one drops them once it commits"""
+    invalidate_cache_tags(tags)
+    cache = current_app.extensions['page_cache']
+    def invalidate():
+        for tag in tags:
+            cache.invalidate_tag(tag)
+    after_commit(invalidate)
+
+def anonymous_page_headers(response, etag):
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    # Shared caches must not hand this page to signed-in users
+    response.vary.add('Cookie')
+    return response
+
+def cache_anonymous_page(tags):
+    """Serve a GET view to anonymous visitors from the app's page cache
+
+    tags is called with the view's arguments and returns the tags the
+    page depends on. The ETag is built from the path and the tags'
+    versions in cache_versions, so every worker agrees on it and a
+    conditional request gets a 304 without rendering anything.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Signed-in users and pending flash messages get a fresh render
+            if session:
+                return f(*args, **kwargs)
+            
+            key = request.full_path
+            page_tags = tags(**kwargs)
+            versions = cache_versions(page_tags)
+            etag = hashlib.sha256(json.dumps([key, [cache_tag_name(tag) for tag in page_tags], versions])
+                                  .encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                return anonymous_page_headers(current_app.response_class(status=304), etag)
+            
+            cache = current_app.extensions['page_cache']
+            page = cache.get(key, valid=lambda page: page.etag == etag)
+            if page is None:
+                since = cache.token()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                # A write that lands mid-render changes the versions, so the next request renders again
+                page = CachedPage(body, response.mimetype, etag, datetime.utcnow().replace(microsecond=0))
+                # One page may take at most a quarter of the budget
+                if len(body) <= PAGE_CACHE_MAX_BYTES // 4:
+                    cache.put(key, page, page_tags, since, size=len(body))
+            
+            response = make_response(page.body)
+            response.mimetype = page.mimetype
+            response.last_modified = page.last_modified
+            return anonymous_page_headers(response, etag).make_conditional(request)
+        return decorated_function
+    return decorator
+
+
+@bp.app_template_global()
+def campaign_card(kind, campaign, **extra):
+    """Render the named _campaign_cards.html macro for a campaign row or dict
+
+    Cards are cached by campaign id and version plus any extra arguments.
+    The trigger bumps version on every update, so a stale card is never
+    served and old ones just age out; rows without a version aren't cached.
+    """
+    macro = getattr(current_app.jinja_env.get_template('_campaign_cards.html').module, kind)
+    if 'version' not in campaign.keys():
+        return macro(campaign, **extra)
+    cache = current_app.extensions['card_cache']
+    key = (kind, campaign['id'], campaign['version'], *sorted(extra.items()))
+    card = cache.get(key)
+    if card is None:
+        card = macro(campaign, **extra)
+        cache.put(key, card, size=len(card))
+    return card
+
+def check_and_award_badges(user_id, changed=None):
+    """Check user's progress and award badges accordingly
+
+    changed maps a metric to the (before, after) values the caller just
+    applied; when given, rules are only evaluated if one of them crossed
+    a threshold.
+    """
+    if changed is not None:
+        crossed = any(rule.metric in changed
+                      and changed[rule.metric][0] < rule.threshold <= changed[rule.metric][1]
+                      for rule in BADGE_RULES)
+        if not crossed:
+            return []
+    return award_badges(get_db().cursor(), [user_id])
+
+def fts_terms(text):
+    """Turn free text into an FTS5 query of prefix terms"""
+    terms = re.findall(r'\w+', text or '')
+    return ' AND '.join(f'"{term}"*' for term in terms)
+
+GeoFilter = namedtuple('GeoFilter', 'lat lng south west north east radius')
+
+def parse_coordinates(latitude, longitude):
+    """Validate an optional latitude/longitude pair; (None, None) when both are blank"""
+    if not latitude and not longitude:
+        return None, None
+    try:
+        lat, lng = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError('latitude and longitude must both be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('latitude must be between -90 and 90 and longitude between -180 and 180')
+    return lat, lng
+
+def parse_geo_filter(args, home=None):
+    """Read a nearby search from request args; None if the request doesn't ask for one
+
+    Either lat/lng with an optional radius in km, or bbox=south,west,north,east
+    (distances then run from lat/lng, or the middle of the box). near=me
+    stands in for lat/lng with the location returned by home(), the
+    signed-in user's saved one. Boxes are clamped at the antimeridian
+    rather than wrapped. Raises ValueError on bad input.
+    """
+    if args.get('near') == 'me':
+        coordinates = home() if home else None
+        if not coordinates or None in coordinates:
+            raise ValueError('Add your location to your profile to search near you')
+        lat, lng = coordinates
+    else:
+        lat, lng = parse_coordinates(args.get('lat'), args.get('lng'))
+    
+    bbox = args.get('bbox')
+    if bbox:
+        corners = bbox.split(',')
+        if len(corners) != 4 or not all(corner.strip() for corner in corners):
+            raise ValueError('bbox must be south,west,north,east')
+        south, west = parse_coordinates(*corners[:2])
+        north, east = parse_coordinates(*corners[2:])
+        if south > north or west > east:
+            raise ValueError('bbox must be south,west,north,east')
+        if lat is None:
+            lat, lng = (south + north) / 2, (west + east) / 2
+        return GeoFilter(lat, lng, south, west, north, east, None)
+    if lat is None:
+        return None
+    
+    try:
+        radius = float(args.get('radius') or NEAR_RADIUS_KM)
+    except ValueError:
+        raise ValueError('radius must be a number of kilometres')
+    if not 0 < radius <= NEAR_MAX_RADIUS_KM:
+        raise ValueError(f'radius must be more than 0 and at most {NEAR_MAX_RADIUS_KM:g} km')
+    # Smallest box around the circle; it takes every longitude once it reaches a pole
+    angle = radius / EARTH_RADIUS_KM
+    south, north = lat - math.degrees(angle), lat + math.degrees(angle)
+    spread = math.sin(angle) / math.cos(math.radians(lat)) if -90 < south and north < 90 else 1
+    dlng = math.degrees(math.asin(spread)) if spread < 1 else 180
+    return GeoFilter(lat, lng, max(-90, south), max(-180, lng - dlng), min(90, north), min(180, lng + dlng), radius)
+
+def campaign_search_clause(search, category, location, geo=None):
+    """Build the FROM/WHERE clause and rank and distance expressions for campaign filters"""
+    from_clause = 'campaigns c'
+    # Finished campaigns drop out of every listing
+    where = ["c.status != 'completed'"]
+    params = []
+    rank = None
+    distance = None
+    
+    if geo:
+        # Narrow to the bounding box through the spatial index, then measure exact distances
+        if MATH_ENABLED:
+            measure = f'''{2 * EARTH_RADIUS_KM} * asin(min(1, sqrt(pow(sin(radians(latitude - ?) / 2), 2)
+                          + ? * cos(radians(latitude)) * pow(sin(radians(longitude - ?) / 2), 2))))'''
+            params.extend([geo.lat, math.cos(math.radians(geo.lat)), geo.lng])
+        else:
+            measure = 'distance_km(?, ?, latitude, longitude)'
+            params.extend([geo.lat, geo.lng])
+        if RTREE_ENABLED:
+            near = f'''(
+                SELECT id, {measure} AS distance FROM campaigns_geo
+                WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?
+            ) near'''
+        else:
+            near = f'''(
+                SELECT id, {measure} AS distance FROM campaigns
+                WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+            ) near'''
+        from_clause = f'{near} JOIN campaigns c ON c.id = near.id'
+        params.extend([geo.south, geo.north, geo.west, geo.east])
+        distance = 'near.distance'
+    
+    if FTS_ENABLED:
+        match = []
+        search_terms = fts_terms(search)
+        if search_terms:
+            match.append(f'{{title short_description description}} : ({search_terms})')
+        location_terms = fts_terms(location)
+        if location_terms:
+            match.append(f'location : ({location_terms})')
+        if match:
+            # bm25() is only valid inside the FTS scan, so rank in a subquery;
+            # title hits weigh more than short description, location and description
+            from_clause += ''' JOIN (
+                SELECT rowid AS id, bm25(campaigns_fts, 10.0, 5.0, 1.0, 2.0) AS search_rank
+                FROM campaigns_fts WHERE campaigns_fts MATCH ?
+            ) hits ON hits.id = c.id'''
+            params.append(' AND '.join(match))
+            rank = 'hits.search_rank'
+    else:
+        if search:
+            where.append('(c.title LIKE ? OR c.description LIKE ?)')
+            params.extend([f'%{search}%', f'%{search}%'])
+        if location:
+            where.append('c.location LIKE ?')
+            params.append(f'%{location}%')
+    
+    if category:
+        where.append('c.category = ?')
+        params.append(category)
+    
+    if geo and geo.radius:
+        where.append('near.distance <= ?')
+        params.append(geo.radius)
+    
+    return from_clause, where, params, rank, distance
+
+IMPORT_KINDS = ('campaigns', 'volunteers')
+IMPORT_FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'json': 'jsonl'}
+IMPORT_MIMETYPES = {'text/csv': 'csv', 'application/x-ndjson': 'jsonl', 'application/jsonl': 'jsonl'}
+IMPORT_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+IMPORT_TIME = re.compile(r'([01]\d|2[0-3]):[0-5]\d$')
+
+class ImportReport:
+    """Row counts and per-row errors for one bulk import"""
+    
+    def __init__(self, kind, max_errors=IMPORT_MAX_ERRORS):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+    
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': str(message)})
+    
+    def as_dict(self):
+        return {'kind': self.kind, 'rows': self.rows, 'imported': self.imported,
+                'error_count': self.error_count, 'errors': sorted(self.errors, key=lambda e: e['line']),
+                'errors_truncated': self.error_count > len(self.errors)}
+
+def import_format(filename, fmt=None):
+    """Resolve an explicit format or a file extension to 'csv' or 'jsonl'"""
+    return IMPORT_FORMATS.get((fmt or os.path.splitext(filename or '')[1].lstrip('.')).lower())
+
+def read_import_rows(stream, fmt):
+    """Yield (line, row, error) from a binary CSV or JSONL stream, one row at a time"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, None, 'more fields than the header'
+            else:
+                yield reader.line_num, row, None
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, None, f'invalid JSON: {e}'
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, 'expected a JSON object'
+
+def import_field(row, name):
+    value = row.get(name)
+    return '' if value is None else str(value).strip()
+
+def parse_campaign_row(row):
+    """Validate an imported campaign and return its column values; raises ValueError"""
+    values = {name: import_field(row, name) for name in
+              ('title', 'description', 'short_description', 'category', 'location', 'date', 'time', 'image')}
+    missing = [name for name in ('title', 'description', 'category', 'location', 'date') if not values[name]]
+    if missing:
+        raise ValueError(f'missing {", ".join(missing)}')
+    # strptime dominates the import's CPU time; these checks are much cheaper
+    try:
+        if not IMPORT_DATE.match(values['date']):
+            raise ValueError
+        datetime.fromisoformat(values['date'])
+    except ValueError:
+        raise ValueError('date must be YYYY-MM-DD')
+    if values['time'] and not IMPORT_TIME.match(values['time']):
+        raise ValueError('time must be HH:MM')
+    try:
+        needed = int(import_field(row, 'volunteers_needed'))
+    except ValueError:
+        raise ValueError('volunteers_needed must be a whole number')
+    if needed < 1:
+        raise ValueError('volunteers_needed must be at least 1')
+    # A JSON list, or text with one requirement per line or separated by ';'
+    requirements = row.get('requirements') or []
+    if not isinstance(requirements, list):
+        requirements = re.split(r'[\n;]', str(requirements))
+    requirements = [str(r).strip() for r in requirements if str(r).strip()]
+    latitude, longitude = parse_coordinates(import_field(row, 'latitude'), import_field(row, 'longitude'))
+    return (values['title'], values['description'], values['short_description'] or None,
+            values['category'].lower(), values['location'], values['date'], values['time'] or None,
+            needed, values['image'] or None, json.dumps(requirements), latitude, longitude)
+
+def import_campaigns(rows, ngo_id, chunk_size=IMPORT_CHUNK_SIZE):
+    """Insert campaigns for an NGO in chunked transactions"""
+    report = ImportReport('campaigns')
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.rows += len(chunk)
+        params = []
+        for line, row, error in chunk:
+            try:
+                if error:
+                    raise ValueError(error)
+                params.append(parse_campaign_row(row) + (ngo_id,))
+            except ValueError as e:
+                report.error(line, e)
+        if not params:
+            continue
+        with write_transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO campaigns (title, description, short_description, category, location, date, time,
+                                       volunteers_needed, image, requirements, latitude, longitude, ngo_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', params)
+            # AUTOINCREMENT ids only grow, so under the write lock the new rows are the newest
+            last_id = cursor.execute('SELECT MAX(id) FROM campaigns').fetchone()[0]
+            invalidate_dashboards(ngo_id=ngo_id)
+            invalidate_pages('campaigns', *[('campaign', campaign_id)
+                                            for campaign_id in range(last_id - len(params) + 1, last_id + 1)])
+        report.imported += len(params)
+    return report
+
+def import_volunteers(rows, ngo_id, chunk_size=IMPORT_CHUNK_SIZE):
+    """Add volunteers to an NGO's campaigns in chunked transactions
+
+    Rows name a campaign_id and the volunteer by email or user_id. Seats
+    are checked against volunteers_needed, campaigns that have ended are
+    refused, volunteers_joined moves with the rows inserted, and each join
+    earns the usual points and rescores the volunteer's recommendations.
+    """
+    report = ImportReport('volunteers')
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.rows += len(chunk)
+        parsed = []
+        for line, row, error in chunk:
+            try:
+                if error:
+                    raise ValueError(error)
+                campaign_id = import_field(row, 'campaign_id')
+                user_id = import_field(row, 'user_id')
+                email = import_field(row, 'email')
+                if not campaign_id.isdigit():
+                    raise ValueError('campaign_id must be a campaign id')
+                if not (email or user_id.isdigit()):
+                    raise ValueError('give the volunteer as email or user_id')
+                parsed.append((line, int(campaign_id), int(user_id) if user_id.isdigit() else None, email))
+            except ValueError as e:
+                report.error(line, e)
+        if not parsed:
+            continue
+        
+        with write_transaction() as cursor:
+            emails = list({email for _, _, user_id, email in parsed if user_id is None})
+            by_email = {}
+            for start in range(0, len(emails), 500):
+                part = emails[start:start + 500]
+                by_email.update(cursor.execute(f'''
+                    SELECT email, id FROM users WHERE email IN ({','.join('?' * len(part))})
+                ''', part).fetchall())
+            ids = list({user_id for _, _, user_id, _ in parsed if user_id is not None})
+            known = set()
+            for start in range(0, len(ids), 500):
+                part = ids[start:start + 500]
+                known.update(row[0] for row in cursor.execute(f'''
+                    SELECT id FROM users WHERE id IN ({','.join('?' * len(part))})
+                ''', part))
+            
+            campaign_ids = list({campaign_id for _, campaign_id, _, _ in parsed})
+            campaigns = {row['id']: row for row in cursor.execute(f'''
+                SELECT id, title, status, volunteers_needed - volunteers_joined AS seats FROM campaigns
+                WHERE ngo_id = ? AND id IN ({','.join('?' * len(campaign_ids))})
+            ''', [ngo_id] + campaign_ids)}
+            seats = {campaign_id: row['seats'] for campaign_id, row in campaigns.items()}
+            
+            resolved = [(line, campaign_id, by_email.get(email) if user_id is None else
+                         user_id if user_id in known else None)
+                        for line, campaign_id, user_id, email in parsed]
+            user_ids = list({user_id for _, _, user_id in resolved if user_id is not None})
+            taken = set()
+            for start in range(0, len(user_ids), 500):
+                part = user_ids[start:start + 500]
+                taken.update((row[0], row[1]) for row in cursor.execute(f'''
+                    SELECT campaign_id, user_id FROM campaign_volunteers
+                    WHERE user_id IN ({','.join('?' * len(part))})
+                ''', part) if row[0] in campaigns)
+            
+            joins = []
+            for line, campaign_id, user_id in resolved:
+                if campaign_id not in campaigns:
+                    report.error(line, f'campaign {campaign_id} not found for this NGO')
+                elif campaigns[campaign_id]['status'] == 'completed':
+                    report.error(line, f'campaign {campaign_id} has already ended')
+                elif user_id is None:
+                    report.error(line, 'volunteer not found')
+                elif (campaign_id, user_id) in taken:
+                    report.error(line, 'volunteer already joined this campaign')
+                elif seats[campaign_id] <= 0:
+                    report.error(line, 'campaign is full')
+                else:
+                    taken.add((campaign_id, user_id))
+                    seats[campaign_id] -= 1
+                    joins.append((campaign_id, user_id))
+            if not joins:
+                continue
+            
+            cursor.executemany('''
+                INSERT INTO campaign_volunteers (campaign_id, user_id, status) VALUES (?, ?, 'joined')
+            ''', joins)
+            added = {}
+            for campaign_id, user_id in joins:
+                added.setdefault(campaign_id, []).append(user_id)
+            cursor.executemany('''
+                UPDATE campaigns SET volunteers_joined = volunteers_joined + ? WHERE id = ?
+            ''', [(len(users), campaign_id) for campaign_id, users in added.items()])
+            publish_campaign_events(cursor, [(campaign_id, 'volunteers', None) for campaign_id in added])
+            
+            record_activities([ActivityEvent(user_id, 'campaign_joined',
+                                             f'Joined campaign: {campaigns[campaign_id]["title"]}', 10, campaign_id)
+                               for campaign_id, user_id in joins])
+            award_badges(cursor, {user_id for _, user_id in joins})
+            # Their affinities just changed, so rescore what we suggest next
+            refresh_recommendations(cursor, {user_id for _, user_id in joins})
+            for campaign_id, users in added.items():
+                invalidate_dashboards(users, campaign_id=campaign_id)
+                invalidate_pages(('campaign', campaign_id))
+            invalidate_pages('campaigns')
+        report.imported += len(joins)
+    return report
 
-def check_and_award_badges(user_id):
-    """Check user's progress and award badges accordingly"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get user stats
-    campaigns_completed = cursor.execute('''
-        SELECT COUNT(*) FROM campaign_completions WHERE user_id = ?
-    ''', (user_id,)).fetchone()[0]
-    
-    total_points = cursor.execute('''
-        SELECT eco_points FROM users WHERE id = ?
-    ''', (user_id,)).fetchone()[0] or 0
-    
-    # Award badges based on milestones
-    if campaigns_completed >= 1:
-        award_badge(user_id, 'First Steps', 'seedling', 'Completed your first campaign!')
-    if campaigns_completed >= 5:
-        award_badge(user_id, 'Eco Warrior', 'shield-alt', 'Completed 5 campaigns!')
-    if campaigns_completed >= 10:
-        award_badge(user_id, 'Green Champion', 'trophy', 'Completed 10 campaigns!')
-    if campaigns_completed >= 25:
-        award_badge(user_id, 'Environmental Hero', 'medal', 'Completed 25 campaigns!')
-    
-    if total_points >= 100:
-        award_badge(user_id, 'Point Collector', 'coins', 'Earned 100 eco points!')
-    if total_points >= 500:
-        award_badge(user_id, 'Point Master', 'star', 'Earned 500 eco points!')
-    if total_points >= 1000:
-        award_badge(user_id, 'Point Legend', 'crown', 'Earned 1000 eco points!')
-    
-    conn.close()
+def run_import(kind, stream, fmt, ngo_id):
+    """Stream-parse an upload and import it as campaigns or volunteers"""
+    rows = read_import_rows(stream, fmt)
+    if kind == 'campaigns':
+        return import_campaigns(rows, ngo_id)
+    return import_volunteers(rows, ngo_id)
+
+# Exports
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+EXPORT_EXTENSIONS = {'csv': 'csv', 'jsonl': 'jsonl'}
+
+def csv_cell(value):
+    # Spreadsheets run cells starting with these as formulas
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+def export_rows(cursor, fmt, fetch_size=EXPORT_FETCH_SIZE):
+    """Yield an executed query's rows as CSV or NDJSON text, one fetchmany() batch at a time"""
+    columns = [column[0] for column in cursor.description]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow([csv_cell(value) for value in row])
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+    cursor.close()
+
+def export_response(filename, fmt, sql, params):
+    """Stream the rows of sql as a CSV or NDJSON download without loading them all"""
+    cursor = get_db().execute(sql, params)
+    # The request context (and its pooled connection) stays open until the last row is sent
+    response = current_app.response_class(stream_with_context(export_rows(cursor, fmt)),
+                                          mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{EXPORT_EXTENSIONS[fmt]}"'
+    return response
 
 # Authentication decorator
 def login_required(f):
@@ -273,7 +3046,7 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please login to access this page', 'error')
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('.login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -282,17 +3055,62 @@ def ngo_login_required(f):
     def decorated_function(*args, **kwargs):
         if 'ngo_id' not in session:
             flash('Please login as NGO to access this page', 'error')
-            return redirect(url_for('ngo_login'))
+            return redirect(url_for('.ngo_login'))
         return f(*args, **kwargs)
     return decorated_function
 
+# Request metrics
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+    g.db_rows = 0
+
+@bp.before_app_request
+def start_campaign_scheduler():
+    """Start this worker's lifecycle thread on its first request"""
+    # Tests drive advance_campaigns() themselves
+    if not current_app.testing:
+        current_app.extensions['campaign_scheduler'].ensure_started()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    """Feed /metrics and, when enabled, report the request's SQL cost in headers"""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    current_app.extensions['metrics'].observe_request(route, request.method, response.status_code,
+                                                      time.perf_counter() - started, g.db_queries, g.db_time, g.db_rows)
+    if SQL_DEBUG_HEADERS or current_app.debug:
+        response.headers['X-DB-Queries'] = str(g.db_queries)
+        response.headers['X-DB-Time'] = f'{g.db_time * 1000:.3f}ms'
+    return response
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Request, SQL, cache, activity-writer, scheduler and live-event metrics in Prometheus text format
+
+    Each worker process keeps its own numbers; scrape every worker.
+    """
+    return current_app.extensions['metrics'].render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@bp.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    """Sign-ins and signups back off while the hashing pool is saturated"""
+    template = request.endpoint.rsplit('.', 1)[-1] + '.html'
+    response = make_response(render_template(template, error='We are busy right now, please try again in a moment'), 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
     """Home page"""
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Login page"""
     if request.method == 'POST':
@@ -306,9 +3124,8 @@ def login():
         conn = get_db()
         cursor = conn.cursor()
         user = cursor.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-        conn.close()
         
-        if user and check_password_hash(user['password'], password):
+        if user and check_password('users', user, password):
             session['user_id'] = user['id']
             session['user_name'] = user['name']
             session['user_email'] = user['email']
@@ -316,13 +3133,13 @@ def login():
             next_page = request.args.get('next')
             if next_page:
                 return redirect(next_page)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('.dashboard'))
         else:
             return render_template('login.html', error='Invalid email or password')
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """Register page"""
     if request.method == 'POST':
@@ -343,25 +3160,35 @@ def register():
         if len(password) < 6:
             return render_template('register.html', error='Password must be at least 6 characters')
         
+        try:
+            latitude, longitude = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+        except ValueError as e:
+            return render_template('register.html', error=str(e))
+        
         conn = get_db()
         cursor = conn.cursor()
         
         # Check if email already exists
         existing_user = cursor.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
         if existing_user:
-            conn.close()
             return render_template('register.html', error='Email already registered')
         
-        # Create user
-        hashed_password = generate_password_hash(password)
-        cursor.execute('''
-            INSERT INTO users (name, email, phone, location, password)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, email, phone, location, hashed_password))
-        
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Create user; hash before queueing for the writer, then re-check the email under its lock
+        hashed_password = hash_password(password)
+        with write_transaction() as cursor:
+            if cursor.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone():
+                return render_template('register.html', error='Email already registered')
+            cursor.execute('''
+                INSERT INTO users (name, email, phone, location, password, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (name, email, phone, location, hashed_password, latitude, longitude))
+            
+            user_id = cursor.lastrowid
+            cursor.execute('''
+                INSERT INTO leaderboard_entries (board, user_id, location)
+                VALUES ('all', ?, lower(trim(?)))
+            ''', (user_id, location))
+            invalidate_pages('leaderboard')
         
         # Auto login after registration
         session['user_id'] = user_id
@@ -369,125 +3196,100 @@ def register():
         session['user_email'] = email
         
         flash('Registration successful!', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     return render_template('register.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Logout"""
     session.clear()
     flash('You have been logged out', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
     """User dashboard"""
     user_id = session['user_id']
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get user info
-    user = cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    
-    # Get user's campaigns
-    my_campaigns = cursor.execute('''
-        SELECT c.* FROM campaigns c
-        INNER JOIN campaign_volunteers cv ON c.id = cv.campaign_id
-        WHERE cv.user_id = ? AND c.status != 'completed'
-        ORDER BY c.date ASC
-        LIMIT 5
-    ''', (user_id,)).fetchall()
-    
-    # Get stats
-    campaigns_joined = cursor.execute('''
-        SELECT COUNT(*) FROM campaign_volunteers WHERE user_id = ?
-    ''', (user_id,)).fetchone()[0]
+    summary = dashboard_summary(user_id)
+    if summary is None:
+        session.clear()
+        return redirect(url_for('.login'))
     
-    eco_points = user['eco_points'] if user else 0
-    
-    badges_count = cursor.execute('''
-        SELECT COUNT(*) FROM user_badges WHERE user_id = ?
-    ''', (user_id,)).fetchone()[0]
-    
-    # Calculate impact score (simplified)
-    impact_score = min(100, (campaigns_joined * 20) + (eco_points // 10))
-    
-    # Get badges
-    badges = cursor.execute('''
-        SELECT badge_name, badge_icon FROM user_badges WHERE user_id = ?
-    ''', (user_id,)).fetchall()
-    
-    # Get recent activity (simplified)
-    recent_activity = [
-        {'title': 'Joined Campaign', 'description': 'You joined a new campaign', 'timestamp': '2 hours ago'},
-        {'title': 'Earned Badge', 'description': 'You earned the Eco Warrior badge', 'timestamp': '1 day ago'},
-    ]
-    
-    # Check if user owns an NGO
-    owned_ngo = cursor.execute('SELECT * FROM ngos WHERE owner_id = ?', (user_id,)).fetchone()
-    owned_campaigns = []
-    
-    if owned_ngo:
-        owned_campaigns = cursor.execute('''
-            SELECT * FROM campaigns WHERE ngo_id = ? ORDER BY date DESC
-        ''', (owned_ngo['id'],)).fetchall()
-    
-    conn.close()
+    feed = [dict(entry, timestamp=time_ago(entry['created_at'])) for entry in recent_activity(user_id)]
     
     return render_template('dashboard.html',
                          user={'id': user_id, 'name': session['user_name'], 'email': session['user_email']},
-                         my_campaigns=my_campaigns,
-                         owned_ngo=owned_ngo,
-                         owned_campaigns=owned_campaigns,
-                         stats={
-                             'campaigns_joined': campaigns_joined,
-                             'eco_points': eco_points,
-                             'badges_count': badges_count,
-                             'impact_score': impact_score
-                         },
-                         badges=[{'name': b['badge_name'], 'icon': b['badge_icon'] or 'medal'} for b in badges],
-                         recent_activity=recent_activity)
-
-@app.route('/campaigns')
+                         my_campaigns=summary['my_campaigns'],
+                         owned_ngo=summary['owned_ngo'],
+                         owned_campaigns=summary['owned_campaigns'],
+                         stats=summary['stats'],
+                         badges=summary['badges'],
+                         recommended_campaigns=summary['recommended_campaigns'],
+                         recent_activity=feed)
+
+@bp.route('/campaigns')
+@cache_anonymous_page(lambda: ['campaigns'])
 def campaigns():
     """Campaigns listing page"""
     search = request.args.get('search', '')
     category = request.args.get('category', '')
     location = request.args.get('location', '')
-    page = int(request.args.get('page', 1))
+    page = max(1, request.args.get('page', 1, type=int))
     per_page = 9
     
     conn = get_db()
     cursor = conn.cursor()
     
-    # Build query
-    query = 'SELECT * FROM campaigns WHERE 1=1'
-    params = []
-    
-    if search:
-        query += ' AND (title LIKE ? OR description LIKE ?)'
-        params.extend([f'%{search}%', f'%{search}%'])
+    error = None
+    try:
+        geo = parse_geo_filter(request.args, home_coordinates)
+    except ValueError as e:
+        error = str(e)
+        geo = None
     
-    if category:
-        query += ' AND category = ?'
-        params.append(category)
+    from_clause, where, params, rank, distance = campaign_search_clause(search, category, location, geo)
+    where_clause = ' WHERE ' + ' AND '.join(where) if where else ''
     
-    if location:
-        query += ' AND location LIKE ?'
-        params.append(f'%{location}%')
+    total = None
+    if not (search or category or location or geo):
+        # A window count would materialize every open campaign, so count them
+        # off the partial listing index, which holds exactly the rows listed
+        total = cursor.execute('''
+            SELECT COUNT(*) FROM campaigns INDEXED BY idx_campaigns_active_listing
+            WHERE status != 'completed'
+        ''').fetchone()[0]
+        page = min(page, max(1, (total + per_page - 1) // per_page))
     
-    # Get total count
-    count_query = query.replace('SELECT *', 'SELECT COUNT(*)')
-    total = cursor.execute(count_query, params).fetchone()[0]
+    # Searches match few enough rows for a window count to return the total alongside the page
+    query = 'SELECT c.*'
+    if total is None:
+        query += ', COUNT(*) OVER () AS total_count'
+    if distance:
+        query += f', {distance} AS distance'
+    query += f' FROM {from_clause}{where_clause}'
     
-    # Get paginated results
-    query += ' ORDER BY featured DESC, date ASC LIMIT ? OFFSET ?'
-    params.extend([per_page, (page - 1) * per_page])
+    # Nearby searches list the closest campaigns first
+    if distance:
+        order = [distance, 'c.id']
+    else:
+        order = ['c.featured DESC', 'c.date ASC', 'c.id']
+        if rank:
+            order.insert(0, rank)
+    query += ' ORDER BY ' + ', '.join(order) + ' LIMIT ? OFFSET ?'
     
-    campaigns_list = cursor.execute(query, params).fetchall()
-    conn.close()
+    campaigns_list = cursor.execute(query, params + [per_page, (page - 1) * per_page]).fetchall()
+    if total is None:
+        if campaigns_list:
+            total = campaigns_list[0]['total_count']
+        else:
+            # Past the last page no row carries the count, so count
+            # separately and show the last page instead
+            total = cursor.execute(f'SELECT COUNT(*) FROM {from_clause}{where_clause}', params).fetchone()[0]
+            if total and page > 1:
+                page = (total + per_page - 1) // per_page
+                campaigns_list = cursor.execute(query, params + [per_page, (page - 1) * per_page]).fetchall()
     
     total_pages = max(1, (total + per_page - 1) // per_page) if total > 0 else 1
     
@@ -495,12 +3297,141 @@ def campaigns():
                          campaigns=campaigns_list,
                          current_page=page,
                          total_pages=total_pages,
+                         next_offset=page * per_page if page < total_pages else None,
                          search=search,
                          category=category,
                          location=location,
+                         geo=geo,
+                         error=error,
+                         geo_args={name: request.args[name] for name in ('lat', 'lng', 'radius', 'bbox', 'near')
+                                   if geo and request.args.get(name)},
                          user={'id': session.get('user_id'), 'name': session.get('user_name')} if 'user_id' in session else None)
 
-@app.route('/campaigns/<int:campaign_id>')
+def home_coordinates():
+    """The signed-in user's saved (latitude, longitude), or None"""
+    if 'user_id' not in session:
+        return None
+    row = get_db().execute('SELECT latitude, longitude FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+    return (row['latitude'], row['longitude']) if row else None
+
+def encode_cursor(values):
+    """Pack keyset values into an opaque URL-safe cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Unpack a cursor made by encode_cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+@bp.route('/api/campaigns')
+def api_campaigns():
+    """Campaigns JSON API with cursor pagination for infinite scroll
+
+    Listings and nearby searches seek past the last row they returned;
+    text searches are ordered by relevance like the HTML listing.
+    """
+    search = request.args.get('search', '')
+    category = request.args.get('category', '')
+    location = request.args.get('location', '')
+    cursor_arg = request.args.get('cursor')
+    try:
+        limit = min(50, max(1, int(request.args.get('limit', 9))))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    try:
+        geo = parse_geo_filter(request.args, home_coordinates)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    from_clause, where, params, rank, distance = campaign_search_clause(search, category, location, geo)
+    # Searches rank like the HTML listing. bm25 scores make a poor seek key,
+    # so a ranked search's cursor carries its offset instead
+    ranked = rank is not None and not distance
+    
+    # Seek past the last row of the previous page on (featured DESC, date ASC, id ASC),
+    # or on (distance, id) for nearby searches
+    seek = None
+    if cursor_arg:
+        after = decode_cursor(cursor_arg)
+        if not after or len(after) != (1 if ranked else 2 if distance else 3):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if ranked:
+            offset = after[0]
+            if not isinstance(offset, int) or offset < 0:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        elif distance:
+            last_distance, last_id = after
+            where.append(f'({distance} > ? OR ({distance} = ? AND c.id > ?))')
+            params.extend([last_distance, last_distance, last_id])
+        else:
+            featured, date, last_id = after
+            # Mixed sort directions rule out one row value, so seek the rest of
+            # this featured value and the start of the lower ones separately
+            seek = [('c.featured = ? AND (c.date, c.id) > (?, ?)', [featured, date, last_id]),
+                    ('c.featured < ?', [featured])]
+    
+    columns = '''c.id, c.title, c.short_description, c.description, c.category, c.location, c.date, c.time, c.status,
+                  c.volunteers_needed, c.volunteers_joined, c.featured, c.image, c.latitude, c.longitude'''
+    if distance:
+        columns += f', {distance} AS distance_km'
+    query = f'SELECT {columns} FROM {from_clause}'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    if seek:
+        # Each branch is a SEARCH of the listing index that stops after a page;
+        # an OR of them would walk the index from the start instead
+        branches = []
+        branch_params = []
+        for predicate, values in seek:
+            branches.append(f'''SELECT * FROM ({query} AND {predicate}
+                                ORDER BY c.featured DESC, c.date ASC, c.id ASC LIMIT ?)''')
+            branch_params.extend(params + values + [limit + 1])
+        query = ' UNION ALL '.join(branches) + ' ORDER BY featured DESC, date ASC, id ASC LIMIT ?'
+        params = branch_params
+    elif distance:
+        query += f' ORDER BY {distance}, c.id LIMIT ?'
+    elif ranked:
+        query += f' ORDER BY {rank}, c.featured DESC, c.date ASC, c.id ASC LIMIT ?'
+    else:
+        query += ' ORDER BY c.featured DESC, c.date ASC, c.id ASC LIMIT ?'
+    params.append(limit + 1)
+    # Legacy clients only know how many cards they already show
+    if ranked or (offset and not cursor_arg):
+        query += ' OFFSET ?'
+        params.append(offset)
+    
+    rows = cursor.execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        if ranked:
+            next_cursor = encode_cursor([offset + limit])
+        elif distance:
+            next_cursor = encode_cursor([last['distance_km'], last['id']])
+        else:
+            next_cursor = encode_cursor([last['featured'], last['date'], last['id']])
+    
+    return jsonify({
+        'campaigns': [dict(row) for row in rows],
+        'has_more': has_more,
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/campaigns/<int:campaign_id>')
+@cache_anonymous_page(lambda campaign_id: [('campaign', campaign_id)])
 def campaign_detail(campaign_id):
     """Campaign detail page"""
     conn = get_db()
@@ -509,7 +3440,6 @@ def campaign_detail(campaign_id):
     campaign = cursor.execute('SELECT * FROM campaigns WHERE id = ?', (campaign_id,)).fetchone()
     
     if not campaign:
-        conn.close()
         return render_template('campaign_detail.html', campaign=None)
     
     # Get NGO info if exists
@@ -525,14 +3455,16 @@ def campaign_detail(campaign_id):
         LIMIT 10
     ''', (campaign_id,)).fetchall()
     
-    # Check if user joined
+    # Check if user joined, and what else they might like
     user_joined = False
+    recommended = []
     if 'user_id' in session:
         joined = cursor.execute('''
             SELECT id FROM campaign_volunteers 
             WHERE campaign_id = ? AND user_id = ?
         ''', (campaign_id, session['user_id'])).fetchone()
         user_joined = joined is not None
+        recommended = recommended_campaigns(cursor, session['user_id'], limit=3, exclude=campaign_id)
     
     # Parse requirements
     requirements = []
@@ -542,17 +3474,27 @@ def campaign_detail(campaign_id):
         except:
             requirements = []
     
-    conn.close()
-    
     return render_template('campaign_detail.html',
                          campaign=campaign,
                          ngo=ngo,
                          volunteers=volunteers,
                          user_joined=user_joined,
+                         recommended=recommended,
                          user={'id': session.get('user_id'), 'name': session.get('user_name')} if 'user_id' in session else None,
                          requirements=requirements)
 
-@app.route('/ngo/register', methods=['GET', 'POST'])
+@bp.route('/campaigns/<int:campaign_id>/events')
+def campaign_events(campaign_id):
+    """Live volunteer counts, joins and completions for one campaign as Server-Sent Events
+
+    Streams are for signed-in volunteers; each one holds a connection open,
+    and anonymous visitors get the cached page instead.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Sign in to follow live updates'}), 401
+    return stream_campaign_events(('campaign', campaign_id))
+
+@bp.route('/ngo/register', methods=['GET', 'POST'])
 @login_required
 def register_ngo():
     """Register a new NGO"""
@@ -564,26 +3506,22 @@ def register_ngo():
         if not all([name, contact]):
             return render_template('register_ngo.html', error='Please fill in name and contact')
             
-        conn = get_db()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO ngos (name, description, contact, owner_id)
-                VALUES (?, ?, ?, ?)
-            ''', (name, description, contact, session['user_id']))
-            conn.commit()
+            with write_transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO ngos (name, description, contact, owner_id)
+                    VALUES (?, ?, ?, ?)
+                ''', (name, description, contact, session['user_id']))
+                invalidate_dashboards([session['user_id']])
             flash('NGO registered successfully!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('.dashboard'))
         except Exception as e:
             flash(f'Error registering NGO: {e}', 'error')
             return render_template('register_ngo.html')
-        finally:
-            conn.close()
             
     return render_template('register_ngo.html')
 
-@app.route('/campaign/create', methods=['GET', 'POST'])
+@bp.route('/campaign/create', methods=['GET', 'POST'])
 @login_required
 def create_campaign():
     """Create a new campaign"""
@@ -594,9 +3532,8 @@ def create_campaign():
     ngo = cursor.execute('SELECT * FROM ngos WHERE owner_id = ?', (session['user_id'],)).fetchone()
     
     if not ngo:
-        conn.close()
         flash('You must register an NGO to create campaigns', 'error')
-        return redirect(url_for('register_ngo'))
+        return redirect(url_for('.register_ngo'))
         
     if request.method == 'POST':
         title = request.form.get('title')
@@ -615,23 +3552,24 @@ def create_campaign():
         req_json = json.dumps(req_list)
         
         try:
-            cursor.execute('''
-                INSERT INTO campaigns (title, description, short_description, category, location, date, time, 
-                                     volunteers_needed, ngo_id, image, requirements)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (title, desc, short_desc, category, location, date, time, needed, ngo['id'], image, req_json))
-            conn.commit()
+            latitude, longitude = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+            with write_transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO campaigns (title, description, short_description, category, location, date, time, 
+                                         volunteers_needed, ngo_id, image, requirements, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (title, desc, short_desc, category, location, date, time, needed, ngo['id'], image, req_json,
+                      latitude, longitude))
+                invalidate_dashboards(ngo_id=ngo['id'])
+                invalidate_pages('campaigns', ('campaign', cursor.lastrowid))
             flash('Campaign created successfully!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('.dashboard'))
         except Exception as e:
             flash(f'Error creating campaign: {e}', 'error')
-        finally:
-            conn.close()
             
-    conn.close()
     return render_template('create_campaign.html')
 
-@app.route('/campaign/<int:campaign_id>/manage')
+@bp.route('/campaign/<int:campaign_id>/manage')
 @ngo_login_required
 def manage_campaign(campaign_id):
     """Manage campaign volunteers"""
@@ -645,9 +3583,8 @@ def manage_campaign(campaign_id):
     ''', (campaign_id, session['ngo_id'])).fetchone()
     
     if not campaign:
-        conn.close()
         flash('Access denied', 'error')
-        return redirect(url_for('ngo_dashboard'))
+        return redirect(url_for('.ngo_dashboard'))
         
     # Get volunteers with status and completion info
     volunteers = cursor.execute('''
@@ -660,139 +3597,188 @@ def manage_campaign(campaign_id):
         ORDER BY cv.joined_at DESC
     ''', (campaign_id,)).fetchall()
     
-    conn.close()
     return render_template('manage_campaign.html', campaign=campaign, volunteers=volunteers)
 
-@app.route('/campaign/<int:campaign_id>/verify/<int:user_id>', methods=['POST'])
+@bp.route('/campaign/<int:campaign_id>/export')
 @ngo_login_required
-def verify_volunteer(campaign_id, user_id):
-    """Verify volunteer completion and award points/badges"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Verify ownership
-    campaign = cursor.execute('''
-        SELECT c.* FROM campaigns c 
-        WHERE c.id = ? AND c.ngo_id = ?
-    ''', (campaign_id, session['ngo_id'])).fetchone()
+def export_campaign_volunteers(campaign_id):
+    """Download a campaign's volunteers with their completion and verification status"""
+    fmt = import_format(None, request.args.get('format', 'csv'))
+    if not fmt:
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
     
+    conn = get_db()
+    campaign = conn.execute('SELECT id FROM campaigns WHERE id = ? AND ngo_id = ?',
+                            (campaign_id, session['ngo_id'])).fetchone()
     if not campaign:
-        conn.close()
         flash('Access denied', 'error')
-        return redirect(url_for('ngo_dashboard'))
-    
-    # Mark as verified in completions
-    cursor.execute('''
-        UPDATE campaign_completions 
-        SET verified_by_ngo = 1, verified_by = ?
-        WHERE campaign_id = ? AND user_id = ?
-    ''', (session['ngo_id'], campaign_id, user_id))
-    
-    # Update volunteer status
-    cursor.execute('''
-        UPDATE campaign_volunteers 
-        SET status = 'verified' 
-        WHERE campaign_id = ? AND user_id = ?
-    ''', (campaign_id, user_id))
-    
-    # Award bonus points for verification
-    log_activity(user_id, 'campaign_verified', f'Campaign verified by NGO: {campaign["title"]}', 10, campaign_id)
-    
-    # Check for badges
-    check_and_award_badges(user_id)
+        return redirect(url_for('.ngo_dashboard'))
     
-    conn.commit()
-    conn.close()
+    return export_response(f'campaign-{campaign_id}-volunteers', fmt, '''
+        SELECT cv.user_id, u.name, u.email, u.phone, u.location, cv.status, cv.joined_at,
+               cc.completed_at, COALESCE(cc.verified_by_ngo, 0) AS verified, cc.verified_by
+        FROM campaign_volunteers cv
+        JOIN users u ON u.id = cv.user_id
+        LEFT JOIN campaign_completions cc ON cc.campaign_id = cv.campaign_id AND cc.user_id = cv.user_id
+        WHERE cv.campaign_id = ?
+        ORDER BY cv.joined_at, cv.id
+    ''', (campaign_id,))
+
+@bp.route('/campaign/<int:campaign_id>/verify/<int:user_id>', methods=['POST'])
+@ngo_login_required
+def verify_volunteer(campaign_id, user_id):
+    """Verify volunteer completion and award points/badges"""
+    with write_transaction() as cursor:
+        # Verify ownership
+        campaign = cursor.execute('''
+            SELECT c.* FROM campaigns c 
+            WHERE c.id = ? AND c.ngo_id = ?
+        ''', (campaign_id, session['ngo_id'])).fetchone()
+        
+        if not campaign:
+            flash('Access denied', 'error')
+            return redirect(url_for('.ngo_dashboard'))
+        
+        # Mark as verified in completions, only once per volunteer
+        cursor.execute('''
+            UPDATE campaign_completions 
+            SET verified_by_ngo = 1, verified_by = ?
+            WHERE campaign_id = ? AND user_id = ? AND verified_by_ngo = 0
+        ''', (session['ngo_id'], campaign_id, user_id))
+        
+        if cursor.rowcount == 0:
+            flash('Volunteer has not completed this campaign or is already verified', 'error')
+            return redirect(url_for('.manage_campaign', campaign_id=campaign_id))
+        
+        # Update volunteer status
+        cursor.execute('''
+            UPDATE campaign_volunteers 
+            SET status = 'verified' 
+            WHERE campaign_id = ? AND user_id = ?
+        ''', (campaign_id, user_id))
+        publish_campaign_events(cursor, [(campaign_id, 'verified', user_id)])
+        
+        # Award bonus points for verification
+        eco_points = log_activity(user_id, 'campaign_verified', f'Campaign verified by NGO: {campaign["title"]}', 10, campaign_id)
+        
+        # Check for badges
+        check_and_award_badges(user_id, {'eco_points': (eco_points - 10, eco_points)} if eco_points else None)
     
     flash('Volunteer verified successfully!', 'success')
-    return redirect(url_for('manage_campaign', campaign_id=campaign_id))
-
-def check_badges(user_id, cursor):
-    """Check and award badges based on stats"""
-    # Count completed campaigns
-    count = cursor.execute('''
-        SELECT COUNT(*) FROM campaign_volunteers 
-        WHERE user_id = ? AND status = 'completed'
-    ''', (user_id,)).fetchone()[0]
-    
-    badges_to_award = []
-    
-    if count >= 1:
-        badges_to_award.append(('First Step', 'seedling'))
-    if count >= 5:
-        badges_to_award.append(('High Five', 'hand-holding-heart'))
-    if count >= 10:
-        badges_to_award.append(('Eco Warrior', 'leaf'))
+    return redirect(url_for('.manage_campaign', campaign_id=campaign_id))
+
+@bp.route('/campaign/<int:campaign_id>/verify', methods=['POST'])
+@ngo_login_required
+def verify_volunteers(campaign_id):
+    """Verify many volunteers' completions in one transaction"""
+    ngo_id = session['ngo_id']
+    verify_all = request.form.get('scope') == 'pending'
+    selected = {int(user_id) for user_id in request.form.getlist('user_ids') if user_id.isdigit()}
+    
+    with write_transaction() as cursor:
+        # Verify ownership
+        campaign = cursor.execute('''
+            SELECT c.* FROM campaigns c 
+            WHERE c.id = ? AND c.ngo_id = ?
+        ''', (campaign_id, ngo_id)).fetchone()
         
-    for name, icon in badges_to_award:
-        exists = cursor.execute('''
-            SELECT 1 FROM user_badges 
-            WHERE user_id = ? AND badge_name = ?
-        ''', (user_id, name)).fetchone()
+        if not campaign:
+            flash('Access denied', 'error')
+            return redirect(url_for('.ngo_dashboard'))
         
-        if not exists:
-            cursor.execute('''
-                INSERT INTO user_badges (user_id, badge_name, badge_icon)
-                VALUES (?, ?, ?)
-            ''', (user_id, name, icon))
+        # Only completions still waiting for verification
+        pending = [row['user_id'] for row in cursor.execute('''
+            SELECT user_id FROM campaign_completions
+            WHERE campaign_id = ? AND verified_by_ngo = 0
+        ''', (campaign_id,))]
+        user_ids = pending if verify_all else [user_id for user_id in pending if user_id in selected]
+        
+        if not user_ids:
+            flash('No pending completions selected', 'error')
+            return redirect(url_for('.manage_campaign', campaign_id=campaign_id))
+        
+        cursor.executemany('''
+            UPDATE campaign_completions 
+            SET verified_by_ngo = 1, verified_by = ?
+            WHERE campaign_id = ? AND user_id = ?
+        ''', [(ngo_id, campaign_id, user_id) for user_id in user_ids])
+        cursor.executemany('''
+            UPDATE campaign_volunteers 
+            SET status = 'verified' 
+            WHERE campaign_id = ? AND user_id = ?
+        ''', [(campaign_id, user_id) for user_id in user_ids])
+        publish_campaign_events(cursor, [(campaign_id, 'verified', user_id) for user_id in user_ids])
+        
+        # Award bonus points for verification
+        description = f'Campaign verified by NGO: {campaign["title"]}'
+        record_activities([ActivityEvent(user_id, 'campaign_verified', description, 10, campaign_id)
+                           for user_id in user_ids])
+        
+        # Check for badges across every affected user at once
+        award_badges(cursor, user_ids)
+    
+    flash(f'{len(user_ids)} volunteer(s) verified successfully!', 'success')
+    return redirect(url_for('.manage_campaign', campaign_id=campaign_id))
 
-@app.route('/campaigns/<int:campaign_id>/join', methods=['POST'])
+@bp.route('/campaigns/<int:campaign_id>/join', methods=['POST'])
 @login_required
 def join_campaign(campaign_id):
     """Join a campaign"""
     user_id = session['user_id']
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if campaign exists and has space
-    campaign = cursor.execute('SELECT * FROM campaigns WHERE id = ?', (campaign_id,)).fetchone()
-    if not campaign:
-        conn.close()
-        flash('Campaign not found', 'error')
-        return redirect(url_for('campaigns'))
-    
-    if campaign['volunteers_joined'] >= campaign['volunteers_needed']:
-        conn.close()
-        flash('Campaign is full', 'error')
-        return redirect(url_for('campaign_detail', campaign_id=campaign_id))
-    
-    # Check if already joined
-    existing = cursor.execute('''
-        SELECT id FROM campaign_volunteers 
-        WHERE campaign_id = ? AND user_id = ?
-    ''', (campaign_id, user_id)).fetchone()
-    
-    if existing:
-        conn.close()
-        flash('You have already joined this campaign', 'error')
-        return redirect(url_for('campaign_detail', campaign_id=campaign_id))
-    
-    # Join campaign
-    cursor.execute('''
-        INSERT INTO campaign_volunteers (campaign_id, user_id, status)
-        VALUES (?, ?, 'joined')
-    ''', (campaign_id, user_id))
-    
-    # Update volunteer count
-    cursor.execute('''
-        UPDATE campaigns 
-        SET volunteers_joined = volunteers_joined + 1
-        WHERE id = ?
-    ''', (campaign_id,))
-    
-    # Log activity and award points
-    log_activity(user_id, 'campaign_joined', f'Joined campaign: {campaign["title"]}', 10, campaign_id)
-    
-    # Check for badges
-    check_and_award_badges(user_id)
     
-    conn.commit()
-    conn.close()
+    with write_transaction() as cursor:
+        campaign = cursor.execute('SELECT * FROM campaigns WHERE id = ?', (campaign_id,)).fetchone()
+        if not campaign:
+            flash('Campaign not found', 'error')
+            return redirect(url_for('.campaigns'))
+        
+        if campaign['status'] == 'completed':
+            flash('This campaign has already ended', 'error')
+            return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
+        
+        # Check if already joined
+        existing = cursor.execute('''
+            SELECT id FROM campaign_volunteers 
+            WHERE campaign_id = ? AND user_id = ?
+        ''', (campaign_id, user_id)).fetchone()
+        
+        if existing:
+            flash('You have already joined this campaign', 'error')
+            return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
+        
+        # Claim a spot only if one is still free
+        cursor.execute('''
+            UPDATE campaigns 
+            SET volunteers_joined = volunteers_joined + 1
+            WHERE id = ? AND volunteers_joined < volunteers_needed
+        ''', (campaign_id,))
+        
+        if cursor.rowcount == 0:
+            flash('Campaign is full', 'error')
+            return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
+        
+        # Join campaign
+        cursor.execute('''
+            INSERT INTO campaign_volunteers (campaign_id, user_id, status)
+            VALUES (?, ?, 'joined')
+        ''', (campaign_id, user_id))
+        publish_campaign_events(cursor, [(campaign_id, 'joined', user_id)])
+        # The joiner's counts and every dashboard showing this campaign's seats
+        invalidate_dashboards([user_id], campaign_id=campaign_id)
+        # Their affinities just changed, so rescore what we suggest next
+        refresh_recommendations(cursor, [user_id])
+        invalidate_pages('campaigns', ('campaign', campaign_id))
+        
+        # Log activity and award points
+        eco_points = log_activity(user_id, 'campaign_joined', f'Joined campaign: {campaign["title"]}', 10, campaign_id)
+        
+        # Check for badges
+        check_and_award_badges(user_id, {'eco_points': (eco_points - 10, eco_points)} if eco_points else None)
     
     flash('Successfully joined the campaign! You earned 10 eco points.', 'success')
-    return redirect(url_for('campaign_detail', campaign_id=campaign_id))
+    return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
 
-@app.route('/ngo/register', methods=['GET', 'POST'])
+@bp.route('/ngo/register', methods=['GET', 'POST'])
 def ngo_register():
     """NGO Registration"""
     if request.method == 'POST':
@@ -816,29 +3802,29 @@ def ngo_register():
         # Check if email exists
         existing = cursor.execute('SELECT id FROM ngos WHERE email = ?', (email,)).fetchone()
         if existing:
-            conn.close()
             return render_template('ngo_register.html', error='Email already registered')
         
-        hashed_password = generate_password_hash(password)
-        cursor.execute('''
-            INSERT INTO ngos (name, email, password, description, contact, address)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (name, email, hashed_password, description, contact, address))
-        
-        ngo_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        hashed_password = hash_password(password)
+        with write_transaction() as cursor:
+            if cursor.execute('SELECT id FROM ngos WHERE email = ?', (email,)).fetchone():
+                return render_template('ngo_register.html', error='Email already registered')
+            cursor.execute('''
+                INSERT INTO ngos (name, email, password, description, contact, address)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, email, hashed_password, description, contact, address))
+            
+            ngo_id = cursor.lastrowid
         
         session['ngo_id'] = ngo_id
         session['ngo_name'] = name
         session['ngo_email'] = email
         
         flash('NGO registered successfully!', 'success')
-        return redirect(url_for('ngo_dashboard'))
+        return redirect(url_for('.ngo_dashboard'))
     
     return render_template('ngo_register.html')
 
-@app.route('/ngo/login', methods=['GET', 'POST'])
+@bp.route('/ngo/login', methods=['GET', 'POST'])
 def ngo_login():
     """NGO Login"""
     if request.method == 'POST':
@@ -851,28 +3837,27 @@ def ngo_login():
         conn = get_db()
         cursor = conn.cursor()
         ngo = cursor.execute('SELECT * FROM ngos WHERE email = ?', (email,)).fetchone()
-        conn.close()
         
-        if ngo and check_password_hash(ngo['password'], password):
+        if ngo and check_password('ngos', ngo, password):
             session['ngo_id'] = ngo['id']
             session['ngo_name'] = ngo['name']
             session['ngo_email'] = ngo['email']
-            return redirect(url_for('ngo_dashboard'))
+            return redirect(url_for('.ngo_dashboard'))
         else:
             return render_template('ngo_login.html', error='Invalid email or password')
     
     return render_template('ngo_login.html')
 
-@app.route('/ngo/logout')
+@bp.route('/ngo/logout')
 def ngo_logout():
     """NGO Logout"""
     session.pop('ngo_id', None)
     session.pop('ngo_name', None)
     session.pop('ngo_email', None)
     flash('Logged out successfully', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/ngo/dashboard')
+@bp.route('/ngo/dashboard')
 @ngo_login_required
 def ngo_dashboard():
     """NGO Dashboard"""
@@ -895,12 +3880,37 @@ def ngo_dashboard():
         WHERE c.ngo_id = ?
     ''', (ngo_id,)).fetchone()[0]
     
-    conn.close()
-    
     return render_template('ngo_dashboard.html', ngo=ngo, campaigns=campaigns,
                          stats={'total_campaigns': total_campaigns, 'total_volunteers': total_volunteers})
 
-@app.route('/ngo/campaign/create', methods=['GET', 'POST'])
+@bp.route('/ngo/events')
+@ngo_login_required
+def ngo_events():
+    """Live events for every campaign the NGO runs as Server-Sent Events"""
+    return stream_campaign_events(('ngo', session['ngo_id']))
+
+@bp.route('/ngo/export')
+@ngo_login_required
+def export_ngo_history():
+    """Download every campaign the NGO has run, one row per volunteer"""
+    fmt = import_format(None, request.args.get('format', 'csv'))
+    if not fmt:
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    
+    # Campaigns without volunteers still get a row, with empty volunteer columns
+    return export_response(f'ngo-{session["ngo_id"]}-history', fmt, '''
+        SELECT c.id AS campaign_id, c.title AS campaign_title, c.category, c.location, c.date,
+               c.status AS campaign_status, cv.user_id, u.name, u.email, cv.status, cv.joined_at,
+               cc.completed_at, COALESCE(cc.verified_by_ngo, 0) AS verified
+        FROM campaigns c
+        LEFT JOIN campaign_volunteers cv ON cv.campaign_id = c.id
+        LEFT JOIN users u ON u.id = cv.user_id
+        LEFT JOIN campaign_completions cc ON cc.campaign_id = cv.campaign_id AND cc.user_id = cv.user_id
+        WHERE c.ngo_id = ?
+        ORDER BY c.created_at, c.id, cv.joined_at, cv.id
+    ''', (session['ngo_id'],))
+
+@bp.route('/ngo/campaign/create', methods=['GET', 'POST'])
 @ngo_login_required
 def ngo_create_campaign():
     """Create campaign as NGO"""
@@ -921,105 +3931,225 @@ def ngo_create_campaign():
         req_list = [r.strip() for r in requirements.split('\n') if r.strip()]
         req_json = json.dumps(req_list)
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO campaigns (title, description, short_description, category, location, date, time,
-                                     volunteers_needed, ngo_id, image, requirements)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (title, description, short_description, category, location, date, time,
-                  volunteers_needed, ngo_id, image, req_json))
-            conn.commit()
+            latitude, longitude = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+            with write_transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO campaigns (title, description, short_description, category, location, date, time,
+                                         volunteers_needed, ngo_id, image, requirements, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (title, description, short_description, category, location, date, time,
+                      volunteers_needed, ngo_id, image, req_json, latitude, longitude))
+                invalidate_dashboards(ngo_id=ngo_id)
+                invalidate_pages('campaigns', ('campaign', cursor.lastrowid))
             flash('Campaign created successfully!', 'success')
-            return redirect(url_for('ngo_dashboard'))
+            return redirect(url_for('.ngo_dashboard'))
         except Exception as e:
             flash(f'Error: {str(e)}', 'error')
-        finally:
-            conn.close()
     
     return render_template('ngo_create_campaign.html')
 
-@app.route('/campaigns/<int:campaign_id>/complete', methods=['POST'])
+@bp.route('/ngo/import/<kind>', methods=['POST'])
+@ngo_login_required
+def ngo_import(kind):
+    """Bulk import campaigns or a volunteer roster from an uploaded CSV/JSONL file"""
+    if kind not in IMPORT_KINDS:
+        return jsonify({'error': f'kind must be one of {", ".join(IMPORT_KINDS)}'}), 404
+    
+    # Multipart uploads are spooled to disk by Werkzeug; a raw body is read as it arrives
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get('format') or request.form.get('format') or IMPORT_MIMETYPES.get(request.mimetype)
+    fmt = import_format(upload.filename if upload else None, fmt)
+    if not fmt:
+        return jsonify({'error': 'unknown format; send a .csv or .jsonl file or pass format='}), 400
+    
+    report = run_import(kind, stream, fmt, session['ngo_id'])
+    return jsonify(report.as_dict())
+
+@bp.route('/campaigns/<int:campaign_id>/complete', methods=['POST'])
 @login_required
 def complete_campaign(campaign_id):
     """Mark campaign as completed by volunteer"""
     user_id = session['user_id']
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if user joined the campaign
-    joined = cursor.execute('''
-        SELECT id FROM campaign_volunteers 
-        WHERE campaign_id = ? AND user_id = ?
-    ''', (campaign_id, user_id)).fetchone()
-    
-    if not joined:
-        conn.close()
-        flash('You must join the campaign first', 'error')
-        return redirect(url_for('campaign_detail', campaign_id=campaign_id))
-    
-    # Check if already completed
-    completed = cursor.execute('''
-        SELECT id FROM campaign_completions 
-        WHERE campaign_id = ? AND user_id = ?
-    ''', (campaign_id, user_id)).fetchone()
-    
-    if completed:
-        conn.close()
-        flash('You have already marked this campaign as completed', 'error')
-        return redirect(url_for('campaign_detail', campaign_id=campaign_id))
-    
-    # Mark as completed (pending NGO verification)
-    cursor.execute('''
-        INSERT INTO campaign_completions (campaign_id, user_id, verified_by_ngo)
-        VALUES (?, ?, 0)
-    ''', (campaign_id, user_id))
-    
-    # Update volunteer status
-    cursor.execute('''
-        UPDATE campaign_volunteers SET status = 'completed' 
-        WHERE campaign_id = ? AND user_id = ?
-    ''', (campaign_id, user_id))
-    
-    # Award points for completion (will be verified by NGO)
-    log_activity(user_id, 'campaign_completed', f'Completed campaign: {campaign_id}', 20, campaign_id)
-    
-    # Check for badges
-    check_and_award_badges(user_id)
     
-    conn.commit()
-    conn.close()
+    with write_transaction() as cursor:
+        campaign = cursor.execute('SELECT status FROM campaigns WHERE id = ?', (campaign_id,)).fetchone()
+        if not campaign:
+            flash('Campaign not found', 'error')
+            return redirect(url_for('.campaigns'))
+        
+        # The lifecycle job has already finalized this campaign's completions
+        if campaign['status'] == 'completed':
+            flash('This campaign has already ended', 'error')
+            return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
+        
+        # Check if user joined the campaign
+        joined = cursor.execute('''
+            SELECT id FROM campaign_volunteers 
+            WHERE campaign_id = ? AND user_id = ?
+        ''', (campaign_id, user_id)).fetchone()
+        
+        if not joined:
+            flash('You must join the campaign first', 'error')
+            return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
+        
+        # Mark as completed (pending NGO verification); the UNIQUE constraint
+        # turns a repeat submission into a no-op
+        cursor.execute('''
+            INSERT OR IGNORE INTO campaign_completions (campaign_id, user_id, verified_by_ngo)
+            VALUES (?, ?, 0)
+        ''', (campaign_id, user_id))
+        
+        if cursor.rowcount == 0:
+            flash('You have already marked this campaign as completed', 'error')
+            return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
+        
+        # Update volunteer status
+        cursor.execute('''
+            UPDATE campaign_volunteers SET status = 'completed' 
+            WHERE campaign_id = ? AND user_id = ?
+        ''', (campaign_id, user_id))
+        publish_campaign_events(cursor, [(campaign_id, 'completed', user_id)])
+        
+        update_leaderboard(cursor, user_id, completed=1)
+        
+        # Award points for completion (will be verified by NGO)
+        eco_points = log_activity(user_id, 'campaign_completed', f'Completed campaign: {campaign_id}', 20, campaign_id)
+        completed = cursor.execute('''
+            SELECT COUNT(*) FROM campaign_completions WHERE user_id = ?
+        ''', (user_id,)).fetchone()[0]
+        
+        # Check for badges; in write-behind mode the writer checks points once they land
+        changed = {'campaigns_completed': (completed - 1, completed)}
+        if eco_points:
+            changed['eco_points'] = (eco_points - 20, eco_points)
+        check_and_award_badges(user_id, changed)
     
     flash('Campaign marked as completed! Waiting for NGO verification. You earned 20 eco points.', 'success')
-    return redirect(url_for('campaign_detail', campaign_id=campaign_id))
+    return redirect(url_for('.campaign_detail', campaign_id=campaign_id))
 
-@app.route('/leaderboard')
+@bp.route('/leaderboard')
+# The current boards are tags too, so a new week or month changes the ETag
+@cache_anonymous_page(lambda: ['leaderboard', *(board for board, _ in leaderboard_periods().values())])
 def leaderboard():
     """Leaderboard page"""
+    window = request.args.get('window', 'all')
+    if window not in LEADERBOARD_WINDOWS:
+        window = 'all'
+    location = request.args.get('location', '').strip().lower()
+    board = leaderboard_periods()[window][0]
+    
     conn = get_db()
     cursor = conn.cursor()
     
-    # Get top users by eco points
-    top_users = cursor.execute('''
-        SELECT u.id, u.name, u.eco_points, u.location,
-               COUNT(DISTINCT ub.id) as badge_count,
-               COUNT(DISTINCT cc.id) as campaigns_completed
-        FROM users u
-        LEFT JOIN user_badges ub ON u.id = ub.user_id
-        LEFT JOIN campaign_completions cc ON u.id = cc.user_id
-        GROUP BY u.id
-        ORDER BY u.eco_points DESC, campaigns_completed DESC
+    segment = 'le.board = ?'
+    params = [board]
+    if location:
+        segment += ' AND le.location = ?'
+        params.append(location)
+    
+    # Top users straight off the rank index
+    top_users = cursor.execute(f'''
+        SELECT u.id, u.name, u.location, le.points AS eco_points, le.campaigns_completed,
+               (SELECT COUNT(*) FROM user_badges ub WHERE ub.user_id = u.id) AS badge_count
+        FROM leaderboard_entries le
+        JOIN users u ON u.id = le.user_id
+        WHERE {segment}
+        ORDER BY le.points DESC, le.campaigns_completed DESC, le.user_id
         LIMIT 50
-    ''').fetchall()
+    ''', params).fetchall()
     
-    conn.close()
+    # Signed-in user's rank: count entries ahead of theirs on the same index
+    my_rank = None
+    if 'user_id' in session:
+        mine = cursor.execute(f'''
+            SELECT le.points, le.campaigns_completed FROM leaderboard_entries le
+            WHERE {segment} AND le.user_id = ?
+        ''', params + [session['user_id']]).fetchone()
+        if mine:
+            # Two range seeks rather than an OR, which would scan the whole board
+            ahead = cursor.execute(f'''
+                SELECT (SELECT COUNT(*) FROM leaderboard_entries le
+                        WHERE {segment} AND le.points > ?)
+                     + (SELECT COUNT(*) FROM leaderboard_entries le
+                        WHERE {segment} AND le.points = ? AND le.campaigns_completed > ?)
+            ''', params + [mine['points']] + params + [mine['points'], mine['campaigns_completed']]).fetchone()[0]
+            my_rank = {'rank': ahead + 1, 'points': mine['points'],
+                       'campaigns_completed': mine['campaigns_completed']}
     
-    return render_template('leaderboard.html', top_users=top_users,
+    return render_template('leaderboard.html', top_users=top_users, window=window,
+                         location=location, my_rank=my_rank,
                          user={'id': session.get('user_id'), 'name': session.get('user_name')} if 'user_id' in session else None)
 
-@app.route('/activities')
+@bp.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """Recompute the materialized leaderboard from the source tables"""
+    with write_transaction() as cursor:
+        rebuild_leaderboard(cursor)
+    print('Leaderboard rebuilt')
+
+@bp.cli.command('advance-campaigns')
+def advance_campaigns_command():
+    """Move campaigns to ongoing or completed by date, finalize pending completions and prune old live events"""
+    with write_transaction() as cursor:
+        started, completed, finalized = advance_campaigns(cursor)
+        prune_campaign_events(cursor)
+    print(f'{len(started)} campaign(s) now ongoing, {len(completed)} completed; '
+          f'{finalized} pending completion(s) finalized')
+
+@bp.cli.command('archive-activities')
+@click.option('--days', type=int, default=ACTIVITY_RETENTION_DAYS, show_default=True,
+              help='archive activities older than this many days')
+@click.option('--vacuum', is_flag=True, help='first rebuild the database with VACUUM to enable incremental vacuuming')
+def archive_activities_command(days, vacuum):
+    """Move old activities into the archive table and give their space back"""
+    # The monthly leaderboard is rebuilt from the current month's activities
+    if days < 32:
+        raise click.UsageError('--days must be at least 32')
+    conn = get_db()
+    if vacuum:
+        print('Rebuilding the database with VACUUM...')
+        conn.execute('VACUUM')
+    elif conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        print('Incremental vacuuming is off for this database; run once with --vacuum to turn it on')
+    
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    started = time.perf_counter()
+    moved, pages = archive_activities(cutoff)
+    print(f'Archived {moved} activities from before {cutoff} in {time.perf_counter() - started:.1f}s; '
+          f'{pages} page(s) freed')
+
+@bp.cli.command('refresh-recommendations')
+def refresh_recommendations_command():
+    """Rebuild the candidate pool and every user's recommended campaigns"""
+    started = time.perf_counter()
+    with write_transaction() as cursor:
+        users = rebuild_recommendations(cursor)
+    print(f'Recommendations refreshed for {users} users in {time.perf_counter() - started:.1f}s')
+
+@bp.cli.command('import')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--ngo-id', type=int, required=True, help='NGO that owns the imported rows')
+@click.option('--format', 'fmt', type=click.Choice(sorted(IMPORT_FORMATS)), help='default: from the extension')
+def import_command(kind, path, ngo_id, fmt):
+    """Bulk import campaigns or a volunteer roster from a CSV or JSONL file"""
+    fmt = import_format(path, fmt)
+    if not fmt:
+        raise click.UsageError('cannot tell the format from the file name; pass --format')
+    if not get_db().execute('SELECT 1 FROM ngos WHERE id = ?', (ngo_id,)).fetchone():
+        raise click.UsageError(f'NGO {ngo_id} does not exist')
+    
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        report = run_import(kind, f, fmt, ngo_id)
+    for error in report.errors:
+        print(f"line {error['line']}: {error['error']}")
+    print(f'Imported {report.imported} of {report.rows} {kind} rows in {time.perf_counter() - started:.1f}s; '
+          f'{report.error_count} rejected')
+
+@bp.route('/activities')
 @login_required
 def activities():
     """User activity feed"""
@@ -1027,21 +4157,103 @@ def activities():
     conn = get_db()
     cursor = conn.cursor()
     
-    activities_list = cursor.execute('''
-        SELECT a.*, c.title as campaign_title
+    # Seek past the last row shown on (created_at DESC, id DESC)
+    before = None
+    if request.args.get('before'):
+        before = decode_cursor(request.args['before'])
+        if not before or len(before) != 2:
+            return redirect(url_for('.activities'))
+    
+    activities_list, has_more = user_activities(cursor, user_id, before)
+    next_cursor = None
+    if has_more:
+        last = activities_list[-1]
+        next_cursor = encode_cursor([last['created_at'], last['id']])
+    
+    return render_template('activities.html', activities=activities_list, next_cursor=next_cursor,
+                         paged=before is not None, user={'id': user_id, 'name': session['user_name']})
+
+@bp.route('/activities/export')
+@login_required
+def export_activities():
+    """Download the user's whole activity log, newest first"""
+    fmt = import_format(None, request.args.get('format', 'csv'))
+    if not fmt:
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    
+    columns = '''a.id AS id, a.created_at AS created_at, a.activity_type, a.description, a.points_earned,
+               a.campaign_id, c.title AS campaign_title'''
+    return export_response('activities', fmt, f'''
+        SELECT {columns}
         FROM activities a
         LEFT JOIN campaigns c ON a.campaign_id = c.id
         WHERE a.user_id = ?
-        ORDER BY a.created_at DESC
-        LIMIT 50
-    ''', (user_id,)).fetchall()
-    
-    conn.close()
-    
-    return render_template('activities.html', activities=activities_list,
-                         user={'id': user_id, 'name': session['user_name']})
+        UNION ALL
+        SELECT {columns}
+        FROM {activity_archive_table()} a
+        LEFT JOIN campaigns c ON a.campaign_id = c.id
+        WHERE a.user_id = ?
+        ORDER BY created_at DESC, id DESC
+    ''', (session['user_id'], session['user_id']))
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+@db_cli.command('upgrade')
+def db_upgrade_command():
+    """Apply any pending schema migrations"""
+    applied = init_db()
+    print(f'Applied {len(applied)} migration(s); schema is at version {schema_version(get_db())}')
+
+@db_cli.command('version')
+def db_version_command():
+    """Show the current schema version"""
+    version = schema_version(get_db())
+    print(f'Schema version {version} of {len(MIGRATIONS)}')
+
+def create_app(config=None):
+    """Build a GreenSpark app; doesn't touch the database until a request needs it
+
+    Run `flask db upgrade` (or init_db() in an app context) to create or
+    migrate the schema.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY=os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production'),
+        DATABASE=DATABASE,
+        PASSWORD_HASH_METHOD=PASSWORD_HASH_METHOD,
+    )
+    if config:
+        app.config.update(config)
+    # Idle connections kept around for reuse: read-only ones for requests,
+    # read-write ones for CLI commands and background threads
+    app.extensions['db_pool'] = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+    app.extensions['db_read_pool'] = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+    app.extensions['db_writer'] = DatabaseWriter(app, DB_WRITER_BATCH_SIZE, DB_WRITER_TIMEOUT)
+    app.extensions['activity_writer'] = ActivityWriter(app, ACTIVITY_QUEUE_SIZE, ACTIVITY_BATCH_SIZE,
+                                                       ACTIVITY_FLUSH_INTERVAL, ACTIVITY_JOURNAL)
+    app.extensions['password_hasher'] = PasswordHasher(app, PASSWORD_HASH_WORKERS, PASSWORD_HASH_BACKLOG,
+                                                       PASSWORD_HASH_WAIT)
+    app.extensions['campaign_scheduler'] = CampaignScheduler(app, CAMPAIGN_LIFECYCLE_INTERVAL)
+    app.extensions['event_broker'] = EventBroker(app, SSE_POLL_INTERVAL, SSE_QUEUE_SIZE, SSE_MAX_SUBSCRIBERS)
+    app.extensions['dashboard_cache'] = TaggedCache(DASHBOARD_CACHE_SIZE, DASHBOARD_CACHE_TTL)
+    app.extensions['recent_activity_cache'] = TaggedCache(RECENT_ACTIVITY_CACHE_SIZE, RECENT_ACTIVITY_CACHE_TTL)
+    app.extensions['page_cache'] = TaggedCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES)
+    app.extensions['card_cache'] = TaggedCache(CARD_CACHE_SIZE, CARD_CACHE_TTL, CARD_CACHE_MAX_BYTES)
+    app.extensions['metrics'] = Metrics()
+    app.teardown_appcontext(release_db)
+    # Workers load compiled templates from here instead of recompiling them
+    if JINJA_CACHE_DIR:
+        os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR or None)
+    app.register_blueprint(bp)
+    app.cli.add_command(db_cli)
+    return app
 
+# Default instance for `flask run` and WSGI servers pointed at app:app
+app = create_app()
 
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,622 @@
+"""Load test and benchmark for the GreenSpark routes
+
+Seeds a database with seed.py (or reuses one), then has concurrent
+workers drive every route through the Flask test client with a weighted
+mix of visitors, volunteers and NGOs. Reports throughput and p50/p95/p99
+latency per route, then runs a contention scenario in which many threads
+join the same campaign at once. It checks for overbooking and measures
+how long each join waited for the write lock. Then the listing pages
+are rendered with the campaign card cache off and warm, timing only
+the template rendering, and last comes a burst of sign-ins that reports
+logins per second per core for the configured PASSWORD_HASH_METHOD.
+
+    python bench.py --size large --workers 16 --duration 60 --output bench.json
+
+Results are written as JSON so runs can be diffed in CI.
+
+ROUTE_MIX leaves out a few routes on purpose:
+
+- register_ngo and ngo_register: both are mounted on /ngo/register and
+  register_ngo wins, but its insert leaves out the NOT NULL ngos.email,
+  so every submission takes the error path; NGOs sign in and create
+  campaigns in the mix instead
+- the campaign and NGO event streams: each holds its connection open
+  until the client leaves, so there is no request latency to measure;
+  query_plans.py still runs their snapshot and replay queries
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import before_render_template, template_rendered
+
+import seed
+
+SIZES = {
+    'small': seed.DEFAULT_SIZES,
+    'large': {'users': 200000, 'ngos': 2000, 'campaigns': 20000, 'volunteers': 500000, 'activities': 2000000},
+}
+
+# (name, role, weight); roles are 'visitor', 'volunteer' and 'ngo'
+ROUTE_MIX = [
+    ('index', 'visitor', 5),
+    ('campaigns', 'visitor', 15),
+    ('campaigns_search', 'visitor', 8),
+    ('campaign_detail', 'visitor', 15),
+    ('api_campaigns', 'visitor', 8),
+    ('leaderboard', 'visitor', 6),
+    ('dashboard', 'volunteer', 10),
+    ('activities', 'volunteer', 5),
+    ('campaign_detail_signed_in', 'volunteer', 5),
+    ('leaderboard_signed_in', 'volunteer', 3),
+    ('join_campaign', 'volunteer', 6),
+    ('complete_campaign', 'volunteer', 3),
+    ('login', 'visitor', 1),
+    ('register', 'visitor', 1),
+    ('ngo_dashboard', 'ngo', 3),
+    ('manage_campaign', 'ngo', 3),
+    ('verify_volunteer', 'ngo', 1),
+    ('verify_volunteers', 'ngo', 1),
+    ('ngo_create_campaign', 'ngo', 1),
+    ('campaigns_nearby', 'visitor', 4),
+    ('api_campaigns_bbox', 'visitor', 2),
+    ('metrics', 'visitor', 1),
+    ('create_campaign', 'volunteer', 1),
+    ('logout', 'volunteer', 1),
+    ('activities_export', 'volunteer', 1),
+    ('ngo_login', 'visitor', 1),
+    ('ngo_logout', 'ngo', 1),
+    ('campaign_export', 'ngo', 1),
+    ('ngo_export', 'ngo', 1),
+    ('ngo_import_campaigns', 'ngo', 1),
+    ('ngo_import_volunteers', 'ngo', 1),
+]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def summarize(samples, elapsed):
+    """Latency percentiles in milliseconds and throughput for a list of seconds"""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3) if ordered else None,
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3) if ordered else None,
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3) if ordered else None,
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+
+class LockWaits:
+    """Records how long each write_transaction() waited for its turn at the writer"""
+
+    def __init__(self, greenspark):
+        self.greenspark = greenspark
+        self.samples = []
+        self._original = greenspark.write_transaction
+
+    def install(self):
+        original = self._original
+        samples = self.samples
+
+        @contextmanager
+        def timed_write_transaction():
+            started = time.perf_counter()
+            with original() as cursor:
+                samples.append(time.perf_counter() - started)
+                yield cursor
+        self.greenspark.write_transaction = timed_write_transaction
+
+    def uninstall(self):
+        self.greenspark.write_transaction = self._original
+
+    def take(self):
+        """Return the waits recorded so far and start a new series"""
+        samples = list(self.samples)
+        del self.samples[:len(samples)]
+        return samples
+
+class Fixture:
+    """Ids the workload draws from, read once from the seeded database"""
+
+    def __init__(self, path):
+        db = sqlite3.connect(path)
+        # Accounts made by the register route in earlier runs have no known password
+        self.users = db.execute("SELECT MAX(id) FROM users WHERE email NOT LIKE 'bench-%'").fetchone()[0]
+        self.campaigns = [row[0] for row in db.execute('SELECT id FROM campaigns ORDER BY volunteers_joined DESC')]
+        self.ngos = [row[0] for row in db.execute('SELECT id FROM ngos WHERE owner_id IS NOT NULL')]
+        self.ngo_campaigns = {}
+        for campaign_id, ngo_id in db.execute('SELECT id, ngo_id FROM campaigns WHERE ngo_id IS NOT NULL'):
+            self.ngo_campaigns.setdefault(ngo_id, []).append(campaign_id)
+        self.pending = {}
+        for campaign_id, user_id in db.execute('''
+            SELECT cc.campaign_id, cc.user_id FROM campaign_completions cc WHERE cc.verified_by_ngo = 0
+        '''):
+            self.pending.setdefault(campaign_id, []).append(user_id)
+        self.words = seed.WORDS
+        db.close()
+        # Campaigns are ordered most-joined first; Zipf weights favour them like real traffic
+        self.popularity = []
+        total = 0
+        for rank in range(len(self.campaigns)):
+            total += 1 / (rank + 1) ** 1.1
+            self.popularity.append(total)
+
+    def campaign(self, rng):
+        return rng.choices(self.campaigns, cum_weights=self.popularity)[0]
+
+class Worker:
+    """One simulated client: a visitor, a signed-in volunteer and a signed-in NGO"""
+
+    def __init__(self, app, fixture, index, seed_value):
+        self.fixture = fixture
+        self.index = index
+        self.rng = random.Random(seed_value)
+        self.visitor = app.test_client()
+        self.user_id = 1 + index % fixture.users
+        self.volunteer = app.test_client()
+        self.volunteer.post('/login', data={'email': f'user{self.user_id}@example.com', 'password': seed.PASSWORD})
+        self.ngo_id = fixture.ngos[index % len(fixture.ngos)] if fixture.ngos else None
+        self.ngo = app.test_client()
+        if self.ngo_id:
+            self.ngo.post('/ngo/login', data={'email': f'ngo{self.ngo_id}@example.com', 'password': seed.PASSWORD})
+        self.registered = 0
+
+    def ngo_campaign(self):
+        campaigns = self.fixture.ngo_campaigns.get(self.ngo_id) or self.fixture.campaigns
+        return self.rng.choice(campaigns)
+
+    def request(self, name):
+        """Issue one request of the named kind and return its status code"""
+        rng = self.rng
+        fixture = self.fixture
+        if name == 'index':
+            return self.visitor.get('/').status_code
+        if name == 'campaigns':
+            return self.visitor.get(f'/campaigns?page={rng.randint(1, 20)}').status_code
+        if name == 'campaigns_search':
+            return self.visitor.get(f'/campaigns?search={rng.choice(fixture.words)}').status_code
+        if name == 'campaign_detail':
+            return self.visitor.get(f'/campaigns/{fixture.campaign(rng)}').status_code
+        if name == 'api_campaigns':
+            return self.visitor.get(f'/api/campaigns?limit=20&search={rng.choice(fixture.words)}').status_code
+        if name == 'leaderboard':
+            return self.visitor.get(f'/leaderboard?window={rng.choice(["all", "week", "month"])}').status_code
+        if name == 'dashboard':
+            return self.volunteer.get('/dashboard').status_code
+        if name == 'activities':
+            return self.volunteer.get('/activities').status_code
+        if name == 'campaign_detail_signed_in':
+            return self.volunteer.get(f'/campaigns/{fixture.campaign(rng)}').status_code
+        if name == 'leaderboard_signed_in':
+            return self.volunteer.get('/leaderboard').status_code
+        if name == 'join_campaign':
+            return self.volunteer.post(f'/campaigns/{fixture.campaign(rng)}/join').status_code
+        if name == 'complete_campaign':
+            return self.volunteer.post(f'/campaigns/{fixture.campaign(rng)}/complete').status_code
+        if name == 'login':
+            user_id = rng.randint(1, fixture.users)
+            client = self.visitor.application.test_client()
+            return client.post('/login', data={'email': f'user{user_id}@example.com',
+                                               'password': seed.PASSWORD}).status_code
+        if name == 'register':
+            self.registered += 1
+            client = self.visitor.application.test_client()
+            email = f'bench-{self.index}-{self.registered}-{time.time_ns()}@example.com'
+            return client.post('/register', data={'name': 'Bench User', 'email': email, 'phone': '1',
+                                                  'location': 'Pune', 'password': seed.PASSWORD,
+                                                  'confirm_password': seed.PASSWORD}).status_code
+        if name == 'ngo_dashboard':
+            return self.ngo.get('/ngo/dashboard').status_code
+        if name == 'manage_campaign':
+            return self.ngo.get(f'/campaign/{self.ngo_campaign()}/manage').status_code
+        if name == 'verify_volunteer':
+            campaign_id = self.ngo_campaign()
+            pending = fixture.pending.get(campaign_id) or [self.user_id]
+            return self.ngo.post(f'/campaign/{campaign_id}/verify/{rng.choice(pending)}').status_code
+        if name == 'verify_volunteers':
+            return self.ngo.post(f'/campaign/{self.ngo_campaign()}/verify', data={'scope': 'pending'}).status_code
+        if name == 'ngo_create_campaign':
+            return self.ngo.post('/ngo/campaign/create', data={
+                'title': f'Bench drive {time.time_ns()}', 'description': 'Benchmark campaign',
+                'short_description': 'Benchmark', 'category': rng.choice(seed.CATEGORIES),
+                'location': rng.choice(seed.CITIES), 'date': '2030-01-01', 'time': '09:00',
+                'volunteers_needed': '50', 'requirements': 'Gloves'}).status_code
+        if name == 'campaigns_nearby':
+            lat, lng = seed.CITY_COORDINATES[rng.choice(seed.CITIES)]
+            return self.visitor.get(f'/campaigns?lat={lat}&lng={lng}&radius={rng.choice([10, 25, 50])}').status_code
+        if name == 'api_campaigns_bbox':
+            lat, lng = seed.CITY_COORDINATES[rng.choice(seed.CITIES)]
+            return self.visitor.get(f'/api/campaigns?limit=20&bbox={lat - 0.5},{lng - 0.5},{lat + 0.5},{lng + 0.5}').status_code
+        if name == 'metrics':
+            return self.visitor.get('/metrics').status_code
+        if name == 'create_campaign':
+            return self.volunteer.post('/campaign/create', data={
+                'title': f'Bench drive {time.time_ns()}', 'description': 'Benchmark campaign',
+                'short_description': 'Benchmark', 'category': rng.choice(seed.CATEGORIES),
+                'location': rng.choice(seed.CITIES), 'date': '2030-01-01', 'time': '09:00',
+                'volunteers_needed': '50', 'requirements': 'Gloves'}).status_code
+        # Signing out ends the session, so do it on a throwaway client
+        if name == 'logout':
+            client = self.visitor.application.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = self.user_id
+            return client.get('/logout').status_code
+        if name == 'ngo_logout':
+            client = self.visitor.application.test_client()
+            with client.session_transaction() as session:
+                session['ngo_id'] = self.ngo_id
+            return client.get('/ngo/logout').status_code
+        if name == 'ngo_login':
+            client = self.visitor.application.test_client()
+            return client.post('/ngo/login', data={'email': f'ngo{rng.choice(fixture.ngos)}@example.com',
+                                                   'password': seed.PASSWORD}).status_code
+        # Exports stream, so time the whole body rather than the headers
+        if name == 'activities_export':
+            return self.download(self.volunteer, '/activities/export')
+        if name == 'campaign_export':
+            return self.download(self.ngo, f'/campaign/{self.ngo_campaign()}/export')
+        if name == 'ngo_export':
+            return self.download(self.ngo, f'/ngo/export?format={rng.choice(["csv", "jsonl"])}')
+        if name == 'ngo_import_campaigns':
+            rows = ''.join(f'Imported drive {time.time_ns()},Benchmark import,{rng.choice(seed.CATEGORIES)},'
+                           f'{rng.choice(seed.CITIES)},2030-02-01,20\n' for _ in range(5))
+            return self.ngo.post('/ngo/import/campaigns?format=csv', content_type='text/csv',
+                                 data='title,description,category,location,date,volunteers_needed\n' + rows).status_code
+        if name == 'ngo_import_volunteers':
+            campaign_id = self.ngo_campaign()
+            rows = ''.join(json.dumps({'campaign_id': campaign_id, 'user_id': rng.randint(1, fixture.users)}) + '\n'
+                           for _ in range(5))
+            return self.ngo.post('/ngo/import/volunteers?format=jsonl', content_type='application/x-ndjson',
+                                 data=rows).status_code
+        raise ValueError(f'unknown route {name}')
+
+    def download(self, client, url):
+        response = client.get(url)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+def run_mix(app, fixture, workers, duration, requests_per_worker, seed_value):
+    """Drive ROUTE_MIX from concurrent workers; returns per-route samples and errors"""
+    names = [name for name, _, _ in ROUTE_MIX]
+    weights = [weight for _, _, weight in ROUTE_MIX]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    clients = [Worker(app, fixture, index, seed_value + index) for index in range(workers)]
+    start = threading.Barrier(workers + 1)
+    deadline = []
+
+    def work(worker):
+        local = {name: [] for name in names}
+        failed = {name: 0 for name in names}
+        start.wait()
+        done = 0
+        while time.monotonic() < deadline[0] and (not requests_per_worker or done < requests_per_worker):
+            name = worker.rng.choices(names, weights=weights)[0]
+            started = time.perf_counter()
+            try:
+                status = worker.request(name)
+            except Exception as e:
+                print(f'{name} raised {e!r}', file=sys.stderr)
+                status = 599
+            local[name].append(time.perf_counter() - started)
+            if status >= 500:
+                failed[name] += 1
+            done += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += failed[name]
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in clients]
+    for thread in threads:
+        thread.start()
+    deadline.append(time.monotonic() + duration)
+    started = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+def run_contention(app, greenspark, path, threads, seats, first_user):
+    """Many volunteers join one campaign at once; checks that no seat is sold twice"""
+    db = sqlite3.connect(path)
+    campaign_id = db.execute('''
+        INSERT INTO campaigns (title, description, short_description, category, location, date, time,
+                               volunteers_needed, volunteers_joined)
+        VALUES ('Contention drive', 'Everyone joins at once', 'Contention', 'cleanup', 'Mumbai',
+                '2030-06-01', '09:00', ?, 0)
+        RETURNING id
+    ''', (seats,)).fetchone()[0]
+    db.commit()
+    db.close()
+
+    clients = []
+    for offset in range(threads):
+        client = app.test_client()
+        response = client.post('/login', data={'email': f'user{first_user + offset}@example.com',
+                                                'password': seed.PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'could not sign in as user{first_user + offset}')
+        clients.append(client)
+
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def join(client):
+        barrier.wait()
+        started = time.perf_counter()
+        status = client.post(f'/campaigns/{campaign_id}/join').status_code
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+
+    waits = LockWaits(greenspark)
+    waits.install()
+    try:
+        started = time.perf_counter()
+        workers = [threading.Thread(target=join, args=(client,)) for client in clients]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        waits.uninstall()
+
+    db = sqlite3.connect(path)
+    joined, needed = db.execute('SELECT volunteers_joined, volunteers_needed FROM campaigns WHERE id = ?',
+                                (campaign_id,)).fetchone()
+    rows = db.execute('SELECT COUNT(*) FROM campaign_volunteers WHERE campaign_id = ?', (campaign_id,)).fetchone()[0]
+    db.close()
+    return {
+        'threads': threads,
+        'seats': seats,
+        'volunteers_joined': joined,
+        'volunteer_rows': rows,
+        'overbooked': joined > needed or rows > needed,
+        'consistent': joined == rows,
+        'server_errors': sum(1 for status in statuses if status >= 500),
+        'join': summarize(latencies, elapsed),
+        'lock_wait': summarize(waits.take(), elapsed),
+    }
+
+# (name, client, path pattern, template) for the pages that list campaign cards
+RENDER_PAGES = [
+    ('campaigns', 'volunteer', '/campaigns?page={page}', 'campaigns.html'),
+    ('dashboard', 'volunteer', '/dashboard', 'dashboard.html'),
+    ('ngo_dashboard', 'ngo', '/ngo/dashboard', 'ngo_dashboard.html'),
+]
+
+def run_render(app, greenspark, fixture, rounds):
+    """Time rendering of each listing page with the card cache off, then warm
+
+    Only render_template() is timed, between Flask's template signals, so
+    database time doesn't blur the comparison. The volunteer is signed in,
+    so the page cache doesn't answer for the listing.
+    """
+    worker = Worker(app, fixture, 0, 0)
+    started = {}
+    timings = {}
+
+    def before(sender, template, context, **extra):
+        started[template.name] = time.perf_counter()
+
+    def rendered(sender, template, context, **extra):
+        if template.name in started:
+            timings.setdefault(template.name, []).append(time.perf_counter() - started.pop(template.name))
+
+    def render_all(samples):
+        timings.clear()
+        for round_index in range(rounds):
+            for name, client, path, template in RENDER_PAGES:
+                getattr(worker, client).get(path.format(page=round_index % 5 + 1))
+        for name, _, _, template in RENDER_PAGES:
+            samples[name] = timings.get(template, [])
+
+    cache = app.extensions['card_cache']
+    maxsize = cache.maxsize
+    uncached, cached = {}, {}
+    before_render_template.connect(before, app)
+    template_rendered.connect(rendered, app)
+    try:
+        cache.maxsize = 0
+        cache.clear()
+        render_all(uncached)
+        cache.maxsize = maxsize
+        # One pass to fill the cache, then measure
+        render_all({})
+        render_all(cached)
+    finally:
+        cache.maxsize = maxsize
+        before_render_template.disconnect(before, app)
+        template_rendered.disconnect(rendered, app)
+    results = {}
+    for name, _, _, _ in RENDER_PAGES:
+        results[name] = {'uncached': summarize(uncached[name], sum(uncached[name])),
+                         'cached': summarize(cached[name], sum(cached[name]))}
+    return dict(results, card_cache=cache.stats())
+
+def cpu_count():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def run_logins(app, greenspark, fixture, threads, count, seed_value):
+    """Sign in as random seeded users from many threads; measures the password hashing path"""
+    rng = random.Random(seed_value)
+    user_ids = [rng.randint(1, fixture.users) for _ in range(count)]
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    hasher = app.extensions['password_hasher']
+    before = hasher.stats()
+
+    def login(chunk):
+        client = app.test_client()
+        barrier.wait()
+        for user_id in chunk:
+            started = time.perf_counter()
+            status = client.post('/login', data={'email': f'user{user_id}@example.com',
+                                                  'password': seed.PASSWORD}).status_code
+            client.get('/logout')
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                statuses.append(status)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=login, args=(user_ids[index::threads],)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    after = hasher.stats()
+    cores = cpu_count()
+    stats = summarize(latencies, elapsed)
+    return dict(stats, threads=threads, cores=cores,
+                method=app.config['PASSWORD_HASH_METHOD'],
+                pool_workers=hasher.workers,
+                logins_per_core=round(stats['throughput_rps'] / cores, 2) if stats['throughput_rps'] else None,
+                failed=sum(1 for status in statuses if status != 302),
+                rejected=after['rejected'] - before['rejected'],
+                rehashed=after['rehashed'] - before['rehashed'])
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='bench.db', help='database to seed, or reuse if it exists')
+    parser.add_argument('--size', choices=SIZES, default='small', help='seed preset (default: small)')
+    parser.add_argument('--reseed', action='store_true', help='replace an existing database')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent workers (default: 8)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run the mix (default: 30)')
+    parser.add_argument('--requests', type=int, default=0, help='stop each worker after this many requests')
+    parser.add_argument('--contention-threads', type=int, default=64)
+    parser.add_argument('--contention-seats', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=200, help='sign-ins in the login burst (0 to skip)')
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--render-rounds', type=int, default=50,
+                        help='renders of each listing page with and without the card cache (0 to skip)')
+    parser.add_argument('--no-cache', action='store_true', help='disable the page, dashboard and card caches')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    parser.add_argument('--output', default='bench-results.json', help='where to write the JSON results')
+    args = parser.parse_args()
+
+    sizes = SIZES[args.size]
+    if args.reseed or not os.path.exists(args.database):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+        seed.seed_database(args.database, seed=args.seed, verbose=True, **sizes)
+
+    import app as greenspark
+    app = greenspark.create_app({'DATABASE': args.database})
+    with app.app_context():
+        greenspark.init_db()
+    if args.no_cache:
+        app.extensions['page_cache'].maxsize = 0
+        app.extensions['dashboard_cache'].maxsize = 0
+        app.extensions['card_cache'].maxsize = 0
+
+    fixture = Fixture(args.database)
+    if fixture.users < args.workers + args.contention_threads:
+        parser.error(f'need at least {args.workers + args.contention_threads} seeded users')
+
+    print(f'Running the route mix: {args.workers} workers for {args.duration:g}s')
+    waits = LockWaits(greenspark)
+    waits.install()
+    try:
+        samples, errors, elapsed = run_mix(app, fixture, args.workers, args.duration, args.requests, args.seed)
+    finally:
+        waits.uninstall()
+    routes = {}
+    for name, _, _ in ROUTE_MIX:
+        routes[name] = dict(summarize(samples[name], elapsed), errors=errors[name])
+    total = sum(len(values) for values in samples.values())
+
+    print(f'Running contention: {args.contention_threads} threads for {args.contention_seats} seats')
+    # Users past the workers' ids, so nobody in the scenario has joined already
+    contention = run_contention(app, greenspark, args.database, args.contention_threads, args.contention_seats,
+                                first_user=fixture.users - args.contention_threads + 1)
+    render = None
+    if args.render_rounds:
+        print(f'Timing listing page renders: {args.render_rounds} rounds without and with the card cache')
+        render = run_render(app, greenspark, fixture, args.render_rounds)
+    logins = None
+    if args.logins:
+        print(f'Running the login burst: {args.logins} sign-ins from {args.login_threads} threads')
+        logins = run_logins(app, greenspark, fixture, args.login_threads, args.logins, args.seed)
+    app.extensions['activity_writer'].flush()
+    greenspark.close_db_pool(app)
+
+    results = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'size': args.size,
+            'sizes': sizes,
+            'workers': args.workers,
+            'duration_s': round(elapsed, 3),
+            'activity_log_mode': greenspark.ACTIVITY_LOG_MODE,
+            'caches': not args.no_cache,
+        },
+        'total': dict(summarize([s for values in samples.values() for s in values], elapsed),
+                      errors=sum(errors.values()), requests=total),
+        'routes': routes,
+        'lock_wait': summarize(waits.take(), elapsed),
+        'contention': contention,
+        'render': render,
+        'logins': logins,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f'{"route":<28}{"count":>8}{"rps":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for name, stats in routes.items():
+        print(f'{name:<28}{stats["count"]:>8}{stats["throughput_rps"]:>10}{stats["p50_ms"] or 0:>10}'
+              f'{stats["p95_ms"] or 0:>10}{stats["p99_ms"] or 0:>10}{stats["errors"]:>8}')
+    print(f'total: {total} requests, {results["total"]["throughput_rps"]} req/s')
+    print(f'contention: {contention["volunteers_joined"]}/{contention["seats"]} seats taken, '
+          f'overbooked={contention["overbooked"]}, lock wait p99={contention["lock_wait"]["p99_ms"]} ms')
+    if render:
+        for name, _, _, _ in RENDER_PAGES:
+            before, after = render[name]['uncached'], render[name]['cached']
+            print(f'render {name}: p50 {before["p50_ms"]} ms without the card cache, {after["p50_ms"]} ms with it')
+    if logins:
+        print(f'logins: {logins["throughput_rps"]}/s on {logins["cores"]} core(s), '
+              f'{logins["logins_per_core"]}/s per core, p99={logins["p99_ms"]} ms, '
+              f'{logins["method"]}, {logins["failed"]} failed')
+    print(f'Results written to {args.output}')
+    failed = contention['overbooked'] or not contention['consistent'] or results['total']['errors']
+    return 1 if failed or (logins and logins['failed']) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""Query-plan regression check for every statement the routes issue
+
+Seeds a throwaway database, drives each route through the Flask test
+client while recording the SQL it runs, then EXPLAINs every distinct
+statement. The run fails (exit status 1) if any statement does a full
+scan of a large table, or walks a whole index without a LIMIT to stop it.
+
+    python query_plans.py [--verbose]
+"""
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Tables that grow with usage; scanning these is a regression
+LARGE_TABLES = {'users', 'ngos', 'campaigns', 'campaign_volunteers', 'campaign_completions',
+                'activities', 'activities_archive', 'user_badges', 'leaderboard_entries', 'campaign_events'}
+
+# Statements whose full scans are deliberate, with the reason
+ALLOWED_SCANS = {
+    # Rebuilding recommendations scores every user
+    'SELECT id FROM users ORDER BY id': 'recommendation rebuild',
+}
+
+SKIPPED_PREFIXES = ('--', 'PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'ANALYZE', 'CREATE', 'DROP', 'ALTER')
+
+def normalize(sql):
+    """Collapse literals and whitespace so repeated statements compare equal"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    return ' '.join(sql.split())
+
+def table_aliases(sql):
+    """Map every alias (and table name) in FROM/JOIN/UPDATE clauses to its table"""
+    aliases = {}
+    keywords = {'WHERE', 'ON', 'JOIN', 'LEFT', 'INNER', 'ORDER', 'GROUP', 'LIMIT', 'SET', 'USING', 'AS'}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in keywords:
+            aliases[alias] = table
+    return aliases
+
+def scan_problems(conn, sql, parameters=()):
+    """Return the plan lines of sql that scan a large table"""
+    problems = []
+    aliases = table_aliases(sql)
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+    limited = re.search(r'\bLIMIT\b', sql, re.I) is not None
+    # A range on a bound value is a seek; left to a SCAN it is checked row by
+    # row from the start of the index, so every later page costs its offset
+    seeks = re.search(r"(?<![<>!])[<>]=?(?!>)\s*\(?\s*[?'\d]", sql) is not None
+    # An index walk only stops early when it supplies the order for a LIMIT,
+    # and only a first page starts where the walk does
+    bounded = limited and not seeks and not any('TEMP B-TREE' in detail for detail in plan)
+    # A partial index only holds the rows its WHERE admits, so walking all of
+    # one is fine for a statement that wants every such row (a count, say)
+    partial = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")}
+    for detail in plan:
+        match = re.match(r'(SCAN|SEARCH) (\w+)', detail)
+        if not match or aliases.get(match.group(2), match.group(2)) not in LARGE_TABLES:
+            continue
+        # Skip-scans (ANY(...)) visit every distinct leading key
+        if match.group(1) == 'SEARCH' and 'ANY(' not in detail:
+            continue
+        if match.group(1) == 'SCAN' and 'INDEX' in detail and bounded:
+            continue
+        index = re.search(r'USING (?:COVERING )?INDEX (\w+)', detail)
+        if match.group(1) == 'SCAN' and index and index.group(1) in partial and not limited:
+            continue
+        problems.append(detail)
+    return problems
+
+def exercise_routes(app, path):
+    """Hit every route as a visitor, a volunteer and an NGO"""
+    db = sqlite3.connect(path)
+    user_id = 1
+    ngo_id = db.execute('SELECT id FROM ngos WHERE owner_id = ?', (user_id,)).fetchone()[0]
+    joined = db.execute('SELECT campaign_id FROM campaign_volunteers WHERE user_id = ?', (user_id,)).fetchone()[0]
+    open_campaign = db.execute('''
+        SELECT id FROM campaigns WHERE volunteers_joined < volunteers_needed AND status != 'completed'
+        AND id NOT IN (SELECT campaign_id FROM campaign_volunteers WHERE user_id = ?) LIMIT 1
+    ''', (user_id,)).fetchone()[0]
+    ngo_campaign, pending_user = db.execute('''
+        SELECT c.id, cc.user_id FROM campaigns c JOIN campaign_completions cc ON cc.campaign_id = c.id
+        WHERE c.ngo_id = ? AND cc.verified_by_ngo = 0 LIMIT 1
+    ''', (ngo_id,)).fetchone()
+    db.close()
+
+    visitor = app.test_client()
+    for url in ['/', '/campaigns', '/campaigns?page=3', '/campaigns?search=beach+clean',
+                '/campaigns?category=cleanup', '/campaigns?location=mumbai&category=water',
+                f'/campaigns/{joined}', '/leaderboard', '/leaderboard?window=week',
+                '/leaderboard?window=month&location=pune', '/api/campaigns',
+                '/api/campaigns?search=river&category=cleanup', '/campaigns?lat=19.07&lng=72.88&radius=25',
+                '/api/campaigns?lat=18.52&lng=73.85&radius=50&category=cleanup',
+                '/api/campaigns?bbox=18,72,20,75&search=river']:
+        visitor.get(url)
+    # Live streams run their snapshot or replay queries before the first byte
+    visitor.get(f'/campaigns/{joined}/events').close()
+    visitor.get(f'/campaigns/{joined}/events', headers={'Last-Event-ID': '1'}).close()
+    # Later pages must seek on the listing index, not walk it from the start
+    for filters in ['', '&category=cleanup']:
+        cursor = visitor.get(f'/api/campaigns?limit=5{filters}').get_json()['next_cursor']
+        visitor.get(f'/api/campaigns?limit=5{filters}&cursor={cursor}')
+    visitor.post('/register', data={'name': 'Plan Check', 'email': 'plan-check@example.com', 'phone': '1',
+                                    'location': 'Pune', 'password': 'password', 'confirm_password': 'password'})
+
+    volunteer = app.test_client()
+    volunteer.post('/login', data={'email': f'user{user_id}@example.com', 'password': 'password'})
+    for url in ['/dashboard', '/activities', f'/campaigns/{joined}', '/leaderboard', '/campaign/create',
+                '/activities/export']:
+        volunteer.get(url).get_data()
+    # Page back through the whole feed, which runs on into the archive
+    feed = volunteer.get('/activities').get_data(as_text=True)
+    while (older := re.search(r'before=([\w-]+)', feed)):
+        feed = volunteer.get(f'/activities?before={older.group(1)}').get_data(as_text=True)
+    volunteer.post(f'/campaigns/{open_campaign}/join')
+    volunteer.post(f'/campaigns/{open_campaign}/complete')
+
+    ngo = app.test_client()
+    ngo.post('/ngo/login', data={'email': f'ngo{ngo_id}@example.com', 'password': 'password'})
+    for url in ['/ngo/dashboard', f'/campaign/{ngo_campaign}/manage', f'/campaign/{ngo_campaign}/export',
+                '/ngo/export?format=jsonl']:
+        ngo.get(url).get_data()
+    ngo.get('/ngo/events').close()
+    ngo.get('/ngo/events', headers={'Last-Event-ID': '1'}).close()
+    ngo.post(f'/campaign/{ngo_campaign}/verify/{pending_user}')
+    ngo.post(f'/campaign/{ngo_campaign}/verify', data={'scope': 'pending'})
+    ngo.post('/ngo/campaign/create', data={
+        'title': 'Plan check drive', 'description': 'Checking plans', 'short_description': 'Plans',
+        'category': 'cleanup', 'location': 'Pune', 'date': '2030-01-01', 'time': '09:00',
+        'volunteers_needed': '10', 'requirements': 'Gloves'})
+    ngo.post('/ngo/import/campaigns?format=csv', content_type='text/csv', data=(
+        'title,description,category,location,date,volunteers_needed\n'
+        'Imported drive,Checking imports,cleanup,Pune,2030-02-01,5\n'))
+    ngo.post('/ngo/import/volunteers?format=jsonl', content_type='application/x-ndjson', data=(
+        f'{{"campaign_id": {ngo_campaign}, "email": "user{user_id}@example.com"}}\n'
+        f'{{"campaign_id": {ngo_campaign}, "user_id": {user_id + 1}}}\n'))
+
+def run_jobs(app, greenspark):
+    """Run the background and CLI jobs, ending a year ahead so every campaign finishes
+
+    The lifecycle run uses small chunks, as it would day to day.
+    """
+    later = (datetime.utcnow() + timedelta(days=365)).strftime('%Y-%m-%d')
+    with app.app_context():
+        with greenspark.write_transaction() as cursor:
+            greenspark.advance_campaigns(cursor)
+            greenspark.rebuild_recommendations(cursor)
+            greenspark.advance_campaigns(cursor, today=later, chunk_size=20)
+            greenspark.prune_campaign_events(cursor)
+        cutoff = (datetime.utcnow() - timedelta(days=greenspark.ACTIVITY_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        greenspark.archive_activities(cutoff, chunk_size=1000)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not just failures')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='greenspark-plans-')
+    path = os.path.join(workdir, 'plans.db')
+    # Short feed pages, so the check pages through the archive as well
+    os.environ.setdefault('ACTIVITY_PAGE_SIZE', '5')
+    try:
+        import seed
+        import app as greenspark
+        seed.seed_database(path)
+
+        # Record the SQL of every connection the routes open
+        statements = {}
+        connect_db = greenspark.connect_db
+        def traced_connect_db(*args, **kwargs):
+            conn = connect_db(*args, **kwargs)
+            conn.set_trace_callback(lambda sql: statements.setdefault(normalize(sql), sql))
+            return conn
+        greenspark.connect_db = traced_connect_db
+        # The trace inlines bound values, and the planner treats a literal
+        # differently from a parameter, so keep what each statement was bound to
+        bound = {}
+        execute, executemany = greenspark.InstrumentedCursor.execute, greenspark.InstrumentedCursor.executemany
+        def traced_execute(self, sql, parameters=()):
+            bound.setdefault(normalize(sql), (sql, parameters))
+            return execute(self, sql, parameters)
+        def traced_executemany(self, sql, seq_of_parameters):
+            seq_of_parameters = list(seq_of_parameters)
+            if seq_of_parameters:
+                bound.setdefault(normalize(sql), (sql, seq_of_parameters[0]))
+            return executemany(self, sql, seq_of_parameters)
+        greenspark.InstrumentedCursor.execute = traced_execute
+        greenspark.InstrumentedCursor.executemany = traced_executemany
+        app = greenspark.create_app({'DATABASE': path, 'TESTING': True})
+        try:
+            exercise_routes(app, path)
+            run_jobs(app, greenspark)
+        finally:
+            greenspark.connect_db = connect_db
+            greenspark.InstrumentedCursor.execute = execute
+            greenspark.InstrumentedCursor.executemany = executemany
+            greenspark.close_db_pool(app)
+
+        conn = sqlite3.connect(path)
+        failures = []
+        for normalized, sql in sorted(statements.items()):
+            if normalized.upper().startswith(SKIPPED_PREFIXES):
+                continue
+            if any(normalized.startswith(prefix) for prefix in ALLOWED_SCANS):
+                continue
+            problems = scan_problems(conn, *bound.get(normalized, (sql,)))
+            if problems:
+                failures.append((normalized, problems))
+            elif args.verbose:
+                print(f'ok    {normalized}')
+        conn.close()
+
+        for normalized, problems in failures:
+            print(f'SCAN  {normalized}')
+            for detail in problems:
+                print(f'        {detail}')
+        print(f'{len(statements)} statements checked, {len(failures)} with full scans')
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
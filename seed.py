@@ -0,0 +1,240 @@
+"""Synthetic data generator for GreenSpark databases
+
+Fills a database with users, NGOs, campaigns, volunteers, completions,
+activities and badges so query plans and performance can be checked at a
+realistic size. Campaign popularity follows a Zipf-like curve, so a few
+campaigns attract most of the volunteers, as in production.
+
+    python seed.py bench.db --users 200000 --campaigns 20000 \
+        --volunteers 500000 --activities 2000000
+
+Every seeded user signs in as user<N>@example.com and every NGO as
+ngo<N>@example.com, all with the password "password".
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+CATEGORIES = ['cleanup', 'tree-planting', 'awareness', 'recycling', 'conservation', 'water']
+CITIES = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Pune', 'Hyderabad', 'Ahmedabad',
+          'Jaipur', 'Lucknow', 'Kochi', 'Goa']
+# City centres; seeded campaigns and users are scattered within ~20 km of them
+CITY_COORDINATES = {
+    'Mumbai': (19.0760, 72.8777), 'Delhi': (28.7041, 77.1025), 'Bangalore': (12.9716, 77.5946),
+    'Chennai': (13.0827, 80.2707), 'Kolkata': (22.5726, 88.3639), 'Pune': (18.5204, 73.8567),
+    'Hyderabad': (17.3850, 78.4867), 'Ahmedabad': (23.0225, 72.5714), 'Jaipur': (26.9124, 75.7873),
+    'Lucknow': (26.8467, 80.9462), 'Kochi': (9.9312, 76.2673), 'Goa': (15.2993, 74.1240),
+}
+WORDS = ['beach', 'river', 'forest', 'park', 'lake', 'plastic', 'compost', 'tree', 'mangrove',
+         'wildlife', 'solar', 'garden', 'street', 'school', 'market', 'drive', 'cleanup', 'planting',
+         'awareness', 'workshop', 'recycling', 'community', 'green', 'water', 'coastal', 'urban']
+PASSWORD = 'password'
+
+DEFAULT_SIZES = {
+    'users': 2000,
+    'ngos': 50,
+    'campaigns': 500,
+    'volunteers': 10000,
+    'activities': 30000,
+}
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def _timestamp(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+def _zipf_weights(rng, count, skew=1.1):
+    """Cumulative Zipf weights in shuffled order, for rng.choices(cum_weights=...)"""
+    weights = [1 / (rank + 1) ** skew for rank in range(count)]
+    rng.shuffle(weights)
+    total = 0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+def _near(rng, city):
+    lat, lng = CITY_COORDINATES[city]
+    return round(lat + rng.uniform(-0.2, 0.2), 6), round(lng + rng.uniform(-0.2, 0.2), 6)
+
+def seed_database(path, users=2000, ngos=50, campaigns=500, volunteers=10000, activities=30000,
+                  seed=42, now=None, verbose=False):
+    """Create the schema at path and fill it with synthetic data"""
+    import app as greenspark
+
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+
+    def log(message):
+        if verbose:
+            print(f'[{time.perf_counter() - started:7.1f}s] {message}')
+
+    # Build the schema through the app's migrations so it matches production
+    app = greenspark.create_app({'DATABASE': path})
+    with app.app_context():
+        greenspark.init_db()
+    greenspark.close_db_pool(app)
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA foreign_keys = OFF')
+    cursor = conn.cursor()
+
+    # Start from an empty database; the migrations add sample campaigns
+    cursor.execute('DELETE FROM campaigns')
+
+    # One hash for everybody; hashing per row would dominate seeding time
+    password_hash = generate_password_hash(PASSWORD, greenspark.PASSWORD_HASH_METHOD)
+
+    log(f'users: {users}')
+    user_rows = []
+    for i in range(1, users + 1):
+        city = rng.choice(CITIES)
+        user_rows.append((i, f'User {i}', f'user{i}@example.com', f'98{i:08d}', city, password_hash,
+                          _timestamp(now - timedelta(days=rng.randint(0, 730)))) + _near(rng, city))
+    cursor.executemany('''
+        INSERT INTO users (id, name, email, phone, location, password, eco_points, created_at, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+    ''', user_rows)
+
+    log(f'ngos: {ngos}')
+    cursor.executemany('''
+        INSERT INTO ngos (id, name, email, password, description, contact, address, owner_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', ((i, f'NGO {i}', f'ngo{i}@example.com', password_hash, _text(rng, 12), f'contact{i}@example.com',
+           rng.choice(CITIES), i if i <= users else None)
+          for i in range(1, ngos + 1)))
+
+    log(f'campaigns: {campaigns}')
+    campaign_dates = {}
+    campaign_rows = []
+    for i in range(1, campaigns + 1):
+        date = now + timedelta(days=rng.randint(-180, 180))
+        campaign_dates[i] = date
+        title = f'{_text(rng, 3).title()} {i}'
+        city = rng.choice(CITIES)
+        campaign_rows.append((
+            i, title, _text(rng, 40), _text(rng, 10), rng.choice(CATEGORIES), city,
+            date.strftime('%Y-%m-%d'), f'{rng.randint(6, 18):02d}:00', 0,
+            'completed' if date < now else 'upcoming', 1 if rng.random() < 0.05 else 0,
+            rng.randint(1, ngos) if ngos else None,
+            json.dumps(['Bring water bottle', 'Wear comfortable shoes']),
+            _timestamp(date - timedelta(days=rng.randint(7, 60)))) + _near(rng, city))
+    cursor.executemany('''
+        INSERT INTO campaigns (id, title, description, short_description, category, location, date, time,
+                               volunteers_needed, status, featured, ngo_id, requirements, created_at,
+                               latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', campaign_rows)
+
+    # Volunteers pick campaigns with skewed popularity
+    log(f'campaign_volunteers: {volunteers}')
+    cum_weights = _zipf_weights(rng, campaigns)
+    campaign_ids = list(range(1, campaigns + 1))
+    pairs = set()
+    attempts = 0
+    while len(pairs) < volunteers and attempts < volunteers * 3:
+        batch = rng.choices(campaign_ids, cum_weights=cum_weights, k=volunteers - len(pairs))
+        pairs.update((campaign_id, rng.randint(1, users)) for campaign_id in batch)
+        attempts += len(batch)
+
+    volunteer_rows = []
+    completion_rows = []
+    events = []
+    joined_counts = {}
+    for campaign_id, user_id in pairs:
+        campaign_date = campaign_dates[campaign_id]
+        joined_at = campaign_date - timedelta(days=rng.randint(1, 30), minutes=rng.randint(0, 1440))
+        joined_counts[campaign_id] = joined_counts.get(campaign_id, 0) + 1
+        status = 'joined'
+        events.append((user_id, campaign_id, 'campaign_joined', 'Joined campaign', 10, joined_at))
+        if campaign_date < now and rng.random() < 0.6:
+            completed_at = campaign_date + timedelta(hours=rng.randint(2, 48))
+            verified = rng.random() < 0.7
+            status = 'verified' if verified else 'completed'
+            completion_rows.append((campaign_id, user_id, _timestamp(completed_at), int(verified),
+                                    rng.randint(1, ngos) if verified and ngos else None))
+            events.append((user_id, campaign_id, 'campaign_completed', f'Completed campaign: {campaign_id}', 20,
+                           completed_at))
+            if verified:
+                events.append((user_id, campaign_id, 'campaign_verified', 'Campaign verified by NGO', 10,
+                               completed_at + timedelta(days=rng.randint(0, 5))))
+        volunteer_rows.append((campaign_id, user_id, status, _timestamp(joined_at)))
+
+    cursor.executemany('''
+        INSERT INTO campaign_volunteers (campaign_id, user_id, status, joined_at) VALUES (?, ?, ?, ?)
+    ''', volunteer_rows)
+    log(f'campaign_completions: {len(completion_rows)}')
+    cursor.executemany('''
+        INSERT INTO campaign_completions (campaign_id, user_id, completed_at, verified_by_ngo, verified_by)
+        VALUES (?, ?, ?, ?, ?)
+    ''', completion_rows)
+
+    # Seats: joined count plus some headroom; a few campaigns are left full
+    cursor.executemany('''
+        UPDATE campaigns SET volunteers_joined = ?, volunteers_needed = ? WHERE id = ?
+    ''', ((joined_counts.get(i, 0),
+           joined_counts.get(i, 0) + (0 if rng.random() < 0.05 else rng.randint(5, 100)), i)
+          for i in campaign_ids))
+
+    # Pad the activity log up to the requested size with extra join events
+    while len(events) < activities:
+        user_id = rng.randint(1, users)
+        campaign_id = rng.choices(campaign_ids, cum_weights=cum_weights)[0]
+        events.append((user_id, campaign_id, 'campaign_joined', 'Joined campaign', 10,
+                       now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))))
+    log(f'activities: {len(events)}')
+    events.sort(key=lambda event: event[5])
+    cursor.executemany('''
+        INSERT INTO activities (user_id, campaign_id, activity_type, description, points_earned, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((u, c, t, d, p, _timestamp(at)) for u, c, t, d, p, at in events))
+
+    # Points always add up to the activity log
+    cursor.execute('''
+        UPDATE users SET eco_points = COALESCE(
+            (SELECT SUM(points_earned) FROM activities a WHERE a.user_id = users.id), 0)
+    ''')
+    conn.commit()
+    conn.close()
+
+    log('badges, leaderboard and recommendations')
+    with app.app_context():
+        with greenspark.write_transaction() as cursor:
+            greenspark.award_badges(cursor, range(1, users + 1))
+            greenspark.rebuild_leaderboard(cursor)
+            greenspark.rebuild_recommendations(cursor)
+        greenspark.get_db().execute('ANALYZE')
+    greenspark.close_db_pool(app)
+    log('done')
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a GreenSpark database with synthetic data')
+    parser.add_argument('database', help='path of the SQLite database to create')
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    parser.add_argument('--force', action='store_true', help='replace an existing database')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        if not args.force:
+            parser.error(f'{args.database} already exists (use --force to replace it)')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+
+    seed_database(args.database, seed=args.seed, verbose=True,
+                  **{name: getattr(args, name) for name in DEFAULT_SIZES})
+
+if __name__ == '__main__':
+    main()
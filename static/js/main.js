@@ -282,9 +282,18 @@ function initLoadMore() {
             loadMoreBtn.textContent = 'Loading...';
             
             try {
-                // Fetch more campaigns from backend
-                const response = await fetch('/api/campaigns?offset=' + document.querySelectorAll('.campaign-card').length);
+                // Fetch the next page, keeping the listing's filters
+                const params = new URLSearchParams(window.location.search);
+                params.delete('page');
+                if (loadMoreBtn.dataset.cursor) {
+                    params.set('cursor', loadMoreBtn.dataset.cursor);
+                } else {
+                    // Cards before this page weren't rendered here, so the server says where it left off
+                    params.set('offset', loadMoreBtn.dataset.offset || 0);
+                }
+                const response = await fetch('/api/campaigns?' + params.toString());
                 const data = await response.json();
+                loadMoreBtn.dataset.cursor = data.next_cursor || '';
                 
                 // Add campaigns to page
                 const campaignsGrid = document.querySelector('.campaigns-grid');
@@ -293,6 +302,10 @@ function initLoadMore() {
                     campaignsGrid.appendChild(card);
                 });
                 
+                // The page links no longer match the cards shown
+                const pagination = document.querySelector('.pagination');
+                if (pagination) pagination.style.display = 'none';
+                
                 if (!data.has_more) {
                     loadMoreBtn.style.display = 'none';
                 }
@@ -307,34 +320,58 @@ function initLoadMore() {
     }
 }
 
-// Create campaign card dynamically
+// Create campaign card dynamically, matching the card macro in _campaign_cards.html.
+// Campaign fields are user input, so they only ever go in as text or attribute values
 function createCampaignCard(campaign) {
-    const card = document.createElement('div');
-    card.className = 'campaign-card';
+    const element = (tag, className, text) => {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    };
+    const icon = (name) => element('i', `fas fa-${name}`);
+    
+    const card = element('div', 'campaign-card');
     card.dataset.category = campaign.category;
     card.dataset.location = campaign.location;
     
-    card.innerHTML = `
-        <div class="campaign-image">
-            <img src="${campaign.image || 'static/images/default-campaign.jpg'}" alt="${campaign.title}">
-            ${campaign.featured ? '<div class="campaign-badge">Featured</div>' : ''}
-        </div>
-        <div class="campaign-content">
-            <div class="campaign-meta">
-                <span><i class="fas fa-calendar"></i> ${campaign.date}</span>
-                <span><i class="fas fa-map-marker-alt"></i> ${campaign.location}</span>
-            </div>
-            <h3>${campaign.title}</h3>
-            <p>${campaign.description}</p>
-            <div class="campaign-footer">
-                <div class="campaign-volunteers">
-                    <i class="fas fa-users"></i>
-                    <span>${campaign.volunteers_joined}/${campaign.volunteers_needed} Volunteers</span>
-                </div>
-                <a href="/campaigns/${campaign.id}" class="btn btn-small btn-primary">Join Now</a>
-            </div>
-        </div>
-    `;
+    const image = element('div', 'campaign-image');
+    const img = document.createElement('img');
+    img.setAttribute('src', campaign.image || 'static/images/default-campaign.jpg');
+    img.setAttribute('alt', campaign.title);
+    image.appendChild(img);
+    if (campaign.featured) image.appendChild(element('div', 'campaign-badge', 'Featured'));
+    card.appendChild(image);
+    
+    const content = element('div', 'campaign-content');
+    const status = String(campaign.status || '');
+    content.appendChild(element('div', `campaign-status status-${status}`,
+        status.replace(/\w\S*/g, word => word.charAt(0).toUpperCase() + word.slice(1).toLowerCase())));
+    
+    const meta = element('div', 'campaign-meta');
+    const date = element('span');
+    date.append(icon('calendar'), ` ${campaign.date}`);
+    const place = element('span');
+    place.append(icon('map-marker-alt'), ` ${campaign.location}`);
+    if (campaign.distance_km !== undefined && campaign.distance_km !== null) {
+        place.append(` \u00b7 ${Number(campaign.distance_km).toFixed(1)} km`);
+    }
+    meta.append(date, place);
+    content.appendChild(meta);
+    
+    content.appendChild(element('h3', null, campaign.title));
+    const description = campaign.description || '';
+    content.appendChild(element('p', null, description.slice(0, 150) + (description.length > 150 ? '...' : '')));
+    
+    const footer = element('div', 'campaign-footer');
+    const volunteers = element('div', 'campaign-volunteers');
+    volunteers.append(icon('users'),
+        element('span', null, `${campaign.volunteers_joined}/${campaign.volunteers_needed} Volunteers`));
+    const link = element('a', 'btn btn-small btn-primary', 'View Details');
+    link.setAttribute('href', `/campaigns/${encodeURIComponent(campaign.id)}`);
+    footer.append(volunteers, link);
+    content.appendChild(footer);
+    card.appendChild(content);
     
     return card;
 }